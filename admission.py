@@ -0,0 +1,97 @@
+"""
+Admission Control
+-----------------
+Backpressure for new ZD and WR runs. Before a run starts, the backlog of
+its chunk queue (chunks waiting in the scheduler, across every process
+with the Redis queue) and the median duration of recently finished chunks
+give the estimated wait for a free worker::
+
+    wait = queued chunks / workers * median chunk duration
+
+Runs are rejected while that wait exceeds ``ADMISSION_MAX_WAIT`` seconds
+(the API answers 429 with a ``Retry-After`` of the excess). Accepted runs
+get their queue position and estimated completion time stored in the job,
+so the status endpoints show them. The estimate ignores fair sharing,
+which usually starts a new job's first chunks sooner, so it errs late.
+"""
+
+import math
+import os
+import statistics
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Longest estimated wait accepted for a new run; 0 disables admission control
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '900'))
+# Assumed chunk duration until some chunks have finished
+ADMISSION_DEFAULT_CHUNK_SECONDS = float(os.getenv('ADMISSION_DEFAULT_CHUNK_SECONDS', '60'))
+
+_counters = {"accepted": 0, "rejected": 0}
+_counters_lock = threading.Lock()
+
+
+class AdmissionDecision:
+    """Outcome of ``admit`` for one run."""
+
+    def __init__(self, queued: int, workers: int, chunk_seconds: float):
+        self.queued = queued
+        self.workers = max(1, workers)
+        self.chunk_seconds = chunk_seconds
+        self.wait_seconds = queued / self.workers * chunk_seconds
+        self.accepted = ADMISSION_MAX_WAIT <= 0 or self.wait_seconds <= ADMISSION_MAX_WAIT
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds until the backlog should be back under the limit."""
+        return max(1, math.ceil(self.wait_seconds - ADMISSION_MAX_WAIT))
+
+    def eta(self, chunks: int) -> float:
+        """Estimated seconds until a run of ``chunks`` chunks has finished."""
+        return math.ceil((self.queued + chunks) / self.workers) * self.chunk_seconds
+
+    def job_fields(self, chunks: Optional[int] = None) -> Dict[str, Any]:
+        """Fields to store in the job (the completion estimate once ``chunks`` is known)."""
+        now = time.time()
+        fields: Dict[str, Any] = {
+            "queue_position": self.queued + 1,
+            "queue_wait_estimate": round(self.wait_seconds),
+            "admitted_at": now,
+        }
+        if chunks is not None:
+            fields["estimated_completion"] = now + self.eta(chunks)
+        return fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "queued_chunks": self.queued,
+            "workers": self.workers,
+            "chunk_seconds": round(self.chunk_seconds, 1),
+            "wait_seconds": round(self.wait_seconds),
+            "max_wait_seconds": ADMISSION_MAX_WAIT,
+        }
+
+
+def admit(chunk_queue) -> AdmissionDecision:
+    """Decide whether a new run may start on ``chunk_queue``."""
+    try:
+        backlog = chunk_queue.backlog()
+    except Exception as e:
+        # Never block runs because the estimate failed
+        print(f"[WARNING] Failed to read chunk backlog, admitting run: {e}")
+        backlog = {"queued": 0, "workers": 1, "durations": []}
+
+    durations = backlog["durations"]
+    chunk_seconds = statistics.median(durations) if durations else ADMISSION_DEFAULT_CHUNK_SECONDS
+    decision = AdmissionDecision(backlog["queued"], backlog["workers"], chunk_seconds)
+    with _counters_lock:
+        _counters["accepted" if decision.accepted else "rejected"] += 1
+    if not decision.accepted:
+        print(f"[WARNING] Rejecting run: estimated wait {decision.wait_seconds:.0f}s "
+              f"for {decision.queued} queued chunks exceeds {ADMISSION_MAX_WAIT:.0f}s")
+    return decision
+
+
+def admission_stats() -> Dict[str, Any]:
+    with _counters_lock:
+        return dict(_counters, max_wait_seconds=ADMISSION_MAX_WAIT)
@@ -1,14 +1,16 @@
+import asyncio
 import os
+import shutil
 import tempfile
 import time
 import uuid
-import threading
 import io
 import csv
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, send_file
 from werkzeug.utils import secure_filename
 import google.generativeai as genai
 from openai import OpenAI
+from llm_engine import llm_engine
 import signal
 from dotenv import load_dotenv
 import json
@@ -50,27 +52,55 @@ openai_client = OpenAI(
     max_retries=2   # Built-in retry mechanism
 )
 
+# ZD chunk analysis streams on the async LLM engine, with the same settings
+llm_engine.register_client(
+    "openai",
+    api_key=os.getenv('OPENAI_API_KEY'),
+    base_url=os.getenv('OPENAI_BASE_URL', 'https://chat01.ai'),
+    timeout=300.0,
+    max_retries=2
+)
+
 # Configure Deepseek API (if available)
 # Deepseek API is OpenAI-compatible, base_url should be https://api.deepseek.com/v1
-deepseek_client = None
 if os.getenv('DEEPSEEK_API_KEY'):
-    deepseek_client = OpenAI(
+    llm_engine.register_client(
+        "deepseek",
         api_key=os.getenv('DEEPSEEK_API_KEY'),
         base_url=os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com/v1'),
         timeout=300.0,
         max_retries=2
     )
 
-# Store transcription status in memory (in production, use Redis or database)
-transcription_status = {}
-# Store summary status in memory
-summary_status = {}
 # Import persistent storage
 from job_storage import job_storage, thread_pool
+from memory_store import BoundedTTLStore, all_store_stats, purge_all_stores
 
-# Legacy in-memory storage (kept for backward compatibility during transition)
-zd_jobs = {}
-zd_results = {}
+# Store transcription status in memory (in production, use Redis or database)
+transcription_status = BoundedTTLStore("transcription_status", ttl=job_storage.JOB_TTL)
+# Store summary status in memory
+summary_status = BoundedTTLStore("summary_status", ttl=job_storage.JOB_TTL)
+from stream_buffer import StreamingBuffer
+from job_events import event_stream
+from chunk_leases import LEASE_MAX_RECOVERIES, LeaseLostError
+from job_cancellation import JobCancelledError
+from concurrency_limiter import all_limiter_stats, llm_limiter, retry_after_seconds
+from rate_limiter import estimate_tokens, rate_limiter
+from llm_cache import cache_key, llm_cache
+from deck_diff import plan_rerun
+from table_stream import IncrementalTableParser, parse_table
+from executors import ExecutorFullError, all_executor_stats, get_executor
+from timer_scheduler import timers
+from admission import admission_stats, admit
+from wr.storage import storage as wr_storage, thread_pool as wr_thread_pool
+
+# Legacy in-memory storage (kept for backward compatibility during transition),
+# bounded by the job TTL and the in-memory store budget
+zd_jobs = BoundedTTLStore("zd_jobs_mirror", ttl=job_storage.JOB_TTL)
+zd_results = BoundedTTLStore("zd_results_mirror", ttl=job_storage.JOB_TTL)
+
+# Seconds between sweeps of expired jobs and in-memory entries
+JOB_SWEEP_INTERVAL = float(os.getenv('JOB_SWEEP_INTERVAL', '300'))
 
 # Status constants
 STATUS_FILE_READING = 'file_reading'
@@ -97,6 +127,7 @@ ZD_STATUS_THINKING = 'thinking'
 ZD_STATUS_MERGING = 'merging'
 ZD_STATUS_DONE = 'done'
 ZD_STATUS_ERROR = 'error'
+ZD_STATUS_CANCELLED = 'cancelled'
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -235,26 +266,8 @@ def process_transcription_async(task_id, temp_file_path, custom_prompt, file_siz
         default_prompt = "You are a professional consultant, just had an interview with your client, please transcribe with timestamp"
         prompt = custom_prompt if custom_prompt.strip() else default_prompt
 
-        # Generate transcription with periodic status updates
-        def update_transcribing_status():
-            while transcription_status[task_id]['status'] == STATUS_TRANSCRIBING:
-                current_time = time.time()
-                total_elapsed = current_time - transcription_status[task_id]['start_time']
-                minutes = int(total_elapsed // 60)
-                seconds = int(total_elapsed % 60)
-
-                transcription_status[task_id].update({
-                    'message': f'正在生成转写文本... 已耗时: {minutes:02d}:{seconds:02d}',
-                    'last_update': current_time
-                })
-                time.sleep(2)  # Update every 2 seconds
-
-        # Start timer thread for transcribing phase
-        timer_thread = threading.Thread(target=update_transcribing_status)
-        timer_thread.daemon = True
-        timer_thread.start()
-
-        # Generate transcription
+        # Generate transcription (the elapsed time in the message is
+        # refreshed when the status is read)
         response = model.generate_content([audio_file, prompt])
 
         # Update status - completed
@@ -350,12 +363,20 @@ def transcribe_audio():
             })
 
             # Start async processing
-            thread = threading.Thread(
-                target=process_transcription_async,
-                args=(task_id, temp_file_path, custom_prompt, file_size, file.filename, selected_model)
-            )
-            thread.daemon = True
-            thread.start()
+            try:
+                get_executor("transcription").submit(
+                    process_transcription_async,
+                    task_id, temp_file_path, custom_prompt, file_size, file.filename, selected_model
+                )
+            except ExecutorFullError:
+                os.unlink(temp_file_path)
+                transcription_status[task_id].update({
+                    'status': STATUS_FAILED,
+                    'progress': 0,
+                    'message': '服务器繁忙，请稍后重试',
+                    'last_update': time.time()
+                })
+                return jsonify({'error': 'Too many transcriptions in progress, please try again later'}), 503
 
             # Return immediately with task ID
             return jsonify({
@@ -388,6 +409,9 @@ def get_transcription_status(task_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     status = transcription_status.get(task_id, {'status': 'not_found'})
+    if status['status'] == STATUS_TRANSCRIBING:
+        total_elapsed = time.time() - status['start_time']
+        status = dict(status, message=f'正在生成转写文本... 已耗时: {int(total_elapsed // 60):02d}:{int(total_elapsed % 60):02d}')
     return jsonify(status)
 
 @app.route('/api/edit/<task_id>', methods=['POST'])
@@ -440,30 +464,54 @@ def process_summary_async(summary_id, transcript_text, custom_prompt, model_name
         # Prepare prompt - automatically append transcript to user's prompt
         full_prompt = custom_prompt.strip() + "\n\n<Here goes transcript>\n" + transcript_text
 
-        # Generate summary with streaming
-        response = openai_client.chat.completions.create(
-            model=model_name,
-            messages=[{
-                "role": "user",
-                "content": full_prompt
-            }],
-            stream=True
-        )
+        # The same transcript and prompt were summarized before
+        cache_id = cache_key("openai", model_name, "", full_prompt)
+        cached = llm_cache.get(cache_id)
+        if cached is not None:
+            total_time = time.time() - summary_status[summary_id]['start_time']
+            summary_status[summary_id].update({
+                'status': SUMMARY_STATUS_COMPLETED,
+                'message': f'摘要生成完成！耗时: {int(total_time//60):02d}:{int(total_time%60):02d}',
+                'partial_summary': cached["text"],
+                'summary': cached["text"],
+                'total_time': total_time,
+                'cache_hit': True,
+                'last_update': time.time()
+            })
+            return
 
-        # Collect streaming response
-        full_response = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                content = chunk.choices[0].delta.content
-                full_response += content
-
-                # Update status with streaming content
-                summary_status[summary_id].update({
-                    'status': SUMMARY_STATUS_PROCESSING,
-                    'message': '正在生成摘要...',
-                    'partial_summary': full_response,
-                    'last_update': time.time()
-                })
+        # Generate summary with streaming
+        estimated_tokens = rate_limiter.estimate(full_prompt)
+        rate_limiter.acquire("openai", estimated_tokens)
+        with llm_limiter("openai", model_name).slot() as slot:
+            response = openai_client.chat.completions.create(
+                model=model_name,
+                messages=[{
+                    "role": "user",
+                    "content": full_prompt
+                }],
+                stream=True
+            )
+            slot.started()
+
+            # Collect streaming response
+            full_response = ""
+            for chunk in response:
+                if chunk.choices[0].delta.content is not None:
+                    content = chunk.choices[0].delta.content
+                    full_response += content
+
+                    # Update status with streaming content
+                    summary_status[summary_id].update({
+                        'status': SUMMARY_STATUS_PROCESSING,
+                        'message': '正在生成摘要...',
+                        'partial_summary': full_response,
+                        'last_update': time.time()
+                    })
+
+        rate_limiter.settle("openai", estimated_tokens, estimate_tokens(full_prompt + full_response))
+        if full_response.strip():
+            llm_cache.put(cache_id, {"text": full_response})
 
         # Update status - completed
         total_time = time.time() - summary_status[summary_id]['start_time']
@@ -533,12 +581,13 @@ def generate_summary():
         }
 
         # Start async processing
-        thread = threading.Thread(
-            target=process_summary_async,
-            args=(summary_id, transcript_text, custom_prompt, model_name)
-        )
-        thread.daemon = True
-        thread.start()
+        try:
+            get_executor("summary").submit(
+                process_summary_async, summary_id, transcript_text, custom_prompt, model_name
+            )
+        except ExecutorFullError:
+            summary_status.pop(summary_id, None)
+            return jsonify({'error': 'Too many summaries in progress, please try again later'}), 503
 
         return jsonify({
             'success': True,
@@ -585,85 +634,131 @@ def stream_summary(summary_id):
     return Response(generate(), mimetype='text/plain')
 
 # Helper functions for dual storage (persistent + in-memory)
-def update_job_status(job_id: str, updates: dict):
+#
+# Each helper takes an optional storage batch (``job_storage.batch()``) so a
+# chunk state transition can be sent to Redis in a single round-trip.
+def update_job_status(job_id: str, updates: dict, batch=None):
     """Update job status in both persistent and in-memory storage."""
     # Update persistent storage
-    job_storage.update_job(job_id, updates)
+    (batch or job_storage).update_job(job_id, updates)
 
     # Update in-memory for backward compatibility
-    if job_id in zd_jobs:
-        zd_jobs[job_id].update(updates)
+    zd_jobs.update_fields(job_id, updates)
 
-def update_chunk_result(job_id: str, chunk_id: str, chunk_data: dict):
+def update_chunk_result(job_id: str, chunk_id: str, chunk_data: dict, batch=None):
     """Update chunk result in both persistent and in-memory storage."""
     # Update persistent storage
-    job_storage.set_chunk_result(job_id, chunk_id, chunk_data)
+    (batch or job_storage).set_chunk_result(job_id, chunk_id, chunk_data)
 
     # Update in-memory for backward compatibility
-    if job_id not in zd_results:
-        zd_results[job_id] = {}
-    zd_results[job_id][chunk_id] = chunk_data.copy()
+    zd_results.update_fields(job_id, {chunk_id: chunk_data.copy()}, create=True)
+
+def incr_job_counter(job_id: str, field: str, amount: int = 1, batch=None):
+    """Atomically adjust a job counter in persistent storage and mirror it in memory.
+
+    Inside a batch the result is a BatchResult whose value is set on exit.
+    """
+    def mirror(value):
+        if value is not None:
+            zd_jobs.update_fields(job_id, {field: value})
+
+    if batch is not None:
+        result = batch.incr_job_counter(job_id, field, amount)
+        result.add_done_callback(mirror)
+        return result
+
+    value = job_storage.incr_job_counter(job_id, field, amount)
+    mirror(value)
+    return value
 
 def get_job_data(job_id: str) -> dict:
-    """Get job data from persistent storage with fallback to in-memory."""
-    job = job_storage.get_job(job_id)
-    if not job and job_id in zd_jobs:
-        job = zd_jobs[job_id]
-    return job or {}
+    """Get job data through the version-checked storage cache."""
+    return job_storage.cache.get_job(job_id) or {}
 
 def get_chunk_data(job_id: str, chunk_id: str) -> dict:
-    """Get chunk data from persistent storage with fallback to in-memory."""
-    chunk = job_storage.get_chunk_result(job_id, chunk_id)
-    if not chunk and job_id in zd_results and chunk_id in zd_results[job_id]:
-        chunk = zd_results[job_id][chunk_id]
-    return chunk or {}
+    """Get chunk data through the version-checked storage cache."""
+    return job_storage.cache.get_chunk_result(job_id, chunk_id) or {}
 
 # ZD Tool API endpoints
 
 def process_zd_chunk_async(job_id, chunk, model_name, language="english", max_concurrency=5):
-    """Process a single chunk with AI analysis."""
+    """Start the AI analysis of a chunk on the LLM engine while holding its lease.
+
+    Returns the engine's future (None if the chunk is skipped); the chunk
+    queue keeps the chunk in flight until it resolves.
+    """
     chunk_id = chunk["chunk_id"]
 
+    if job_storage.cancellations.is_cancelled(job_id):
+        print(f"[INFO] Skipping chunk {chunk_id} of cancelled job {job_id}")
+        return
+
+    lease = job_storage.leases.acquire(job_id, chunk_id)
+    if lease is None:
+        print(f"[WARNING] Chunk {chunk_id} of job {job_id} is already being processed, skipping")
+        return
+
     try:
-        # Initialize chunk status with detailed tracking using helper function
-        chunk_data = {
-            "chunk_id": chunk_id,
-            "status": "starting",
-            "page_start": chunk["page_start"],
-            "page_end": chunk["page_end"],
-            "page_numbers": chunk["page_numbers"],
-            "word_count": chunk["word_count"],
-            "start_time": time.time(),
-            "streaming_output": "",
-            "ai_progress": "Initializing...",
-            "result_text": "",
-            "error": None
-        }
+        return llm_engine.submit(run_zd_chunk, job_id, chunk, model_name, language, lease)
+    except BaseException:
+        lease.release()
+        raise
 
-        # Store chunk data in persistent storage
-        update_chunk_result(job_id, chunk_id, chunk_data)
+async def run_zd_chunk(job_id, chunk, model_name, language, lease):
+    try:
+        await analyze_zd_chunk(job_id, chunk, model_name, language, lease)
+    finally:
+        await llm_engine.offload(lease.release)
 
-        # Update job status
-        job_data = get_job_data(job_id)
-        if not job_data:
-            return
+def start_zd_chunk(job_id, chunk, language):
+    """Record the chunk as started and build its prompt.
 
+    Returns (chunk_data, system_prompt, user_message), or None if the job is gone.
+    """
+    chunk_id = chunk["chunk_id"]
+
+    # Initialize chunk status with detailed tracking using helper function
+    chunk_data = {
+        "chunk_id": chunk_id,
+        "status": "starting",
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "page_numbers": chunk["page_numbers"],
+        "word_count": chunk["word_count"],
+        "start_time": time.time(),
+        "streaming_length": 0,
+        "stream_start_time": time.time(),
+        "ai_progress": "Initializing...",
+        "result_text": "",
+        "partial_rows": [],
+        "error": None,
+        "lease_recoveries": chunk.get("lease_recoveries", 0)
+    }
+
+    # Store chunk data starting from an empty stream and update the job
+    # status in one round-trip
+    with job_storage.batch() as batch:
+        batch.reset_stream_output(job_id, chunk_id)
+        update_chunk_result(job_id, chunk_id, chunk_data, batch)
+        chunks_sent = incr_job_counter(job_id, "chunks_sent", batch=batch)
         update_job_status(job_id, {
-            "chunks_sent": job_data.get("chunks_sent", 0) + 1,
             "status": ZD_STATUS_THINKING,
             "last_update": time.time()
-        })
+        }, batch)
 
-        # Update chunk status to sending
-        chunk_data.update({
-            "status": "sending",
-            "ai_progress": "Sending request to AI..."
-        })
-        update_chunk_result(job_id, chunk_id, chunk_data)
+    if chunks_sent.value is None:
+        return None
 
-        # Prepare the prompt based on language
-        if language == "chinese":
-            system_prompt = """你是麦肯锡的咨询顾问，我需要你帮我检查错别字，我已经把PPT的输出转化为你方便读取的JSON。
+    # Update chunk status to sending
+    chunk_data.update({
+        "status": "sending",
+        "ai_progress": "Sending request to AI..."
+    })
+    update_chunk_result(job_id, chunk_id, chunk_data)
+
+    # Prepare the prompt based on language
+    if language == "chinese":
+        system_prompt = """你是麦肯锡的咨询顾问，我需要你帮我检查错别字，我已经把PPT的输出转化为你方便读取的JSON。
 
 接下来你会读取到PPT的具体内容，包括：
 • page_number - 页码
@@ -702,8 +797,8 @@ def process_zd_chunk_async(job_id, chunk, model_name, language="english", max_co
 | 2           | —      | 缺少主语 | ↔ p 1 与第1页矛盾 |
 
 不要添加解释、代码块或其他额外文本。只返回Markdown表格。"""
-        else:
-            system_prompt = """You are a professional consultant performing a Zero-Defect (ZD) and logic review of an English-language PowerPoint deck that has been exported for you as easy-to-read JSON.
+    else:
+        system_prompt = """You are a professional consultant performing a Zero-Defect (ZD) and logic review of an English-language PowerPoint deck that has been exported for you as easy-to-read JSON.
 
 For every slide you will receive:
 • page_number
@@ -743,243 +838,405 @@ Example format:
 
 DO NOT add explanations, code fences, or additional text. Return ONLY the markdown table."""
 
-        # Prepare user message with slides data
-        user_message = "Please analyze the following slides:\n\n"
-        slides_json = json.dumps(chunk["slides"], indent=2, ensure_ascii=False)
-        user_message += slides_json
+    # Prepare user message with slides data
+    user_message = "Please analyze the following slides:\n\n"
+    slides_json = json.dumps(chunk["slides"], indent=2, ensure_ascii=False)
+    user_message += slides_json
+
+    # Update chunk status to processing
+    chunk_data.update({
+        "status": "processing",
+        "ai_progress": "AI is analyzing content..."
+    })
+    update_chunk_result(job_id, chunk_id, chunk_data)
+
+
+    return chunk_data, system_prompt, user_message
 
-        # Update chunk status to processing
-        zd_results[job_id][chunk_id]["status"] = "processing"
-        zd_results[job_id][chunk_id]["ai_progress"] = "AI is analyzing content..."
+async def analyze_zd_chunk(job_id, chunk, model_name, language, lease):
+    """Run the AI analysis of one chunk on the LLM engine's loop.
+
+    Storage reads and writes go through ``llm_engine.offload``; ``lease`` is
+    kept alive by the lease manager's heartbeat thread.
+    """
+    chunk_id = chunk["chunk_id"]
+    chunk_data = {}
+
+    try:
+        started = await llm_engine.offload(start_zd_chunk, job_id, chunk, language)
+        if started is None:
+            return
+        chunk_data, system_prompt, user_message = started
 
         # Select the appropriate API client based on model
         if model_name in ['deepseek-chat', 'deepseek-reasoner']:
-            if not deepseek_client:
+            if not llm_engine.has_client("deepseek"):
                 raise ValueError("Deepseek API key not configured. Please set DEEPSEEK_API_KEY in .env file")
-            api_client = deepseek_client
+            provider = "deepseek"
         else:
-            api_client = openai_client
+            provider = "openai"
+        api_client = llm_engine.client(provider)
+        limiter = llm_limiter(provider, model_name)
+        estimated_tokens = rate_limiter.estimate(system_prompt + user_message)
+        chunk_data["limiter_wait"] = 0.0
+
+        # Identical prompts get identical answers; rechecks ask for a fresh one
+        cache_id = cache_key(provider, model_name, system_prompt, user_message, temperature=0, top_p=1)
+        if chunk.get("bypass_cache"):
+            llm_cache.bypass()
+        else:
+            cached = await llm_engine.offload(llm_cache.get, cache_id)
+            if cached is not None:
+                chunk_data["cache_hit"] = True
+                await llm_engine.offload(replay_zd_chunk, job_id, chunk, chunk_data, cached["text"])
+                return
 
         # Call API with streaming and robust error handling
         result_text = ""
+        reasoning_text = ""  # For deepseek-reasoner model
+
+        def flush_streaming_output(text, fields):
+            # Only new text is appended; the chunk record itself stays small.
+            # This worker is the only writer of the stream, so its length is
+            # tracked locally and everything goes out in one batch.
+            chunk_data.update(fields)
+            with job_storage.batch() as batch:
+                if text:
+                    batch.append_stream_output(job_id, chunk_id, text)
+                    chunk_data["streaming_length"] += len(text.encode('utf-8'))
+                update_chunk_result(job_id, chunk_id, chunk_data, batch)
+
+                # Update job timestamp as well
+                update_job_status(job_id, {"last_update": chunk_data.get("last_update", time.time())}, batch)
+
+        # The buffer only collects its flushes; they are written off the loop
+        pending_flushes = []
+        stream_buffer = StreamingBuffer(lambda text, fields: pending_flushes.append((text, fields)))
+
+        async def write_flushes():
+            while pending_flushes:
+                await llm_engine.offload(flush_streaming_output, *pending_flushes.pop(0))
+
+        async def cancel_requested():
+            cancelled = job_storage.cancellations.cached(job_id)
+            if cancelled is None:
+                cancelled = await llm_engine.offload(job_storage.cancellations.refresh, job_id)
+            return cancelled
 
         max_retries = 3
         retry_count = 0
 
         while retry_count < max_retries:
+            if await cancel_requested():
+                raise JobCancelledError(f"Job {job_id} was cancelled")
             try:
-                response = api_client.chat.completions.create(
-                    model=model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_message}
-                    ],
-                    temperature=0,
-                    top_p=1,
-                    stream=True,
-                    timeout=300  # 5 minute timeout for the entire request
-                )
-
-                # Collect streaming response with real-time updates and error handling
-                last_update_time = time.time()
-                reasoning_text = ""  # For deepseek-reasoner model
-
-                for chunk_response in response:
-                    try:
-                        # Handle deepseek-reasoner's reasoning_content (thinking process)
-                        if hasattr(chunk_response.choices[0].delta, 'reasoning_content') and \
-                           chunk_response.choices[0].delta.reasoning_content is not None:
-                            reasoning_content = chunk_response.choices[0].delta.reasoning_content
-                            reasoning_text += reasoning_content
-                            last_update_time = time.time()
-
-                            # Show reasoning process in streaming output for debugging
-                            if model_name == 'deepseek-reasoner':
-                                chunk_data.update({
-                                    "streaming_output": f"[Thinking...]\n{reasoning_text}\n\n[Answer:]\n{result_text}",
-                                    "ai_progress": f"AI reasoning... ({len(reasoning_text)} chars thinking)",
-                                    "last_update": last_update_time
-                                })
-                                update_chunk_result(job_id, chunk_id, chunk_data)
-
-                        # Handle regular content (final answer)
-                        elif chunk_response.choices[0].delta.content is not None:
-                            content = chunk_response.choices[0].delta.content
-                            result_text += content
-                            last_update_time = time.time()
-
-                            # Update streaming output in real-time using helper function
-                            display_text = result_text
-                            if reasoning_text and model_name == 'deepseek-reasoner':
+                # Each attempt restarts the stream from scratch
+                result_text = ""
+                reasoning_text = ""
+                table_parser = zd_table_parser()
+
+                # Wait for the deployment's rate limits, then for a concurrency slot
+                waited = await rate_limiter.acquire_async(provider, estimated_tokens)
+                with await limiter.slot_async() as slot:
+                    chunk_data["limiter_wait"] = round(chunk_data["limiter_wait"] + waited + slot.waited, 2)
+                    # A watchdog closes the stream if tokens stop coming (see llm_engine)
+                    response = await llm_engine.open_stream(api_client.chat.completions.create(
+                        model=model_name,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_message}
+                        ],
+                        temperature=0,
+                        top_p=1,
+                        stream=True,
+                        timeout=300  # 5 minute timeout for the entire request
+                    ))
+                    slot.started()
+
+                    # Collect streaming response with buffered real-time updates
+                    last_update_time = time.time()
+
+                    # Closed from the request thread if the job is cancelled
+                    with job_storage.cancellations.track(job_id, llm_engine.closer(response)):
+                        async for chunk_response in response:
+                            # Stop if the lease expired and the chunk was handed to another worker
+                            if lease.lost:
+                                raise LeaseLostError(f"Lease on chunk {chunk_id} was lost")
+                            if await cancel_requested():
+                                raise JobCancelledError(f"Job {job_id} was cancelled")
+
+                            try:
+                                delta = chunk_response.choices[0].delta
+                            except (IndexError, AttributeError):
+                                # Keep-alive and usage-only parts carry no delta
+                                continue
+
+                            # Handle deepseek-reasoner's reasoning_content (thinking process)
+                            if getattr(delta, 'reasoning_content', None) is not None:
+                                marker = "" if reasoning_text else "[Thinking...]\n"
+                                reasoning_text += delta.reasoning_content
+                                last_update_time = time.time()
+
+                                # Show reasoning process in streaming output for debugging
+                                if model_name == 'deepseek-reasoner':
+                                    stream_buffer.append(
+                                        marker + delta.reasoning_content,
+                                        ai_progress=f"AI reasoning... ({len(reasoning_text)} chars thinking)",
+                                        last_update=last_update_time
+                                    )
+
+                            # Handle regular content (final answer)
+                            elif delta.content is not None:
                                 # For reasoner, show both thinking and answer
-                                display_text = f"[Thinking...]\n{reasoning_text}\n\n[Answer:]\n{result_text}"
-
-                            chunk_data.update({
-                                "streaming_output": display_text,
-                                "ai_progress": f"AI generating response... ({len(result_text)} chars)",
-                                "last_update": last_update_time
-                            })
-                            update_chunk_result(job_id, chunk_id, chunk_data)
-
-                            # Update job timestamp as well
-                            update_job_status(job_id, {"last_update": last_update_time})
-
-                        # Check for streaming timeout (no response for 60 seconds)
-                        if time.time() - last_update_time > 60:
-                            print(f"[ERROR] Streaming timeout for chunk {chunk_id}: No response for 60 seconds")
-                            raise TimeoutError("No streaming response received for 60 seconds")
-
-                    except Exception as stream_error:
-                        print(f"[WARNING] Stream processing error for chunk {chunk_id}: {stream_error}")
-                        # Continue processing, but log the error
-                        continue
+                                marker = ""
+                                if reasoning_text and not result_text and model_name == 'deepseek-reasoner':
+                                    marker = "\n\n[Answer:]\n"
+                                result_text += delta.content
+                                last_update_time = time.time()
+
+                                stream_buffer.append(
+                                    marker + delta.content,
+                                    ai_progress=f"AI generating response... ({len(result_text)} chars)",
+                                    last_update=last_update_time
+                                )
+                                # Rows are stored as soon as their line is complete
+                                if table_parser.feed(delta.content):
+                                    stream_buffer.append(partial_rows=list(table_parser.rows))
+                            await write_flushes()
+
+                        # A stream closed by a cancellation may just end early
+                        if await cancel_requested():
+                            raise JobCancelledError(f"Job {job_id} was cancelled")
 
                 # If we reach here, streaming completed successfully
+                table_parser.finish()
+                stream_buffer.flush(partial_rows=list(table_parser.rows))
+                await write_flushes()
+                rate_limiter.settle(provider, estimated_tokens, estimate_tokens(
+                    system_prompt + user_message + reasoning_text + result_text
+                ))
+                if result_text.strip():
+                    await llm_engine.offload(llm_cache.put, cache_id, {"text": result_text})
                 break
 
+            except (LeaseLostError, JobCancelledError):
+                raise
             except Exception as api_error:
+                if await cancel_requested():
+                    # The error came from the stream being closed by the cancellation
+                    raise JobCancelledError(f"Job {job_id} was cancelled") from api_error
                 retry_count += 1
                 print(f"[WARNING] API error for chunk {chunk_id} (attempt {retry_count}/{max_retries}): {str(api_error)}")
 
                 if retry_count >= max_retries:
                     print(f"[ERROR] Max retries exceeded for chunk {chunk_id}")
+                    stream_buffer.flush()
+                    await write_flushes()
                     raise api_error
 
-                # Update progress to show retry
+                # Update progress to show retry; output from the failed attempt is dropped
+                stream_buffer.discard()
+                pending_flushes.clear()
+                retry_notice = f"Error: {str(api_error)}\n\nRetrying...\n\n"
                 chunk_data.update({
                     "ai_progress": f"Retrying... (attempt {retry_count + 1}/{max_retries})",
-                    "streaming_output": f"Error: {str(api_error)}\n\nRetrying...",
+                    "streaming_length": len(retry_notice.encode('utf-8')),
+                    "partial_rows": [],
                     "last_update": time.time()
                 })
-                update_chunk_result(job_id, chunk_id, chunk_data)
+                await llm_engine.offload(reset_zd_chunk_stream, job_id, chunk_id, chunk_data, retry_notice)
 
-                # Wait before retry (exponential backoff)
-                wait_time = min(2 ** retry_count, 30)  # Cap at 30 seconds
-                time.sleep(wait_time)
+                # Wait before retry (exponential backoff); after a Retry-After
+                # the limiter already holds the next attempt until it passes
+                if retry_after_seconds(api_error) is None:
+                    wait_time = min(2 ** retry_count, 30)  # Cap at 30 seconds
+                    await asyncio.sleep(wait_time)
 
-        # Final result
-        result_text = result_text.strip()
+        await llm_engine.offload(complete_zd_chunk, job_id, chunk, chunk_data, result_text)
 
-        zd_results[job_id][chunk_id]["result_text"] = result_text
-        zd_results[job_id][chunk_id]["final_result_text"] = result_text  # Keep a separate copy
-        zd_results[job_id][chunk_id]["ai_progress"] = "Analysis completed"
+    except LeaseLostError as e:
+        # The chunk now belongs to whichever worker re-enqueued it
+        print(f"[WARNING] Abandoning chunk {chunk_id} of job {job_id}: {e}")
 
-        # Update chunk result status
+    except JobCancelledError:
+        print(f"[INFO] Stopped chunk {chunk_id} of cancelled job {job_id}")
         chunk_data.update({
-            "status": "completed",
+            "status": "cancelled",
             "completion_time": time.time(),
-            "ai_progress": f"Completed - processed {chunk['word_count']} words",
-            "result_text": result_text,
-            "final_result_text": result_text
+            "ai_progress": "Cancelled"
         })
-        update_chunk_result(job_id, chunk_id, chunk_data)
-
-        # Update job status
-        job_data = get_job_data(job_id)
-        new_completed = job_data.get("chunks_completed", 0) + 1
-        update_job_status(job_id, {
-            "chunks_completed": new_completed,
-            "last_update": time.time()
-        })
-
-        # Check if all chunks are done - verify both count and actual status
-        chunks_total = job_data.get("chunks_total", 0)
-        if new_completed >= chunks_total:
-            # Double-check by examining actual chunk statuses
-            all_chunks_completed = True
-            if job_id in zd_results:
-                for chunk_id_check, chunk_data_check in zd_results[job_id].items():
-                    if chunk_data_check.get("status") != "completed":
-                        all_chunks_completed = False
-                        break
-
-            if all_chunks_completed:
-                update_job_status(job_id, {"status": ZD_STATUS_MERGING})
-                # Trigger result merging
-                merge_zd_results(job_id)
-        elif job_data.get("status") == ZD_STATUS_DONE:
-            # Job was already done but a chunk was re-checked and completed
-            # Re-merge to incorporate the new results
-            update_job_status(job_id, {"status": ZD_STATUS_MERGING})
-            merge_zd_results(job_id)
+        await llm_engine.offload(update_chunk_result, job_id, chunk_id, chunk_data)
 
     except Exception as e:
-        # Mark chunk as failed
-        if job_id not in zd_results:
-            zd_results[job_id] = {}
-
-        if chunk_id not in zd_results[job_id]:
-            # Initialize if not already done
-            zd_results[job_id][chunk_id] = {
-                "chunk_id": chunk_id,
-                "page_start": chunk["page_start"],
-                "page_end": chunk["page_end"],
-                "page_numbers": chunk["page_numbers"],
-                "word_count": chunk["word_count"],
-                "start_time": time.time(),
-                "streaming_output": "",
-                "ai_progress": "",
-                "result_text": ""
-            }
-
-        zd_results[job_id][chunk_id]["status"] = "failed"
-        zd_results[job_id][chunk_id]["error"] = str(e)
-        zd_results[job_id][chunk_id]["completion_time"] = time.time()
-        zd_results[job_id][chunk_id]["ai_progress"] = f"Failed: {str(e)}"
+        await llm_engine.offload(fail_zd_chunk, job_id, chunk, e)
+
+def zd_slide_content(slide):
+    """The part of a ZD slide that is reviewed (speaker notes are not)."""
+    return [slide.get("tagline", ""), slide.get("body_other", "")]
+
+def carry_over_zd_chunk(job_id, chunk, rows):
+    """Complete a chunk with the rows of the previous job for its (unchanged) slides."""
+    now = time.time()
+    with job_storage.batch() as batch:
+        update_chunk_result(job_id, chunk["chunk_id"], {
+            "chunk_id": chunk["chunk_id"],
+            "status": "completed",
+            "page_start": chunk["page_start"],
+            "page_end": chunk["page_end"],
+            "page_numbers": chunk["page_numbers"],
+            "word_count": chunk["word_count"],
+            "start_time": now,
+            "completion_time": now,
+            "streaming_length": 0,
+            "ai_progress": "Unchanged since the previous version",
+            "result_text": "",
+            "carried_rows": rows,
+            "error": None
+        }, batch)
+        incr_job_counter(job_id, "chunks_sent", batch=batch)
+        incr_job_counter(job_id, "chunks_completed", batch=batch)
+
+def reset_zd_chunk_stream(job_id, chunk_id, chunk_data, notice):
+    """Replace a chunk's streamed output with ``notice`` before a retry."""
+    chunk_data["stream_start_time"] = time.time()
+    with job_storage.batch() as batch:
+        batch.reset_stream_output(job_id, chunk_id)
+        batch.append_stream_output(job_id, chunk_id, notice)
+        update_chunk_result(job_id, chunk_id, chunk_data, batch)
+
+def replay_zd_chunk(job_id, chunk, chunk_data, result_text):
+    """Complete a chunk with a cached response, streamed out in one piece."""
+    chunk_data.update({
+        "streaming_length": len(result_text.encode('utf-8')),
+        "partial_rows": parse_markdown_table(result_text),
+        "last_update": time.time()
+    })
+    job_storage.append_stream_output(job_id, chunk["chunk_id"], result_text)
+    complete_zd_chunk(job_id, chunk, chunk_data, result_text)
 
-        zd_jobs[job_id]["chunks_failed"] += 1
-        zd_jobs[job_id]["last_update"] = time.time()
+def complete_zd_chunk(job_id, chunk, chunk_data, result_text):
+    """Store a chunk's final result and merge the job once every chunk is done."""
+    chunk_id = chunk["chunk_id"]
 
-def recover_stalled_chunks():
-    """Periodically check for and recover stalled chunks."""
-    try:
-        current_time = time.time()
+    # Final result
+    result_text = result_text.strip()
+
+    # Update chunk result status (update_chunk_result also writes the
+    # in-memory mirror, which may have evicted the job meanwhile)
+    chunk_data.update({
+        "status": "completed",
+        "completion_time": time.time(),
+        "ai_progress": f"Completed - processed {chunk['word_count']} words"
+                       + (" (cached)" if chunk_data.get("cache_hit") else ""),
+        "result_text": result_text,
+        "final_result_text": result_text
+    })
+    # Store the result, count it and read the job totals in one round-trip
+    with job_storage.batch() as batch:
+        update_chunk_result(job_id, chunk_id, chunk_data, batch)
+        chunks_completed = incr_job_counter(job_id, "chunks_completed", batch=batch)
+        job_fields = batch.get_job_fields(job_id, ["chunks_total", "status"])
+
+    new_completed = chunks_completed.value or 0
+    job_data = job_fields.value
+
+    # Check if all chunks are done - verify both count and actual status
+    chunks_total = job_data.get("chunks_total", 0)
+    if new_completed >= chunks_total:
+        # Double-check by examining actual chunk statuses (from every worker)
+        all_chunks_completed = True
+        for chunk_id_check, chunk_data_check in job_storage.cache.get_chunk_results(job_id).items():
+            if chunk_data_check.get("status") != "completed":
+                all_chunks_completed = False
+                break
 
-        # Check all active jobs
-        for job_id in list(zd_jobs.keys()):
-            job = zd_jobs.get(job_id)
-            if not job or job.get("status") not in [ZD_STATUS_THINKING, ZD_STATUS_PROMPTING]:
-                continue
+        if all_chunks_completed:
+            update_job_status(job_id, {"status": ZD_STATUS_MERGING})
+            # Trigger result merging
+            merge_zd_results(job_id)
+    elif job_data.get("status") == ZD_STATUS_DONE:
+        # Job was already done but a chunk was re-checked and completed
+        # Re-merge to incorporate the new results
+        update_job_status(job_id, {"status": ZD_STATUS_MERGING})
+        merge_zd_results(job_id)
+
+def fail_zd_chunk(job_id, chunk, e):
+    """Mark a chunk as failed with error ``e``."""
+    chunk_id = chunk["chunk_id"]
 
-            # Check chunks that might be stalled
-            if job_id in zd_results:
-                for chunk_id, chunk_data in zd_results[job_id].items():
-                    if chunk_data.get("status") == "processing":
-                        last_update = chunk_data.get("last_update", 0)
-
-                        # If no update for more than 5 minutes, consider it stalled
-                        if current_time - last_update > 300:
-                            print(f"[WARNING] Detected stalled chunk {chunk_id} in job {job_id}")
-                            print(f"[WARNING] Last update was {current_time - last_update:.1f} seconds ago")
-
-                            # Mark as failed and let retry mechanism handle it
-                            chunk_data.update({
-                                "status": "failed",
-                                "error": "Chunk appeared to be stalled - no updates for 5+ minutes",
-                                "completion_time": current_time,
-                                "ai_progress": "Failed: Stalled processing detected"
-                            })
-                            update_chunk_result(job_id, chunk_id, chunk_data)
-
-                            # Update job failed count
-                            job["chunks_failed"] = job.get("chunks_failed", 0) + 1
-                            job["last_update"] = current_time
+    # Mark chunk as failed
+    failed_chunk = dict(zd_results.get(job_id, {}).get(chunk_id) or {
+        # Initialize if not already done
+        "chunk_id": chunk_id,
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "page_numbers": chunk["page_numbers"],
+        "word_count": chunk["word_count"],
+        "start_time": time.time(),
+        "streaming_length": 0,
+        "ai_progress": "",
+        "result_text": ""
+    })
+    failed_chunk.update({
+        "status": "failed",
+        "error": str(e),
+        "completion_time": time.time(),
+        "ai_progress": f"Failed: {str(e)}"
+    })
 
-    except Exception as e:
-        print(f"[ERROR] Error in recover_stalled_chunks: {e}")
+    with job_storage.batch() as batch:
+        update_chunk_result(job_id, chunk_id, failed_chunk, batch)
+        incr_job_counter(job_id, "chunks_failed", batch=batch)
+
+def requeue_expired_zd_chunk(job_id, chunk_id):
+    """Re-enqueue a chunk whose worker stopped renewing its lease."""
+    job, chunk_results = job_storage.cache.get_state(job_id)
+    if not job or job.get("status") not in [ZD_STATUS_PROMPTING, ZD_STATUS_THINKING]:
+        return
+
+    chunk = next((c for c in job.get("chunks", []) if c["chunk_id"] == chunk_id), None)
+    chunk_state = chunk_results.get(chunk_id, {})
+    if chunk is None or chunk_state.get("status") in ["completed", "failed"]:
+        return
+
+    recoveries = chunk_state.get("lease_recoveries", 0) + 1
+    if recoveries > LEASE_MAX_RECOVERIES:
+        # The chunk keeps killing its workers; give up on it
+        with job_storage.batch() as batch:
+            update_chunk_result(job_id, chunk_id, {
+                **chunk_state,
+                "status": "failed",
+                "error": f"Worker lost {LEASE_MAX_RECOVERIES} times while processing this chunk",
+                "completion_time": time.time(),
+                "ai_progress": "Failed: Worker lost"
+            }, batch)
+            incr_job_counter(job_id, "chunks_failed", batch=batch)
+        return
+
+    print(f"[INFO] Re-enqueueing chunk {chunk_id} of job {job_id} (recovery {recoveries}/{LEASE_MAX_RECOVERIES})")
+    # The re-run counts itself as sent again
+    incr_job_counter(job_id, "chunks_sent", -1)
+    thread_pool.submit_chunk(
+        job_id,
+        chunk_id,
+        process_zd_chunk_async,
+        job_id, dict(chunk, lease_recoveries=recoveries), job.get("model", "gpt-4"), job.get("language", "english")
+    )
 
 def merge_zd_results(job_id):
     """Merge results from all chunks."""
     try:
-        if job_id not in zd_results or job_id not in zd_jobs:
+        # Chunks may have been processed by other workers, so read the shared state
+        job, chunk_results = job_storage.cache.get_state(job_id)
+        if not job or not chunk_results:
             return
 
         # Validate that all chunks are actually completed before merging
-        chunks_total = zd_jobs[job_id].get("chunks_total", 0)
+        chunks_total = job.get("chunks_total", 0)
         incomplete_chunks = []
         completed_chunks = []
 
-        for chunk_id, chunk_result in zd_results[job_id].items():
+        for chunk_id, chunk_result in chunk_results.items():
             status = chunk_result.get("status", "unknown")
             if status == "completed":
                 completed_chunks.append(chunk_id)
@@ -993,8 +1250,7 @@ def merge_zd_results(job_id):
             print(f"[WARNING] Only {len(completed_chunks)}/{chunks_total} chunks completed")
 
             # Update job status to reflect we're still waiting
-            zd_jobs[job_id]["status"] = ZD_STATUS_THINKING
-            zd_jobs[job_id]["last_update"] = time.time()
+            update_job_status(job_id, {"status": ZD_STATUS_THINKING})
             return
 
         print(f"[DEBUG] All {len(completed_chunks)} chunks completed, proceeding with merge")
@@ -1003,14 +1259,15 @@ def merge_zd_results(job_id):
         all_rows = []
         failed_chunks = []
         chunk_raw_results = {}  # Keep raw results for debugging
+        streaming_outputs = job_storage.get_stream_outputs(job_id, list(chunk_results.keys()))
 
-        for chunk_id, chunk_result in zd_results[job_id].items():
+        for chunk_id, chunk_result in chunk_results.items():
             # Store raw result for preservation
             chunk_raw_results[chunk_id] = {
                 "status": chunk_result.get("status"),
                 "result_text": chunk_result.get("result_text", ""),
                 "final_result_text": chunk_result.get("final_result_text", ""),
-                "streaming_output": chunk_result.get("streaming_output", ""),
+                "streaming_output": streaming_outputs.get(chunk_id, ""),
                 "page_start": chunk_result.get("page_start"),
                 "page_end": chunk_result.get("page_end"),
                 "word_count": chunk_result.get("word_count"),
@@ -1021,6 +1278,9 @@ def merge_zd_results(job_id):
                 failed_chunks.append(chunk_result)
                 continue
 
+            # Rows carried over from the previous version of the deck
+            all_rows.extend(chunk_result.get("carried_rows", []))
+
             # Parse markdown table from result_text (try both sources)
             result_text = chunk_result.get("result_text", "")
             final_result_text = chunk_result.get("final_result_text", "")
@@ -1033,26 +1293,14 @@ def merge_zd_results(job_id):
                 all_rows.extend(rows)
 
             # Also check raw_chunk_results if available for this job
-            raw_chunks = zd_jobs[job_id].get("raw_chunk_results", {})
+            raw_chunks = job.get("raw_chunk_results", {})
             if chunk_id in raw_chunks and not text_to_parse:
                 raw_text = raw_chunks[chunk_id].get("final_result_text", "")
                 if raw_text:
                     rows = parse_markdown_table(raw_text)
                     all_rows.extend(rows)
 
-        # Remove duplicates and sort by page number
-        unique_rows = {}
-        for row in all_rows:
-            page_num = row.get("page_number")
-            if page_num:
-                if page_num not in unique_rows:
-                    unique_rows[page_num] = row
-                else:
-                    # Merge overlapping results
-                    unique_rows[page_num] = merge_row_results(unique_rows[page_num], row)
-
-        # Sort by page number
-        final_results = [unique_rows[page] for page in sorted(unique_rows.keys())]
+        final_results = combine_zd_rows(all_rows)
 
         # Update job status - PRESERVE raw chunk data
         completion_updates = {
@@ -1076,115 +1324,86 @@ def merge_zd_results(job_id):
         }
         update_job_status(job_id, error_updates)
 
-def parse_markdown_table(text):
-    """Parse markdown table into list of dictionaries."""
-    rows = []
-    lines = text.strip().split('\n')
-
-    # Clean up the text - remove <think> tags and other AI artifacts
-    cleaned_lines = []
-    in_think_block = False
-
-    for line in lines:
-        line = line.strip()
-
-        # Skip <think> blocks
-        if line.startswith('<think>'):
-            in_think_block = True
-            continue
-        elif line.startswith('</think>'):
-            in_think_block = False
-            continue
-        elif in_think_block:
-            continue
-
-        # Skip common AI response headers
-        if line.startswith('## Answer:') or line.startswith('# Answer:') or line.startswith('Answer:'):
-            continue
-
-        if line:  # Only add non-empty lines
-            cleaned_lines.append(line)
-
-    # Find table start - look for header with page_number or spelling (English/Chinese)
-    header_found = False
-    header_index = -1
-
-    for i, line in enumerate(cleaned_lines):
-        if '|' in line and ('page_number' in line.lower() or 'spelling' in line.lower() or 'grammar' in line.lower() or
-                           '错别字' in line or '语病' in line or '逻辑' in line):
-            header_found = True
-            header_index = i
-            break
-
-    if not header_found:
-        return rows
-
-    # Find separator line (could be |---|---| or --- | --- | ---)
-    separator_index = header_index + 1
-    if separator_index < len(cleaned_lines):
-        separator_line = cleaned_lines[separator_index]
-
-        # Skip separator if it contains only dashes, pipes, and spaces
-        if all(c in '-| ' for c in separator_line):
-            data_start = separator_index + 1
-        else:
-            # No separator found, data starts right after header
-            data_start = separator_index
-
-    # Process data lines
-    data_lines = cleaned_lines[data_start:]
+def combine_zd_rows(rows):
+    """One row per page (overlapping chunks' findings merged), sorted by page number."""
+    unique_rows = {}
+    for row in rows:
+        page_num = row.get("page_number")
+        if page_num:
+            if page_num not in unique_rows:
+                unique_rows[page_num] = row
+            else:
+                # Merge overlapping results
+                unique_rows[page_num] = merge_row_results(unique_rows[page_num], row)
 
-    for i, line in enumerate(data_lines):
-        if '|' in line and line.strip() != '':
-            parts = [part.strip() for part in line.split('|')]
+    return [unique_rows[page] for page in sorted(unique_rows.keys())]
 
-            # Handle different table formats - some may have empty first/last parts due to leading/trailing |
-            if parts and parts[0] == '':
-                parts = parts[1:]  # Remove empty first part
-            if parts and parts[-1] == '':
-                parts = parts[:-1]  # Remove empty last part
+def partial_zd_results(job_id):
+    """Rows found so far by a running job: finished chunks plus rows streamed by the others."""
+    rows = []
+    for chunk_result in job_storage.cache.get_chunk_results(job_id).values():
+        rows.extend(chunk_result.get("carried_rows", []))
+        rows.extend(chunk_result.get("partial_rows", []))
+    return combine_zd_rows(rows)
 
-            if len(parts) >= 4:  # page_number, spelling, grammar, logic
-                try:
-                    # Try to parse page number from first column
-                    page_str = parts[0].strip()
-                    page_number = None
-
-                    # Handle various page number formats
-                    if page_str.isdigit():
-                        page_number = int(page_str)
-                    elif page_str.replace('.', '').isdigit():
-                        page_number = int(page_str.replace('.', ''))
-                    elif 'page' in page_str.lower():
-                        # Extract number from "Page 1", "page 1", etc.
-                        import re
-                        match = re.search(r'\d+', page_str)
-                        if match:
-                            page_number = int(match.group())
-
-                    if page_number:
-                        # Clean and normalize issue text
-                        def clean_issue_text(text):
-                            if not text or text.strip() in ["—", "-", "None", "N/A", ""]:
-                                return ""
-                            return text.strip()
-
-                        spelling = clean_issue_text(parts[1])
-                        grammar = clean_issue_text(parts[2])
-                        logic = clean_issue_text(parts[3]) if len(parts) > 3 else ""
-
-                        row = {
-                            "page_number": page_number,
-                            "spelling": spelling,
-                            "grammar": grammar,
-                            "logic": logic
-                        }
-                        rows.append(row)
-
-                except (ValueError, IndexError):
-                    continue
-
-    return rows
+def parse_markdown_table(text):
+    """Parse markdown table into list of dictionaries."""
+    return parse_table(text, is_zd_table_header, parse_zd_table_row)
+
+def zd_table_parser():
+    """Incremental parser for a streamed ZD response (see table_stream)."""
+    return IncrementalTableParser(is_zd_table_header, parse_zd_table_row)
+
+def is_zd_table_header(line):
+    """Table header: mentions page_number or an issue column (English/Chinese)."""
+    return '|' in line and ('page_number' in line.lower() or 'spelling' in line.lower() or 'grammar' in line.lower() or
+                            '错别字' in line or '语病' in line or '逻辑' in line)
+
+def clean_issue_text(text):
+    """Empty string for placeholder cells (—, N/A, ...)."""
+    if not text or text.strip() in ["—", "-", "None", "N/A", ""]:
+        return ""
+    return text.strip()
+
+def parse_zd_table_row(line):
+    """One table line as a row dict, or None for separators and anything malformed."""
+    if '|' not in line:
+        return None
+    parts = [part.strip() for part in line.split('|')]
+
+    # Handle different table formats - some may have empty first/last parts due to leading/trailing |
+    if parts and parts[0] == '':
+        parts = parts[1:]  # Remove empty first part
+    if parts and parts[-1] == '':
+        parts = parts[:-1]  # Remove empty last part
+
+    if len(parts) < 4:  # page_number, spelling, grammar, logic
+        return None
+
+    # Try to parse page number from first column
+    page_str = parts[0].strip()
+    page_number = None
+
+    # Handle various page number formats
+    if page_str.isdigit():
+        page_number = int(page_str)
+    elif page_str.replace('.', '').isdigit():
+        page_number = int(page_str.replace('.', ''))
+    elif 'page' in page_str.lower():
+        # Extract number from "Page 1", "page 1", etc.
+        match = re.search(r'\d+', page_str)
+        if match:
+            page_number = int(match.group())
+
+    if not page_number:
+        return None
+
+    return {
+        "page_number": page_number,
+        "spelling": clean_issue_text(parts[1]),
+        "grammar": clean_issue_text(parts[2]),
+        "logic": clean_issue_text(parts[3])
+    }
 
 def merge_row_results(row1, row2):
     """Merge results from overlapping rows."""
@@ -1255,15 +1474,44 @@ def create_zd_job():
     except Exception as e:
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+@app.route('/api/zd/jobs', methods=['GET'])
+def list_zd_jobs():
+    """List active ZD jobs, newest first, optionally filtered by status."""
+    if not is_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    status = request.args.get('status') or None
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+
+    return jsonify({
+        "jobs": job_storage.list_jobs(status=status, offset=offset, limit=limit),
+        "total": job_storage.count_jobs(status=status),
+        "offset": offset,
+        "limit": limit
+    })
+
 @app.route('/api/zd/jobs/<job_id>/run', methods=['POST'])
 def run_zd_analysis(job_id):
     """Start ZD analysis on uploaded PPT."""
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job = job_storage.cache.get_job(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
 
+    # Turn new runs away while the chunk backlog is too long
+    admission = admit(thread_pool)
+    if not admission.accepted:
+        response = jsonify({
+            'error': 'Too many analyses are queued, please try again later',
+            'retry_after': admission.retry_after,
+            'admission': admission.to_dict()
+        })
+        response.headers['Retry-After'] = str(admission.retry_after)
+        return response, 429
+
     try:
         data = request.get_json() or {}
         mode = data.get('mode', 'fast')  # fast or precise
@@ -1283,120 +1531,176 @@ def run_zd_analysis(job_id):
         if model_name not in valid_models:
             model_name = 'gpt-4'
 
-        job = zd_jobs[job_id]
+        # Re-run against a previous version of the deck: only chunks with
+        # changed slides go to the model (see deck_diff)
+        previous_job_id = data.get('previous_job_id')
+        previous_job = None
+        if previous_job_id:
+            previous_job = job_storage.cache.get_job(previous_job_id)
+            if not previous_job:
+                return jsonify({'error': 'Previous job not found'}), 404
+            if previous_job.get("status") != ZD_STATUS_DONE:
+                return jsonify({'error': 'Previous job has not finished'}), 400
+            if previous_job.get("language", "english") != language:
+                return jsonify({'error': 'Previous job was analyzed in another language'}), 400
+
         temp_file_path = job["temp_file_path"]
 
-        # Update status - parsing
-        job["status"] = ZD_STATUS_PARSING
-        job["mode"] = mode
-        job["model"] = model_name
-        job["language"] = language
-        job["last_update"] = time.time()
+        # Update status - parsing (persisted so every worker sees it)
+        update_job_status(job_id, {
+            "status": ZD_STATUS_PARSING,
+            "mode": mode,
+            "model": model_name,
+            "language": language
+        })
 
         # Extract and chunk PPT with language parameter
         result = extract_ppt_for_zd(temp_file_path, mode, language)
 
         if not result["success"]:
-            job["status"] = ZD_STATUS_ERROR
-            job["error"] = result["error"]
-            job["last_update"] = time.time()
+            update_job_status(job_id, {"status": ZD_STATUS_ERROR, "error": result["error"]})
             return jsonify({"error": result["error"]}), 400
 
         # Update job with extracted data
-        job["stats"] = result["stats"]
-        job["chunks"] = result["chunks"]
-        job["chunks_total"] = result["total_chunks"]
-        job["model"] = model_name
-        job["language"] = language
-        job["status"] = ZD_STATUS_CHUNKING
-        job["last_update"] = time.time()
+        job.update({
+            "stats": result["stats"],
+            "chunks": result["chunks"],
+            "chunks_total": result["total_chunks"],
+            "model": model_name,
+            "language": language,
+            "status": ZD_STATUS_CHUNKING
+        })
+        chunks_to_run = result["chunks"]
+        rerun_fields = {}
+        plan = None
+        if previous_job is not None:
+            plan = plan_rerun(
+                previous_job.get("chunks", []), previous_job.get("final_results", []), result["chunks"],
+                "slides", "page_number", "page_number", zd_slide_content
+            )
+            chunks_to_run = plan.run_chunks
+            rerun_fields = plan.job_fields(previous_job_id)
+            print(f"[INFO] Re-running job {job_id} against {previous_job_id}: "
+                  f"{len(chunks_to_run)}/{result['total_chunks']} chunks changed")
+
+        queue_fields = admission.job_fields(len(chunks_to_run))
+        update_job_status(job_id, {
+            "stats": result["stats"],
+            "chunks": result["chunks"],
+            "chunks_total": result["total_chunks"],
+            "model": model_name,
+            "language": language,
+            "status": ZD_STATUS_CHUNKING,
+            **rerun_fields,
+            **queue_fields
+        })
 
         # Start processing chunks asynchronously
         def process_all_chunks():
             try:
-                job["status"] = ZD_STATUS_PROMPTING
-                job["last_update"] = time.time()
-
-                # Process chunks with ThreadPoolExecutor (non-daemon threads)
-                from concurrent.futures import as_completed
-                futures = []
-
-                for chunk in job["chunks"]:
-                    # Submit chunk to thread pool
-                    future = thread_pool.submit_chunk(
+                if job_storage.cancellations.is_cancelled(job_id):
+                    return
+                update_job_status(job_id, {"status": ZD_STATUS_PROMPTING})
+
+                # Chunks without changes since the previous version are done already
+                if plan is not None:
+                    for chunk in result["chunks"]:
+                        if chunk["chunk_id"] in plan.carried:
+                            carry_over_zd_chunk(job_id, chunk, plan.carried[chunk["chunk_id"]])
+                    if not chunks_to_run:
+                        update_job_status(job_id, {"status": ZD_STATUS_MERGING})
+                        merge_zd_results(job_id)
+                        return
+
+                # Submit chunks to the chunk queue (the durable work queue
+                # shared by all workers, or the local thread pool)
+                for chunk in chunks_to_run:
+                    thread_pool.submit_chunk(
                         job_id,
                         chunk["chunk_id"],
                         process_zd_chunk_async,
                         job_id, chunk, model_name, language
                     )
-                    futures.append((future, chunk["chunk_id"]))
-
-                # Wait for all chunks to complete
-                for future, chunk_id in futures:
-                    try:
-                        future.result(timeout=600)  # 10 minute timeout per chunk
-                        thread_pool.cleanup_chunk(job_id, chunk_id)
-                    except Exception as e:
-                        print(f"[ERROR] Chunk {chunk_id} failed: {e}")
-                        thread_pool.cleanup_chunk(job_id, chunk_id)
 
             except Exception as e:
-                job["status"] = ZD_STATUS_ERROR
-                job["error"] = str(e)
-                job["last_update"] = time.time()
+                update_job_status(job_id, {"status": ZD_STATUS_ERROR, "error": str(e)})
 
-        # Start async processing with non-daemon thread for persistence
-        processing_thread = threading.Thread(target=process_all_chunks, name=f"zd_main_{job_id}")
-        processing_thread.daemon = False  # Non-daemon to survive server restarts
-        processing_thread.start()
+        # Submitting the chunks is quick; the chunks themselves run on the chunk queue
+        get_executor("jobs").submit(process_all_chunks)
 
         return jsonify({
             "success": True,
             "message": "Analysis started",
             "stats": result["stats"],
-            "total_chunks": result["total_chunks"]
+            "total_chunks": result["total_chunks"],
+            "chunks_to_run": len(chunks_to_run),
+            "queue_position": queue_fields["queue_position"],
+            "estimated_completion": queue_fields["estimated_completion"]
         })
 
     except Exception as e:
-        zd_jobs[job_id]["status"] = ZD_STATUS_ERROR
-        zd_jobs[job_id]["error"] = str(e)
-        zd_jobs[job_id]["last_update"] = time.time()
+        update_job_status(job_id, {"status": ZD_STATUS_ERROR, "error": str(e)})
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
+@app.route('/api/zd/jobs/<job_id>', methods=['DELETE'])
+def cancel_zd_job(job_id):
+    """Cancel a job: drop its queued chunks and stop the running ones."""
+    if not is_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    job = job_storage.get_job_fields(job_id, ["status"])
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.get("status") in [ZD_STATUS_DONE, ZD_STATUS_ERROR, ZD_STATUS_CANCELLED]:
+        return jsonify({'error': f'Job is already {job.get("status")}'}), 409
+
+    try:
+        # Flag first, so chunks dispatched meanwhile skip themselves
+        closed_streams = job_storage.cancellations.cancel(job_id)
+        dropped_chunks = thread_pool.cancel_job(job_id)
+        update_job_status(job_id, {
+            "status": ZD_STATUS_CANCELLED,
+            "completion_time": time.time(),
+            "last_update": time.time()
+        })
+        print(f"[INFO] Cancelled job {job_id}: {dropped_chunks} queued chunks dropped, "
+              f"{closed_streams} streams closed")
+
+        return jsonify({
+            "success": True,
+            "message": "Job cancelled",
+            "dropped_chunks": dropped_chunks,
+            "closed_streams": closed_streams
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Cancel failed: {str(e)}"}), 500
+
 @app.route('/api/zd/jobs/<job_id>')
 def get_zd_job_status(job_id):
     """Get ZD job status."""
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    # Try persistent storage first, fallback to in-memory
-    job = job_storage.get_job(job_id)
+    # Served from the local cache while the job's version is unchanged
+    job, chunk_results = job_storage.cache.get_state(job_id)
     if not job:
-        job = zd_jobs.get(job_id, {'status': 'not_found'})
+        job = {'status': 'not_found'}
 
     # Calculate progress percentage based on actual chunk statuses
     chunks_total = job.get('chunks_total', 0)
     if chunks_total > 0:
         # Count actually completed chunks, not just the stored counter
-        actual_completed = 0
-        chunk_results = job_storage.get_chunk_results(job_id)
-        if chunk_results:
-            actual_completed = sum(1 for chunk in chunk_results.values() if chunk.get('status') == 'completed')
-        elif job_id in zd_results:
-            # Fallback to in-memory
-            actual_completed = sum(1 for chunk in zd_results[job_id].values() if chunk.get('status') == 'completed')
+        actual_completed = sum(1 for chunk in chunk_results.values() if chunk.get('status') == 'completed')
 
         progress = (actual_completed / chunks_total) * 100
         job['progress'] = round(progress, 1)
     else:
         job['progress'] = 0
 
-    # Include detailed chunk information from persistent storage
-    chunk_results = job_storage.get_chunk_results(job_id)
-    if not chunk_results and job_id in zd_results:
-        # Fallback to in-memory
-        chunk_results = zd_results[job_id]
-
+    # Include detailed chunk information. Streamed output is not included:
+    # clients read it from .../stream, after the offset they already have
+    # (starting over whenever stream_start_time changes)
     if chunk_results:
         chunk_details = {}
         for chunk_id, chunk_data in chunk_results.items():
@@ -1407,7 +1711,9 @@ def get_zd_job_status(job_id):
                 "page_end": chunk_data["page_end"],
                 "word_count": chunk_data.get("word_count", 0),
                 "ai_progress": chunk_data.get("ai_progress", ""),
-                "streaming_output": chunk_data.get("streaming_output", ""),
+                "streaming_output_length": chunk_data.get("streaming_length", 0),
+                "stream_start_time": chunk_data.get("stream_start_time"),
+                "partial_rows": chunk_data.get("partial_rows") or chunk_data.get("carried_rows", []),
                 "error": chunk_data.get("error"),
                 "start_time": chunk_data.get("start_time"),
                 "completion_time": chunk_data.get("completion_time"),
@@ -1417,26 +1723,58 @@ def get_zd_job_status(job_id):
 
     return jsonify(job)
 
+@app.route('/api/zd/jobs/<job_id>/chunks/<chunk_id>/stream')
+def get_zd_chunk_stream(job_id, chunk_id):
+    """Get a chunk's streaming output after an offset (or only its tail)."""
+    if not is_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    offset = request.args.get('offset', 0, type=int)
+    tail = request.args.get('tail', type=int)
+    text, next_offset = job_storage.get_stream_output(job_id, chunk_id, offset=offset, tail=tail)
+
+    return jsonify({
+        "job_id": job_id,
+        "chunk_id": chunk_id,
+        "text": text,
+        "offset": next_offset
+    })
+
+@app.route('/api/zd/jobs/<job_id>/events')
+def stream_zd_job_events(job_id):
+    """Push change events for a ZD job as Server-Sent Events."""
+    if not is_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    subscription = job_storage.subscribe(job_id)
+    return Response(
+        event_stream(subscription),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/zd/jobs/<job_id>/result')
 def get_zd_results(job_id):
     """Get ZD analysis results."""
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job = job_storage.cache.get_job(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    job = zd_jobs[job_id]
-
+    # partial=true serves the rows found so far while the analysis runs
     if job["status"] != ZD_STATUS_DONE:
-        return jsonify({'error': 'Analysis not completed'}), 400
+        if request.args.get('partial', 'false').lower() != 'true':
+            return jsonify({'error': 'Analysis not completed'}), 400
+        job = dict(job, final_results=partial_zd_results(job_id))
 
     format_type = request.args.get('format', 'json')
 
     if format_type == 'csv':
-        return export_zd_results_csv(job_id)
+        return export_zd_results_csv(job_id, job)
     elif format_type == 'xlsx':
-        return export_zd_results_xlsx(job_id)
+        return export_zd_results_xlsx(job_id, job)
     else:
         response_data = {
             "job_id": job_id,
@@ -1459,11 +1797,10 @@ def get_zd_debug_info(job_id):
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job, chunk_results = job_storage.cache.get_state(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    job = zd_jobs[job_id]
-
     debug_info = {
         "job_id": job_id,
         "job_status": job.get("status"),
@@ -1471,19 +1808,19 @@ def get_zd_debug_info(job_id):
         "chunks_completed": job.get("chunks_completed", 0),
         "chunks_failed": job.get("chunks_failed", 0),
         "raw_chunk_results": job.get("raw_chunk_results", {}),
-        "zd_results_keys": list(zd_results.get(job_id, {}).keys()) if job_id in zd_results else [],
+        "zd_results_keys": list(chunk_results.keys()),
         "final_results_count": len(job.get("final_results", [])),
         "failed_chunks_count": len(job.get("failed_chunks", []))
     }
 
-    # Include detailed chunk info from zd_results
-    if job_id in zd_results:
+    # Include detailed chunk info from the chunk results
+    if chunk_results:
         debug_info["detailed_chunks"] = {}
-        for chunk_id, chunk_data in zd_results[job_id].items():
+        for chunk_id, chunk_data in chunk_results.items():
             debug_info["detailed_chunks"][chunk_id] = {
                 "status": chunk_data.get("status"),
                 "result_text_length": len(chunk_data.get("result_text", "")),
-                "streaming_output_length": len(chunk_data.get("streaming_output", "")),
+                "streaming_output_length": chunk_data.get("streaming_length", 0),
                 "has_final_result_text": "final_result_text" in chunk_data,
                 "error": chunk_data.get("error")
             }
@@ -1496,10 +1833,9 @@ def test_parse_chunk(job_id):
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job = job_storage.cache.get_job(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
-
-    job = zd_jobs[job_id]
     test_results = {}
 
     # Test parsing each chunk
@@ -1522,9 +1858,8 @@ def test_parse_chunk(job_id):
         "test_results": test_results
     })
 
-def export_zd_results_csv(job_id):
+def export_zd_results_csv(job_id, job):
     """Export results as CSV."""
-    job = zd_jobs[job_id]
     results = job.get("final_results", [])
 
     output = io.StringIO()
@@ -1550,9 +1885,8 @@ def export_zd_results_csv(job_id):
         headers={'Content-Disposition': f'attachment; filename=zd_analysis_{job_id[:8]}.csv'}
     )
 
-def export_zd_results_xlsx(job_id):
+def export_zd_results_xlsx(job_id, job):
     """Export results as Excel."""
-    job = zd_jobs[job_id]
     results = job.get("final_results", [])
 
     # Create workbook
@@ -1657,10 +1991,24 @@ def zd_health_check():
     """Health check for ZD system including Redis connectivity."""
     try:
         health_data = {
+            'storage_backend': job_storage.backend,
             'redis_available': job_storage.redis_available,
-            'active_jobs': len(job_storage.get_active_jobs()),
+            'active_jobs': job_storage.count_jobs(),
             'thread_pool_workers': thread_pool.max_workers,
             'active_futures': len(thread_pool.active_futures),
+            'chunk_queue': {'zd': thread_pool.stats(), 'wr': wr_thread_pool.stats()},
+            'memory_stores': all_store_stats(),
+            'job_events': {'zd': job_storage.events.stats(), 'wr': wr_storage.events.stats()},
+            'job_cache': {'zd': job_storage.cache.stats(), 'wr': wr_storage.cache.stats()},
+            'chunk_leases': {'zd': job_storage.leases.stats(), 'wr': wr_storage.leases.stats()},
+            'llm_concurrency': all_limiter_stats(),
+            'llm_rate_limit': rate_limiter.stats(),
+            'llm_engine': llm_engine.stats(),
+            'llm_cache': llm_cache.stats(),
+            'executors': all_executor_stats(),
+            'admission': {**admission_stats(), 'zd_backlog': thread_pool.backlog(), 'wr_backlog': wr_thread_pool.backlog()},
+            'cancellations': {'zd': job_storage.cancellations.stats(), 'wr': wr_storage.cancellations.stats()},
+            'timers': timers.stats(),
             'timestamp': time.time()
         }
 
@@ -1685,10 +2033,13 @@ def retry_zd_chunk(job_id, chunk_id):
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job = job_storage.cache.get_job(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    job = zd_jobs[job_id]
+    # Its chunks would be dropped on dispatch, leaving the counters wrong
+    if job_storage.cancellations.is_cancelled(job_id):
+        return jsonify({'error': 'Job was cancelled'}), 409
 
     # Find the chunk
     chunk = None
@@ -1704,19 +2055,17 @@ def retry_zd_chunk(job_id, chunk_id):
         model_name = job.get("model", "gpt-4")
         language = job.get("language", "english")
 
-        # Reset chunk status
-        if job_id in zd_results and chunk_id in zd_results[job_id]:
-            del zd_results[job_id][chunk_id]
+        # Reset chunk status; the mirror is re-measured after the in-place change
+        mirrored_chunks = zd_results.get(job_id)
+        if mirrored_chunks is not None and mirrored_chunks.pop(chunk_id, None) is not None:
+            zd_results.touch(job_id, resize=True)
 
-        job["chunks_failed"] = max(0, job["chunks_failed"] - 1)
+        incr_job_counter(job_id, "chunks_failed", -1)
 
-        # Process chunk in background
-        thread = threading.Thread(
-            target=process_zd_chunk_async,
-            args=(job_id, chunk, model_name, language)
+        # Process chunk ahead of queued chunks of other jobs
+        thread_pool.submit_chunk(
+            job_id, chunk_id, process_zd_chunk_async, job_id, chunk, model_name, language, priority=True
         )
-        thread.daemon = True
-        thread.start()
 
         return jsonify({"success": True, "message": "Chunk retry started"})
 
@@ -1729,10 +2078,13 @@ def recheck_zd_chunk(job_id, chunk_id):
     if not is_authenticated():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    if job_id not in zd_jobs:
+    job = job_storage.cache.get_job(job_id)
+    if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    job = zd_jobs[job_id]
+    # Its chunks would be dropped on dispatch, leaving the counters wrong
+    if job_storage.cancellations.is_cancelled(job_id):
+        return jsonify({'error': 'Job was cancelled'}), 409
 
     # Find the chunk
     chunk = None
@@ -1745,7 +2097,7 @@ def recheck_zd_chunk(job_id, chunk_id):
         return jsonify({'error': 'Chunk not found'}), 404
 
     # Check if chunk is completed (can only re-check completed chunks)
-    chunk_result = zd_results.get(job_id, {}).get(chunk_id, {})
+    chunk_result = job_storage.cache.get_chunk_result(job_id, chunk_id) or {}
     if chunk_result.get("status") != "completed":
         return jsonify({'error': 'Can only re-check completed chunks'}), 400
 
@@ -1753,30 +2105,27 @@ def recheck_zd_chunk(job_id, chunk_id):
         model_name = job.get("model", "gpt-4")
         language = job.get("language", "english")
 
-        # Reset chunk status and clear previous result but keep original chunk data
-        if job_id in zd_results and chunk_id in zd_results[job_id]:
-            # Clear result but preserve chunk structure
-            zd_results[job_id][chunk_id] = {
-                "status": "starting",
-                "start_time": time.time(),
-                "ai_progress": "Re-checking...",
-                "streaming_output": "",
-                "result_text": "",
-                "final_result_text": "",
-                "error": None
-            }
+        # Reset chunk status and clear previous result (in the mirror, if the
+        # job is still held there)
+        zd_results.update_fields(job_id, {chunk_id: {
+            "status": "starting",
+            "start_time": time.time(),
+            "ai_progress": "Re-checking...",
+            "streaming_length": 0,
+            "result_text": "",
+            "final_result_text": "",
+            "error": None
+        }})
 
         # Update job counters (completed -> pending)
-        job["chunks_completed"] = max(0, job["chunks_completed"] - 1)
-        job["last_update"] = time.time()
+        incr_job_counter(job_id, "chunks_completed", -1)
 
-        # Process chunk in background with same content
-        thread = threading.Thread(
-            target=process_zd_chunk_async,
-            args=(job_id, chunk, model_name, language)
+        # Process chunk ahead of queued chunks of other jobs (same content),
+        # asking the model again instead of replaying the cached answer
+        thread_pool.submit_chunk(
+            job_id, chunk_id, process_zd_chunk_async, job_id, dict(chunk, bypass_cache=True),
+            model_name, language, priority=True
         )
-        thread.daemon = True
-        thread.start()
 
         return jsonify({"success": True, "message": "Chunk re-check started"})
 
@@ -1793,18 +2142,29 @@ processing_results = {}
 
 def schedule_cleanup(job_id, delay=3600):
     """安排在指定时间后清理临时文件和数据"""
-    def cleanup():
-        time.sleep(delay)
-        if job_id in processing_results:
-            result = processing_results[job_id]
-            temp_dir = result.get('temp_dir')
-            if temp_dir and os.path.exists(temp_dir):
-                # Use safe cleanup for Windows
-                safe_rmtree(temp_dir)
-            processing_results.pop(job_id, None)
-            print(f"Auto-cleaned job: {job_id}")
-
-    threading.Thread(target=cleanup, daemon=True).start()
+    # Persisted, so the temp dir is removed even if the app restarts first
+    result = processing_results.get(job_id, {})
+    timers.schedule_persistent('invoice_cleanup', job_id, delay, {
+        'job_id': job_id,
+        'temp_dir': result.get('temp_dir'),
+    })
+
+def cleanup_invoice_job(payload):
+    """Remove an invoice batch's temp files and results (timer handler)."""
+    job_id = payload.get('job_id')
+    temp_dir = payload.get('temp_dir')
+    if temp_dir and os.path.exists(temp_dir):
+        # Use safe cleanup for Windows
+        safe_rmtree(temp_dir)
+    processing_results.pop(job_id, None)
+    print(f"Auto-cleaned job: {job_id}")
+
+def sweep_expired_state():
+    """Drop expired jobs and in-memory entries (periodic timer)."""
+    trimmed = job_storage.trim_job_index() + wr_storage.trim_job_index()
+    purged = purge_all_stores()
+    if trimmed or purged:
+        print(f"[INFO] TTL sweep removed {trimmed} expired jobs and {purged} cached entries")
 
 def safe_rmtree(directory, max_retries=3):
     """Safely remove directory tree with retry for Windows file locking"""
@@ -1905,6 +2265,11 @@ def startup_recovery():
     """Automatically recover jobs on application startup."""
     try:
         print("[INFO] Starting automatic job recovery...")
+
+        # Convert result hashes written by older versions to per-chunk fields
+        job_storage.migrate_legacy_results()
+        wr_storage.migrate_legacy_results()
+
         active_jobs = job_storage.get_active_jobs()
 
         if active_jobs:
@@ -1917,6 +2282,17 @@ def startup_recovery():
                     print(f"[INFO] Recovering job {job_id}")
                     recovered += 1
 
+                    # Chunks left in progress without a lease were orphaned by a
+                    # worker that stopped before leases existed (or before its
+                    # lease was indexed); hand them to the lease recovery path.
+                    # Queued tasks are redelivered by the work queue instead.
+                    if thread_pool.durable:
+                        continue
+                    for chunk_id, chunk_data in job_storage.get_chunk_results(job_id).items():
+                        if (chunk_data.get('status') in ['starting', 'sending', 'processing']
+                                and not job_storage.leases.is_held(job_id, chunk_id)):
+                            requeue_expired_zd_chunk(job_id, chunk_id)
+
             print(f"[INFO] Recovery complete: {recovered} jobs processed")
         else:
             print("[INFO] No active jobs found for recovery")
@@ -1924,21 +2300,23 @@ def startup_recovery():
     except Exception as e:
         print(f"[ERROR] Startup recovery failed: {e}")
 
-def start_recovery_monitor():
-    """Start the stalled chunk recovery monitor."""
-    def recovery_loop():
-        while True:
-            try:
-                recover_stalled_chunks()
-                time.sleep(60)  # Check every minute
-            except Exception as e:
-                print(f"[ERROR] Recovery monitor error: {e}")
-                time.sleep(60)
+# Chunks are consumed from the work queue by this process (and any worker.py)
+thread_pool.register("zd_chunk", process_zd_chunk_async)
+thread_pool.start()
+
+# Re-enqueue chunks whose worker died. Every process runs a watcher, but
+# only the one holding the namespace's watcher lock scans at a time. The
+# durable work queue redelivers the tasks of dead workers by itself, once
+# their leases have expired (see CHUNK_QUEUE_CLAIM_IDLE).
+if not thread_pool.durable:
+    job_storage.leases.watch(requeue_expired_zd_chunk)
 
-    recovery_thread = threading.Thread(target=recovery_loop, name="zd_recovery_monitor")
-    recovery_thread.daemon = True
-    recovery_thread.start()
-    print("[INFO] Started ZD chunk recovery monitor")
+# Delayed cleanups and periodic maintenance run on the timer scheduler;
+# pending cleanups are kept in job storage and re-armed here after a restart
+timers.attach_storage(job_storage)
+timers.register('invoice_cleanup', cleanup_invoice_job)
+timers.restore()
+timers.call_every(JOB_SWEEP_INTERVAL, sweep_expired_state, key='ttl_sweep')
 
 if __name__ == '__main__':
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -1946,7 +2324,4 @@ if __name__ == '__main__':
     # Run startup recovery
     startup_recovery()
 
-    # Start the recovery monitor for stalled chunks
-    start_recovery_monitor()
-
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,54 @@
+"""
+Executor burst benchmark
+------------------------
+Submits a burst of blocking tasks to a ManagedExecutor at once and checks
+that they run in parallel (one worker per task, up to the pool size)
+instead of queueing behind the first worker:
+
+    python benchmarks/bench_executors.py [--tasks 4] [--workers 4] [--seconds 0.5]
+
+Exits with status 1 if the burst took noticeably longer than one task.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from executors import ManagedExecutor  # noqa: E402
+
+
+def run_burst(tasks: int, workers: int, seconds: float) -> float:
+    executor = ManagedExecutor("bench", workers, tasks)
+    started = time.monotonic()
+    futures = [executor.submit(time.sleep, seconds) for _ in range(tasks)]
+    for future in futures:
+        future.result()
+    elapsed = time.monotonic() - started
+    stats = executor.stats()
+    executor.shutdown()
+    print(f"{tasks} x {seconds}s tasks on {workers} workers: {elapsed:.2f}s, "
+          f"{stats['workers']} threads started")
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    elapsed = run_burst(args.tasks, args.workers, args.seconds)
+    rounds = -(-args.tasks // args.workers)
+    expected = rounds * args.seconds
+    if elapsed > expected * 1.5:
+        print(f"[ERROR] Burst ran serially (expected about {expected:.2f}s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
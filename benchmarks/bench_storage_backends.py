@@ -0,0 +1,137 @@
+"""
+Storage backend benchmark
+-------------------------
+Runs the storage traffic of ZD chunk processing (start batch, streaming
+flushes, completion batch, status polls) against each job storage backend
+and reports latency per operation and overall throughput.
+
+Backends: ``redis`` (REDIS_URL, skipped when unreachable), ``sqlite`` (a
+temporary database file) and ``memory`` (the in-process fallback):
+
+    python benchmarks/bench_storage_backends.py [--jobs 20] [--chunks 8] [--flushes 20] [--workers 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_storage import PersistentJobStorage  # noqa: E402
+from sqlite_storage import SQLiteJobStorage  # noqa: E402
+
+ROW = "| {page} | teh, recieve | missing article | — |\n"
+
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def measure(self, name, operation, *args):
+        start = time.perf_counter()
+        result = operation(*args)
+        with self._lock:
+            self.samples[name].append((time.perf_counter() - start) * 1000)
+        return result
+
+
+def open_backend(name: str, prefix: str):
+    if name == "sqlite":
+        return SQLiteJobStorage(prefix=prefix, path=os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+    if name == "memory":
+        os.environ["REDIS_URL"] = "redis://localhost:1/0"
+    storage = PersistentJobStorage(prefix=prefix)
+    if name == "redis" and not storage.redis_available:
+        return None
+    return storage
+
+
+def run_chunk(storage, timings: Timings, job_id: str, chunk_id: str, flushes: int) -> None:
+    chunk = {"chunk_id": chunk_id, "status": "starting", "streaming_length": 0, "result_text": ""}
+
+    def start():
+        with storage.batch() as batch:
+            batch.reset_stream_output(job_id, chunk_id)
+            batch.set_chunk_result(job_id, chunk_id, dict(chunk))
+            batch.incr_job_counter(job_id, "chunks_sent")
+            batch.update_job(job_id, {"status": "thinking"})
+    timings.measure("start batch", start)
+
+    for page in range(flushes):
+        def flush():
+            with storage.batch() as batch:
+                batch.append_stream_output(job_id, chunk_id, ROW.format(page=page) * 4)
+                batch.set_chunk_result(job_id, chunk_id, dict(chunk, status="processing"))
+                batch.update_job(job_id, {"last_update": time.time()})
+        timings.measure("flush batch", flush)
+        timings.measure("status poll", storage.get_job_state, job_id)
+
+    def complete():
+        with storage.batch() as batch:
+            batch.set_chunk_result(job_id, chunk_id, dict(chunk, status="completed"))
+            batch.incr_job_counter(job_id, "chunks_completed")
+            batch.get_job_fields(job_id, ["chunks_total", "status"])
+    timings.measure("complete batch", complete)
+    timings.measure("stream read", storage.get_stream_output, job_id, chunk_id, 0, 2000)
+
+
+def bench(storage, args) -> tuple:
+    timings = Timings()
+    job_ids = [f"bench-{os.getpid()}-{index}" for index in range(args.jobs)]
+    for job_id in job_ids:
+        timings.measure("create job", storage.create_job, job_id,
+                        {"status": "prompting", "chunks_total": args.chunks, "chunks_sent": 0,
+                         "chunks_completed": 0, "chunks_failed": 0})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(run_chunk, storage, timings, job_id, f"ck_{index:04d}", args.flushes)
+            for job_id in job_ids
+            for index in range(args.chunks)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    timings.measure("list by status", storage.list_jobs, "thinking")
+    for job_id in job_ids:
+        storage.cleanup_job(job_id)
+    return timings, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs to simulate")
+    parser.add_argument("--chunks", type=int, default=8, help="Chunks per job")
+    parser.add_argument("--flushes", type=int, default=20, help="Streaming flushes per chunk")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent chunk workers")
+    parser.add_argument("--backends", default="redis,sqlite,memory", help="Comma-separated backends to run")
+    args = parser.parse_args()
+
+    print(f"\n{'backend':<8} {'operation':<16} {'count':>7} {'mean ms':>9} {'p95 ms':>9}")
+    for name in args.backends.split(","):
+        storage = open_backend(name.strip(), prefix=f"bench_{name.strip()}")
+        if storage is None:
+            print(f"{name:<8} (unavailable, skipped)")
+            continue
+
+        timings, elapsed = bench(storage, args)
+        operations = 0
+        for operation, samples in timings.samples.items():
+            if operation not in ("create job", "list by status"):
+                operations += len(samples)
+            p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) >= 20 else max(samples)
+            print(f"{name:<8} {operation:<16} {len(samples):>7} {statistics.mean(samples):>9.3f} {p95:>9.3f}")
+        print(f"{name:<8} {'throughput':<16} {operations / elapsed:>7.0f} ops/s over {elapsed:.2f}s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Storage codec benchmark
+-----------------------
+Compares serialize/deserialize time and stored bytes of every available
+storage codec on ZD and WR job payloads.
+
+The payloads are produced by the real extraction/chunking code from a
+generated deck (or from your own deck):
+
+    python benchmarks/bench_storage_codec.py [deck.pptx] [--slides 60] [--rounds 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pptx import Presentation  # noqa: E402
+from pptx.util import Inches  # noqa: E402
+
+from ppt_parser import extract_ppt_for_zd  # noqa: E402
+from storage_codec import StorageCodec, msgpack, orjson, zstandard  # noqa: E402
+from wr.chunker import chunk_slides  # noqa: E402
+from wr.parser import extract_slim_json  # noqa: E402
+
+SENTENCE = (
+    "Our analysis indicates that the addressable market will grow by roughly "
+    "{n}% per year, driven by premiumization in tier-1 cities and accelerated "
+    "channel shift towards e-commerce platforms."
+)
+
+
+def build_deck(path: str, slide_count: int) -> None:
+    """Generate a consulting-style deck with titles, bullets and notes."""
+    presentation = Presentation()
+    layout = presentation.slide_layouts[1]
+    for index in range(1, slide_count + 1):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Tagline {index}: margin expansion is achievable through sourcing levers"
+        body = slide.placeholders[1].text_frame
+        body.text = SENTENCE.format(n=index % 17)
+        for bullet in range(6):
+            body.add_paragraph().text = SENTENCE.format(n=(index + bullet) % 23)
+        box = slide.shapes.add_textbox(Inches(1), Inches(6), Inches(6), Inches(1))
+        box.text_frame.text = f"Source: company filings; expert interviews (n={index})"
+        slide.notes_slide.notes_text_frame.text = "Speaker notes: walk through the bridge chart."
+    presentation.save(path)
+
+
+def zd_job_payload(deck_path: str) -> dict:
+    extraction = extract_ppt_for_zd(deck_path, "precise", "english")
+    chunks = extraction["chunks"]
+    final_results = [
+        {"page_number": page, "spelling": "teh, recieve", "grammar": "missing article", "logic": "—"}
+        for page in range(1, extraction["stats"]["total_slides"] + 1)
+    ]
+    table = "\n".join(
+        f"| {row['page_number']} | {row['spelling']} | {row['grammar']} | {row['logic']} |"
+        for row in final_results
+    )
+    raw_chunk_results = {
+        chunk["chunk_id"]: {
+            "status": "completed",
+            "result_text": table,
+            "final_result_text": table,
+            "streaming_output": table,
+            "page_start": chunk["page_start"],
+            "page_end": chunk["page_end"],
+            "word_count": chunk["word_count"],
+            "error": None,
+        }
+        for chunk in chunks
+    }
+    return {
+        "chunks": chunks,
+        "stats": extraction["stats"],
+        "final_results": final_results,
+        "raw_chunk_results": raw_chunk_results,
+    }
+
+
+def wr_job_payload(deck_path: str) -> dict:
+    slides = extract_slim_json(deck_path)
+    chunks = chunk_slides(slides, "precise")
+    result_rows = [
+        {"page": slide["slide_number"], "original": SENTENCE.format(n=1), "revised": SENTENCE.format(n=2)}
+        for slide in slides
+    ]
+    return {"chunks": chunks, "result_rows": result_rows}
+
+
+def available_codecs():
+    serializers = ["json"] + (["orjson"] if orjson else []) + (["msgpack"] if msgpack else [])
+    compressions = ["none", "zlib"] + (["zstd"] if zstandard else [])
+    for serializer in serializers:
+        for compression in compressions:
+            yield StorageCodec(serializer=serializer, compression=compression, compress_min_bytes=4096)
+
+
+def bench(codec: StorageCodec, payload: dict, rounds: int):
+    encoded = {}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encoded = {field: codec.encode(value) for field, value in payload.items()}
+    encode_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = {field: codec.decode(value) for field, value in encoded.items()}
+    decode_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    assert decoded.keys() == payload.keys()
+    stored_bytes = sum(len(value.encode('utf-8')) for value in encoded.values())
+    return encode_ms, decode_ms, stored_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("deck", nargs="?", help="Optional .pptx to use instead of a generated deck")
+    parser.add_argument("--slides", type=int, default=60, help="Slides in the generated deck")
+    parser.add_argument("--rounds", type=int, default=50, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    deck_path = args.deck
+    if not deck_path:
+        deck_path = os.path.join(tempfile.mkdtemp(), "bench_deck.pptx")
+        build_deck(deck_path, args.slides)
+
+    payloads = {"ZD": zd_job_payload(deck_path), "WR": wr_job_payload(deck_path)}
+
+    print(f"\n{'job':<4} {'codec':<16} {'encode ms':>10} {'decode ms':>10} {'bytes':>10} {'ratio':>7}")
+    for job_type, payload in payloads.items():
+        baseline = None
+        for codec in available_codecs():
+            encode_ms, decode_ms, stored_bytes = bench(codec, payload, args.rounds)
+            baseline = baseline or stored_bytes
+            print(f"{job_type:<4} {codec.name:<16} {encode_ms:>10.3f} {decode_ms:>10.3f} "
+                  f"{stored_bytes:>10} {stored_bytes / baseline:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
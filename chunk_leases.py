@@ -0,0 +1,324 @@
+"""
+Chunk Leases
+------------
+A worker processing a chunk holds a short lease on it in storage. The
+lease is renewed by heartbeats (from the streaming loop and from a
+background thread covering every lease held by the process), so a chunk
+whose worker died is noticed within one lease TTL instead of minutes.
+
+Leases are indexed in a sorted set scored by expiry. One watcher per
+namespace (elected with a Redis lock, so only one process scans at a
+time) claims expired entries and hands them to the registered recovery
+callback, which re-enqueues the chunk; the scan runs periodically on the
+process's timer scheduler. Without Redis the same logic runs in-process.
+"""
+
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from timer_scheduler import timers
+
+LEASE_TTL = float(os.getenv('CHUNK_LEASE_TTL', '15'))
+LEASE_WATCH_INTERVAL = float(os.getenv('CHUNK_LEASE_WATCH_INTERVAL', '5'))
+LEASE_MAX_RECOVERIES = int(os.getenv('CHUNK_LEASE_MAX_RECOVERIES', '3'))
+
+# Take a lease if nobody holds it.
+# KEYS[1] = lease key, KEYS[2] = lease index ZSET,
+# ARGV[1] = token, ARGV[2] = TTL ms, ARGV[3] = expiry score, ARGV[4] = index member
+ACQUIRE_LEASE_SCRIPT = """
+if not redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 0
+end
+redis.call('zadd', KEYS[2], ARGV[3], ARGV[4])
+return 1
+"""
+
+# Extend a lease we still own (same keys and arguments as acquire)
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('pexpire', KEYS[1], ARGV[2])
+redis.call('zadd', KEYS[2], ARGV[3], ARGV[4])
+return 1
+"""
+
+# Drop a lease we still own. KEYS as above, ARGV[1] = token, ARGV[2] = index member
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('zrem', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Claim up to 100 expired index entries whose lease key is really gone.
+# KEYS[1] = lease index ZSET, ARGV[1] = now, ARGV[2] = lease key prefix
+CLAIM_EXPIRED_SCRIPT = """
+local members = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+local claimed = {}
+for _, member in ipairs(members) do
+    redis.call('zrem', KEYS[1], member)
+    if redis.call('exists', ARGV[2] .. member) == 0 then
+        table.insert(claimed, member)
+    end
+end
+return claimed
+"""
+
+# Become (or stay) the namespace's lease watcher.
+# KEYS[1] = lock key, ARGV[1] = token, ARGV[2] = TTL ms
+WATCHER_LOCK_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker finds that its chunk lease was taken over."""
+
+
+class ChunkLease:
+    """A held lease on one chunk."""
+
+    def __init__(self, manager: "LeaseManager", job_id: str, chunk_id: str, token: str):
+        self.manager = manager
+        self.job_id = job_id
+        self.chunk_id = chunk_id
+        self.token = token
+        self.lost = False
+        self.renewed_at = time.monotonic()
+
+    def heartbeat(self) -> bool:
+        """Renew the lease if a third of its TTL has passed; False once lost."""
+        if not self.lost and time.monotonic() - self.renewed_at >= self.manager.ttl / 3:
+            self.renew()
+        return not self.lost
+
+    def renew(self) -> bool:
+        if self.lost:
+            return False
+        if self.manager._renew(self):
+            self.renewed_at = time.monotonic()
+        else:
+            self.lost = True
+            print(f"[WARNING] Lost lease on chunk {self.chunk_id} of job {self.job_id}")
+        return not self.lost
+
+    def release(self) -> None:
+        self.manager._release(self)
+
+
+class LeaseManager:
+    """Chunk leases, heartbeats and the expired-lease watcher for one storage namespace."""
+
+    def __init__(self, storage, ttl: Optional[float] = None, watch_interval: Optional[float] = None):
+        self.storage = storage
+        self.ttl = LEASE_TTL if ttl is None else ttl
+        self.watch_interval = LEASE_WATCH_INTERVAL if watch_interval is None else watch_interval
+
+        namespace = storage.EVENT_CHANNEL.rsplit("_events", 1)[0]
+        self.LEASE_PREFIX = f"{namespace}_lease:"
+        self.LEASE_INDEX_KEY = f"{namespace}_leases"
+        self.WATCHER_LOCK_KEY = f"{namespace}_lease_watcher"
+
+        if storage.redis_available:
+            client = storage.redis_client
+            self._acquire_script = client.register_script(ACQUIRE_LEASE_SCRIPT)
+            self._renew_script = client.register_script(RENEW_LEASE_SCRIPT)
+            self._release_script = client.register_script(RELEASE_LEASE_SCRIPT)
+            self._claim_script = client.register_script(CLAIM_EXPIRED_SCRIPT)
+            self._watcher_lock_script = client.register_script(WATCHER_LOCK_SCRIPT)
+        else:
+            # member -> (token, expires_at)
+            self._memory_leases: Dict[str, Tuple[str, float]] = {}
+
+        self._lock = threading.Lock()
+        self._held: Dict[str, ChunkLease] = {}
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._watching = False
+        self._on_expired: Optional[Callable[[str, str], None]] = None
+        self._watcher_token = uuid.uuid4().hex
+
+        # Counters for diagnostics
+        self.acquired = 0
+        self.lost = 0
+        self.recovered = 0
+
+    # Leases
+    def acquire(self, job_id: str, chunk_id: str) -> Optional[ChunkLease]:
+        """Take the lease on a chunk, or None if another worker holds it."""
+        lease = ChunkLease(self, job_id, chunk_id, uuid.uuid4().hex)
+        try:
+            if self.storage.redis_available:
+                acquired = self._acquire_script(keys=self._keys(lease), args=self._args(lease))
+            else:
+                with self._lock:
+                    member = self._member(job_id, chunk_id)
+                    current = self._memory_leases.get(member)
+                    acquired = current is None or current[1] <= time.time()
+                    if acquired:
+                        self._memory_leases[member] = (lease.token, time.time() + self.ttl)
+        except Exception as e:
+            # Without a working store, processing must not stall on leases
+            print(f"[WARNING] Failed to acquire lease on chunk {chunk_id} of job {job_id}: {e}")
+            acquired = True
+
+        if not acquired:
+            return None
+        with self._lock:
+            self._held[lease.token] = lease
+            self.acquired += 1
+        self._start_heartbeat()
+        return lease
+
+    def is_held(self, job_id: str, chunk_id: str) -> bool:
+        """Whether any worker currently holds the chunk's lease."""
+        member = self._member(job_id, chunk_id)
+        try:
+            if self.storage.redis_available:
+                return bool(self.storage.redis_client.exists(f"{self.LEASE_PREFIX}{member}"))
+            with self._lock:
+                current = self._memory_leases.get(member)
+                return current is not None and current[1] > time.time()
+        except Exception as e:
+            print(f"[ERROR] Failed to check lease on chunk {chunk_id} of job {job_id}: {e}")
+            return True
+
+    def _renew(self, lease: ChunkLease) -> bool:
+        try:
+            if self.storage.redis_available:
+                renewed = bool(self._renew_script(keys=self._keys(lease), args=self._args(lease)))
+            else:
+                with self._lock:
+                    member = self._member(lease.job_id, lease.chunk_id)
+                    current = self._memory_leases.get(member)
+                    renewed = current is not None and current[0] == lease.token
+                    if renewed:
+                        self._memory_leases[member] = (lease.token, time.time() + self.ttl)
+        except Exception as e:
+            # Keep the lease on transient errors; it expires by itself if they persist
+            print(f"[WARNING] Failed to renew lease on chunk {lease.chunk_id}: {e}")
+            return True
+
+        if not renewed:
+            with self._lock:
+                self._held.pop(lease.token, None)
+                self.lost += 1
+        return renewed
+
+    def _release(self, lease: ChunkLease) -> None:
+        with self._lock:
+            self._held.pop(lease.token, None)
+        if lease.lost:
+            return
+        member = self._member(lease.job_id, lease.chunk_id)
+        try:
+            if self.storage.redis_available:
+                self._release_script(keys=self._keys(lease), args=[lease.token, member])
+            else:
+                with self._lock:
+                    current = self._memory_leases.get(member)
+                    if current is not None and current[0] == lease.token:
+                        del self._memory_leases[member]
+        except Exception as e:
+            print(f"[WARNING] Failed to release lease on chunk {lease.chunk_id}: {e}")
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat_thread is not None:
+                return
+            self._heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, name=f"{self.LEASE_INDEX_KEY}_heartbeat", daemon=True
+            )
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self) -> None:
+        """Keep every lease held by this process alive while the process is."""
+        while True:
+            time.sleep(self.ttl / 3)
+            with self._lock:
+                leases = list(self._held.values())
+            for lease in leases:
+                lease.heartbeat()
+
+    # Watcher
+    def watch(self, on_expired: Callable[[str, str], None]) -> None:
+        """Start the expired-lease watcher; ``on_expired(job_id, chunk_id)`` re-enqueues."""
+        with self._lock:
+            self._on_expired = on_expired
+            if self._watching:
+                return
+            self._watching = True
+        timers.call_every(self.watch_interval, self.check_expired, key=f"{self.LEASE_INDEX_KEY}_watcher")
+
+    def check_expired(self) -> int:
+        """Recover every chunk whose lease expired; returns how many were handed off."""
+        if self._on_expired is None or not self._is_watcher():
+            return 0
+
+        recovered = 0
+        for job_id, chunk_id in self._claim_expired():
+            try:
+                print(f"[WARNING] Lease on chunk {chunk_id} of job {job_id} expired, re-enqueueing")
+                self._on_expired(job_id, chunk_id)
+                recovered += 1
+            except Exception as e:
+                print(f"[ERROR] Failed to recover chunk {chunk_id} of job {job_id}: {e}")
+        self.recovered += recovered
+        return recovered
+
+    def _is_watcher(self) -> bool:
+        if not self.storage.redis_available:
+            return True
+        lock_ttl_ms = int(self.watch_interval * 3 * 1000)
+        return bool(self._watcher_lock_script(
+            keys=[self.WATCHER_LOCK_KEY], args=[self._watcher_token, lock_ttl_ms]
+        ))
+
+    def _claim_expired(self) -> List[Tuple[str, str]]:
+        now = time.time()
+        if self.storage.redis_available:
+            members = self._claim_script(keys=[self.LEASE_INDEX_KEY], args=[now, self.LEASE_PREFIX])
+        else:
+            with self._lock:
+                members = [member for member, (_, expires_at) in self._memory_leases.items() if expires_at <= now]
+                for member in members:
+                    del self._memory_leases[member]
+        return [tuple(member.split(":", 1)) for member in members]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "held": len(self._held),
+                "acquired": self.acquired,
+                "lost": self.lost,
+                "recovered": self.recovered,
+                "ttl": self.ttl,
+            }
+
+    # Keys
+    @staticmethod
+    def _member(job_id: str, chunk_id: str) -> str:
+        return f"{job_id}:{chunk_id}"
+
+    def _keys(self, lease: ChunkLease) -> List[str]:
+        return [f"{self.LEASE_PREFIX}{self._member(lease.job_id, lease.chunk_id)}", self.LEASE_INDEX_KEY]
+
+    def _args(self, lease: ChunkLease) -> List[object]:
+        return [
+            lease.token,
+            int(self.ttl * 1000),
+            time.time() + self.ttl,
+            self._member(lease.job_id, lease.chunk_id),
+        ]
@@ -0,0 +1,315 @@
+"""
+Chunk Scheduler
+---------------
+Fair-share ordering of chunk tasks across jobs, in front of the chunk
+executors (ZDThreadPoolManager and RedisWorkQueue).
+
+Every job has its own FIFO queue and jobs take turns in a weighted
+round-robin: a job of weight ``w`` gets up to ``w`` tasks per turn. A job
+never runs more than ``CHUNK_JOB_CONCURRENCY`` tasks at once, so a large
+deck cannot hold every worker while a small one waits behind it.
+Interactive work (retries and rechecks) goes to a priority lane that is
+served before the job queues and is not capped.
+
+``FairShareScheduler`` keeps the queues in-process; ``RedisFairShareScheduler``
+keeps them in Redis so the policy holds across every worker process.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Maximum chunks of one job running at once; 0 = one less than the pool
+# size, which keeps a worker free for other jobs
+CHUNK_JOB_CONCURRENCY = int(os.getenv('CHUNK_JOB_CONCURRENCY', '0'))
+
+# Recently finished chunks remembered per queue, for wait estimates
+CHUNK_DURATION_WINDOW = 50
+
+
+def job_concurrency_cap(max_workers: int) -> int:
+    """Per-job concurrency cap for a pool of ``max_workers``."""
+    if CHUNK_JOB_CONCURRENCY > 0:
+        return CHUNK_JOB_CONCURRENCY
+    return max(1, max_workers - 1)
+
+
+class FairShareScheduler:
+    """In-process fair-share task queue (see module docstring)."""
+
+    def __init__(self, job_cap: int):
+        self.job_cap = job_cap
+        self._lock = threading.Lock()
+        self._priority: Deque[Tuple[str, Any]] = deque()
+        self._queues: Dict[str, Deque[Any]] = {}
+        self._ring: Deque[str] = deque()  # jobs with queued tasks, in turn order
+        self._weights: Dict[str, int] = {}
+        self._credit: Dict[str, int] = {}  # tasks left in the current turn
+        self._running: Dict[str, int] = {}
+
+    def push(self, job_id: str, task: Any, priority: bool = False, weight: int = 1) -> None:
+        with self._lock:
+            if priority:
+                self._priority.append((job_id, task))
+                return
+            queue = self._queues.get(job_id)
+            if queue is None:
+                queue = self._queues[job_id] = deque()
+                self._ring.append(job_id)
+            queue.append(task)
+            self._weights[job_id] = max(1, int(weight))
+
+    def pop(self) -> Optional[Tuple[str, Any]]:
+        """Next task to run as ``(job_id, task)``, or None; counts it as running."""
+        with self._lock:
+            if self._priority:
+                job_id, task = self._priority.popleft()
+                self._running[job_id] = self._running.get(job_id, 0) + 1
+                return job_id, task
+
+            for _ in range(len(self._ring)):
+                job_id = self._ring[0]
+                if self._running.get(job_id, 0) >= self.job_cap:
+                    self._ring.rotate(-1)
+                    continue
+
+                queue = self._queues[job_id]
+                task = queue.popleft()
+                if not queue:
+                    self._ring.popleft()
+                    del self._queues[job_id]
+                    self._weights.pop(job_id, None)
+                    self._credit.pop(job_id, None)
+                else:
+                    credit = self._credit.get(job_id, self._weights[job_id]) - 1
+                    if credit <= 0:
+                        self._credit.pop(job_id, None)
+                        self._ring.rotate(-1)
+                    else:
+                        self._credit[job_id] = credit
+                self._running[job_id] = self._running.get(job_id, 0) + 1
+                return job_id, task
+            return None
+
+    def drop_job(self, job_id: str) -> List[Any]:
+        """Remove every queued task of a job (priority lane included); returns them."""
+        with self._lock:
+            dropped = list(self._queues.pop(job_id, ()))
+            if job_id in self._ring:
+                self._ring.remove(job_id)
+            self._weights.pop(job_id, None)
+            self._credit.pop(job_id, None)
+            kept: Deque[Tuple[str, Any]] = deque()
+            for entry in self._priority:
+                if entry[0] == job_id:
+                    dropped.append(entry[1])
+                else:
+                    kept.append(entry)
+            self._priority = kept
+            return dropped
+
+    def done(self, job_id: str) -> None:
+        """A task popped for ``job_id`` finished."""
+        with self._lock:
+            running = self._running.get(job_id, 0) - 1
+            if running > 0:
+                self._running[job_id] = running
+            else:
+                self._running.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_cap": self.job_cap,
+                "jobs_waiting": len(self._ring),
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "priority_waiting": len(self._priority),
+                "running_by_job": dict(self._running),
+            }
+
+
+# Queue a task. KEYS[1] = job ring, KEYS[2] = job queue, KEYS[3] = priority
+# lane, KEYS[4] = weights, KEYS[5] = wake-up list; ARGV[1] = job id,
+# ARGV[2] = task (JSON list of stream fields), ARGV[3] = '1' for priority,
+# ARGV[4] = weight, ARGV[5] = wake-up list cap
+ENQUEUE_TASK_SCRIPT = """
+if ARGV[3] == '1' then
+    redis.call('rpush', KEYS[3], ARGV[2])
+else
+    if redis.call('rpush', KEYS[2], ARGV[2]) == 1 then
+        redis.call('rpush', KEYS[1], ARGV[1])
+    end
+    redis.call('hset', KEYS[4], ARGV[1], ARGV[4])
+end
+redis.call('lpush', KEYS[5], 1)
+redis.call('ltrim', KEYS[5], 0, tonumber(ARGV[5]) - 1)
+return 1
+"""
+
+# Move the next task by the fair-share policy onto the stream; returns its
+# message id, or false when nothing may run. KEYS[1] = job ring, KEYS[2] =
+# priority lane, KEYS[3] = running counts, KEYS[4] = weights, KEYS[5] =
+# credits, KEYS[6] = stream; ARGV[1] = job queue key prefix, ARGV[2] = cap
+DISPATCH_TASK_SCRIPT = """
+local task = redis.call('lpop', KEYS[2])
+if not task then
+    for _ = 1, redis.call('llen', KEYS[1]) do
+        local job = redis.call('lindex', KEYS[1], 0)
+        if not job then
+            break
+        end
+        local queue = ARGV[1] .. job
+        if tonumber(redis.call('hget', KEYS[3], job) or '0') >= tonumber(ARGV[2]) then
+            redis.call('rpush', KEYS[1], redis.call('lpop', KEYS[1]))
+        else
+            task = redis.call('lpop', queue)
+            if redis.call('llen', queue) == 0 then
+                redis.call('lpop', KEYS[1])
+                redis.call('hdel', KEYS[4], job)
+                redis.call('hdel', KEYS[5], job)
+            else
+                local credit = tonumber(redis.call('hget', KEYS[5], job) or redis.call('hget', KEYS[4], job) or '1') - 1
+                if credit <= 0 then
+                    redis.call('hdel', KEYS[5], job)
+                    redis.call('rpush', KEYS[1], redis.call('lpop', KEYS[1]))
+                else
+                    redis.call('hset', KEYS[5], job, credit)
+                end
+            end
+            if task then
+                break
+            end
+        end
+    end
+end
+if not task then
+    return false
+end
+local fields = cjson.decode(task)
+for i = 1, #fields, 2 do
+    if fields[i] == 'job_id' then
+        redis.call('hincrby', KEYS[3], fields[i + 1], 1)
+    end
+end
+return redis.call('xadd', KEYS[6], '*', unpack(fields))
+"""
+
+# Remove every queued task of a job; returns how many. KEYS[1] = job ring,
+# KEYS[2] = job queue, KEYS[3] = priority lane, KEYS[4] = weights, KEYS[5] =
+# credits; ARGV[1] = job id
+DROP_JOB_SCRIPT = """
+local dropped = redis.call('llen', KEYS[2])
+redis.call('del', KEYS[2])
+redis.call('lrem', KEYS[1], 0, ARGV[1])
+redis.call('hdel', KEYS[4], ARGV[1])
+redis.call('hdel', KEYS[5], ARGV[1])
+local kept = {}
+for _, task in ipairs(redis.call('lrange', KEYS[3], 0, -1)) do
+    local fields = cjson.decode(task)
+    local mine = false
+    for i = 1, #fields, 2 do
+        if fields[i] == 'job_id' and fields[i + 1] == ARGV[1] then
+            mine = true
+        end
+    end
+    if mine then
+        dropped = dropped + 1
+    else
+        kept[#kept + 1] = task
+    end
+end
+if #kept < redis.call('llen', KEYS[3]) then
+    redis.call('del', KEYS[3])
+    if #kept > 0 then
+        redis.call('rpush', KEYS[3], unpack(kept))
+    end
+end
+return dropped
+"""
+
+# A dispatched task finished. KEYS[1] = running counts, ARGV[1] = job id
+RELEASE_TASK_SCRIPT = """
+if redis.call('hincrby', KEYS[1], ARGV[1], -1) <= 0 then
+    redis.call('hdel', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# Pending wake-ups kept for idle consumers
+WAKE_LIST_CAP = 100
+
+
+class RedisFairShareScheduler:
+    """Fair-share task queue in Redis, shared by every process of a namespace."""
+
+    def __init__(self, redis_client, namespace: str, job_cap: int):
+        self.redis_client = redis_client
+        self.job_cap = job_cap
+        self.RING_KEY = f"{namespace}_sched_jobs"
+        self.JOB_QUEUE_PREFIX = f"{namespace}_sched_job:"
+        self.PRIORITY_KEY = f"{namespace}_sched_priority"
+        self.RUNNING_KEY = f"{namespace}_sched_running"
+        self.WEIGHTS_KEY = f"{namespace}_sched_weights"
+        self.CREDIT_KEY = f"{namespace}_sched_credit"
+        self.WAKE_KEY = f"{namespace}_sched_wake"
+
+        self._enqueue_script = redis_client.register_script(ENQUEUE_TASK_SCRIPT)
+        self._dispatch_script = redis_client.register_script(DISPATCH_TASK_SCRIPT)
+        self._release_script = redis_client.register_script(RELEASE_TASK_SCRIPT)
+        self._drop_job_script = redis_client.register_script(DROP_JOB_SCRIPT)
+
+    def push(self, fields: Dict[str, Any], priority: bool = False, weight: int = 1, client=None) -> None:
+        """Queue a task given as its stream fields (``job_id`` included)."""
+        job_id = fields["job_id"]
+        flat: List[str] = []
+        for key, value in fields.items():
+            flat.extend([key, str(value)])
+        self._enqueue_script(
+            keys=[self.RING_KEY, f"{self.JOB_QUEUE_PREFIX}{job_id}", self.PRIORITY_KEY,
+                  self.WEIGHTS_KEY, self.WAKE_KEY],
+            args=[job_id, json.dumps(flat), "1" if priority else "0", max(1, int(weight)), WAKE_LIST_CAP],
+            client=client,
+        )
+
+    def dispatch(self, stream_key: str) -> Optional[str]:
+        """Move the next task onto ``stream_key``; its message id, or None."""
+        message_id = self._dispatch_script(
+            keys=[self.RING_KEY, self.PRIORITY_KEY, self.RUNNING_KEY, self.WEIGHTS_KEY,
+                  self.CREDIT_KEY, stream_key],
+            args=[self.JOB_QUEUE_PREFIX, self.job_cap],
+        )
+        return message_id or None
+
+    def drop_job(self, job_id: str) -> int:
+        """Remove every queued task of a job (priority lane included); returns how many."""
+        return int(self._drop_job_script(
+            keys=[self.RING_KEY, f"{self.JOB_QUEUE_PREFIX}{job_id}", self.PRIORITY_KEY,
+                  self.WEIGHTS_KEY, self.CREDIT_KEY],
+            args=[job_id],
+        ))
+
+    def release(self, job_id: str, client=None) -> None:
+        """A dispatched task of ``job_id`` finished (pass a pipeline to batch it)."""
+        self._release_script(keys=[self.RUNNING_KEY], args=[job_id], client=client)
+
+    def wait(self, timeout: float) -> None:
+        """Block until a task is queued or ``timeout`` seconds pass."""
+        self.redis_client.blpop([self.WAKE_KEY], timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        jobs = self.redis_client.lrange(self.RING_KEY, 0, -1)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job_id in jobs:
+            pipe.llen(f"{self.JOB_QUEUE_PREFIX}{job_id}")
+        pipe.llen(self.PRIORITY_KEY)
+        pipe.hgetall(self.RUNNING_KEY)
+        results = pipe.execute()
+        return {
+            "job_cap": self.job_cap,
+            "jobs_waiting": len(jobs),
+            "waiting": sum(results[:-2]),
+            "priority_waiting": results[-2],
+            "running_by_job": {job_id: int(count) for job_id, count in results[-1].items()},
+        }
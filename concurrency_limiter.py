@@ -0,0 +1,245 @@
+"""
+Adaptive LLM Concurrency
+------------------------
+AIMD concurrency limits per (provider, model), shared by every LLM call in
+the process (ZD chunks, WR chunks, transcript summaries).
+
+Each successful request raises the limit by ``1 / limit`` (about one slot
+per round of requests). Rate-limit responses (429) and timeouts halve it;
+a ``Retry-After`` header also holds new requests back until it passes.
+Responses much slower than the observed baseline stop the growth and
+shrink the limit by one, so a slowing gateway is not pushed harder.
+"""
+
+import asyncio
+import email.utils
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+
+LLM_CONCURRENCY_INITIAL = float(os.getenv('LLM_CONCURRENCY_INITIAL', '4'))
+LLM_CONCURRENCY_MIN = float(os.getenv('LLM_CONCURRENCY_MIN', '1'))
+LLM_CONCURRENCY_MAX = float(os.getenv('LLM_CONCURRENCY_MAX', '16'))
+
+# Multiplicative decrease on rate limits and timeouts
+BACKOFF_FACTOR = 0.5
+
+# A response slower than this multiple of the baseline latency (and at least
+# LATENCY_MIN_EXCESS seconds over it) counts as congestion
+LATENCY_TOLERANCE = 2.0
+LATENCY_MIN_EXCESS = 1.0
+
+# Longest Retry-After honored, in seconds
+MAX_RETRY_AFTER = 120.0
+
+# How often coroutines waiting in slot_async look for a free slot
+ASYNC_POLL_INTERVAL = 0.05
+
+# Every limiter in this process, for health reporting
+_limiters: Dict[Tuple[str, str], "AdaptiveConcurrencyLimiter"] = {}
+_limiters_lock = threading.Lock()
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by a provider error's Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return min(float(value) / 1000, MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(seconds, MAX_RETRY_AFTER))
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """``rate_limited``, ``timeout`` or None for errors that say nothing about load."""
+    if isinstance(error, openai.RateLimitError) or getattr(error, "status_code", None) == 429:
+        return "rate_limited"
+    if isinstance(error, (openai.APITimeoutError, TimeoutError)):
+        return "timeout"
+    if getattr(error, "status_code", None) in (408, 503, 504):
+        return "timeout"
+    return None
+
+
+class LimiterSlot:
+    """One request's hold on a limiter slot; use as a context manager."""
+
+    def __init__(self, limiter: "AdaptiveConcurrencyLimiter", waited: float):
+        self.limiter = limiter
+        self.waited = waited
+        self.acquired_at = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def started(self) -> None:
+        """Record the response latency (call once the response has started)."""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.acquired_at
+
+    def __enter__(self) -> "LimiterSlot":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.limiter._release(self, exc)
+        return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit for one (provider, model)."""
+
+    def __init__(self, name: str, initial: float = LLM_CONCURRENCY_INITIAL,
+                 min_limit: float = LLM_CONCURRENCY_MIN, max_limit: float = LLM_CONCURRENCY_MAX):
+        self.name = name
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.blocked_until = 0.0
+        self.baseline_latency: Optional[float] = None
+        self.last_latency: Optional[float] = None
+        self._last_decrease = {"overload": 0.0, "slow": 0.0}
+
+        # Counters for diagnostics
+        self.successes = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+
+    def slot(self) -> LimiterSlot:
+        """Wait for a free slot (and any Retry-After to pass) and take it."""
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.time()
+                    if now < self.blocked_until:
+                        self._cond.wait(self.blocked_until - now)
+                    elif self.in_flight >= int(self.limit):
+                        self._cond.wait(1.0)
+                    else:
+                        break
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+        return LimiterSlot(self, time.monotonic() - start)
+
+    async def slot_async(self) -> LimiterSlot:
+        """``slot`` for coroutines: waits without blocking the event loop."""
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    now = time.time()
+                    if now < self.blocked_until:
+                        delay = self.blocked_until - now
+                    elif self.in_flight >= int(self.limit):
+                        delay = ASYNC_POLL_INTERVAL
+                    else:
+                        self.in_flight += 1
+                        break
+                await asyncio.sleep(delay)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+        return LimiterSlot(self, time.monotonic() - start)
+
+    def _release(self, slot: LimiterSlot, error: Optional[BaseException]) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if error is None:
+                self._on_success(slot.latency)
+            else:
+                kind = classify_error(error)
+                if kind is not None:
+                    self._on_overload(kind, retry_after_seconds(error))
+            self._cond.notify_all()
+
+    def _on_success(self, latency: Optional[float]) -> None:
+        self.successes += 1
+        if latency is not None:
+            self.last_latency = latency
+            if self.baseline_latency is None or latency < self.baseline_latency:
+                self.baseline_latency = latency
+            else:
+                # Let the baseline follow lasting changes slowly
+                self.baseline_latency += (latency - self.baseline_latency) * 0.01
+            if (latency > self.baseline_latency * LATENCY_TOLERANCE
+                    and latency - self.baseline_latency > LATENCY_MIN_EXCESS):
+                self._decrease("slow", self.limit - 1)
+                return
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_overload(self, kind: str, retry_after: Optional[float]) -> None:
+        if kind == "rate_limited":
+            self.rate_limited += 1
+        else:
+            self.timeouts += 1
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+        self._decrease("overload", self.limit * BACKOFF_FACTOR)
+        print(f"[WARNING] LLM {kind.replace('_', ' ')} on {self.name}, concurrency limit now {int(self.limit)}"
+              + (f", holding requests for {retry_after:.0f}s" if retry_after else ""))
+
+    def _decrease(self, reason: str, limit: float) -> None:
+        # Requests already in flight report the same overload; count it once
+        # per baseline round-trip
+        now = time.monotonic()
+        if now - self._last_decrease[reason] < max(1.0, self.baseline_latency or 0.0):
+            return
+        self._last_decrease[reason] = now
+        self.limit = max(self.min_limit, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "blocked_for": round(max(0.0, self.blocked_until - time.time()), 1),
+                "baseline_latency": round(self.baseline_latency, 3) if self.baseline_latency is not None else None,
+                "last_latency": round(self.last_latency, 3) if self.last_latency is not None else None,
+                "successes": self.successes,
+                "rate_limited": self.rate_limited,
+                "timeouts": self.timeouts,
+            }
+
+
+def llm_limiter(provider: str, model: str) -> AdaptiveConcurrencyLimiter:
+    """The process-wide limiter for a (provider, model)."""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveConcurrencyLimiter(f"{provider}/{model}")
+        return limiter
+
+
+def all_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every LLM concurrency limiter in this process."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
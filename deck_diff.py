@@ -0,0 +1,105 @@
+"""
+Incremental Re-runs
+-------------------
+Re-running a revised deck against the job of its previous version. Each
+slide's extracted content is fingerprinted (tagline and body for ZD,
+elements for WR; page numbers are left out, so slides that merely moved
+still match) and compared with the previous job's slides:
+
+- chunks that contain a new or changed slide are sent to the model again;
+- every other chunk is completed straight away with the previous job's
+  result rows for its slides, renumbered to their new pages (a slide in
+  several overlapping chunks is carried by the first of them only).
+
+The merge then combines both as usual. Findings that refer to another
+page by number keep the number they had in the previous version.
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, List
+
+
+def slide_fingerprint(content: Any) -> str:
+    """Hash of a slide's reviewable content (any JSON-serializable value)."""
+    material = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def chunk_fingerprints(chunks: List[Dict[str, Any]], slides_key: str, page_key: str,
+                       content: Callable[[Dict[str, Any]], Any]) -> Dict[int, str]:
+    """Fingerprints by page number of the slides in ``chunks`` (overlaps count once)."""
+    fingerprints = {}
+    for chunk in chunks:
+        for slide in chunk.get(slides_key) or []:
+            fingerprints[slide[page_key]] = slide_fingerprint(content(slide))
+    return fingerprints
+
+
+class IncrementalPlan:
+    """Which chunks of a re-run go to the model, and the rows carried over for the rest."""
+
+    def __init__(self, previous: Dict[int, str], current: Dict[int, str]):
+        # Current page -> previous page of the same, unchanged slide. A slide
+        # that kept its page number is preferred over a moved copy.
+        self.page_map: Dict[int, int] = {}
+        unmatched: Dict[str, List[int]] = {}
+        for page, fingerprint in sorted(previous.items()):
+            if current.get(page) == fingerprint:
+                self.page_map[page] = page
+            else:
+                unmatched.setdefault(fingerprint, []).append(page)
+        for page, fingerprint in sorted(current.items()):
+            if page not in self.page_map and unmatched.get(fingerprint):
+                self.page_map[page] = unmatched[fingerprint].pop(0)
+        self.changed_pages = sorted(page for page in current if page not in self.page_map)
+
+        self.run_chunks: List[Dict[str, Any]] = []
+        self.carried: Dict[str, List[Dict[str, Any]]] = {}
+
+    def split(self, chunks: List[Dict[str, Any]], previous_rows: List[Dict[str, Any]], page_field: str) -> None:
+        """Sort ``chunks`` into ``run_chunks`` and ``carried`` (chunk id -> rows)."""
+        rows_by_page: Dict[int, List[Dict[str, Any]]] = {}
+        for row in previous_rows:
+            rows_by_page.setdefault(row.get(page_field), []).append(row)
+
+        # Overlapping chunks share pages; each page's rows are carried by the
+        # first chunk that contains it, or the merge would see them twice
+        assigned = set()
+        for chunk in chunks:
+            pages = chunk["page_numbers"]
+            if any(page not in self.page_map for page in pages):
+                self.run_chunks.append(chunk)
+                continue
+            self.carried[chunk["chunk_id"]] = [
+                {**row, page_field: page}
+                for page in pages if page not in assigned
+                for row in rows_by_page.get(self.page_map[page], [])
+            ]
+            assigned.update(pages)
+
+    def job_fields(self, previous_job_id: str) -> Dict[str, Any]:
+        """Fields to store in the new job."""
+        return {
+            "previous_job_id": previous_job_id,
+            "changed_pages": self.changed_pages,
+            "reused_pages": len(self.page_map),
+            "chunks_reused": len(self.carried),
+        }
+
+
+def plan_rerun(previous_chunks: List[Dict[str, Any]], previous_rows: List[Dict[str, Any]],
+               chunks: List[Dict[str, Any]], slides_key: str, page_key: str, page_field: str,
+               content: Callable[[Dict[str, Any]], Any]) -> IncrementalPlan:
+    """Plan a re-run of ``chunks`` against a previous job's chunks and final rows.
+
+    ``slides_key``/``page_key`` locate the slides in a chunk and their page
+    number, ``page_field`` is the page number of a result row and
+    ``content`` picks the part of a slide that is reviewed.
+    """
+    plan = IncrementalPlan(
+        chunk_fingerprints(previous_chunks, slides_key, page_key, content),
+        chunk_fingerprints(chunks, slides_key, page_key, content),
+    )
+    plan.split(chunks, previous_rows, page_field)
+    return plan
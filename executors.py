@@ -0,0 +1,194 @@
+"""
+Managed Executors
+-----------------
+Named, bounded thread pools for the app's background work, instead of a
+new thread per request. Each workload class has its own pool, so a burst
+of one kind of work cannot starve the others, and the thread count stays
+bounded:
+
+- ``transcription``: audio transcriptions
+- ``summary``: transcript summaries
+- ``jobs``: ZD/WR job setup (parsing, chunking, submitting chunks)
+- ``maintenance``: timer callbacks, i.e. delayed cleanup and periodic
+  sweeps (one worker, see ``timer_scheduler``)
+- ``llm_io``: storage writes of the chunks streaming on the LLM engine
+  (see ``llm_engine``)
+
+Pool sizes default to ``POOL_DEFAULTS`` and can be set with
+``EXECUTOR_<NAME>_WORKERS``. A pool whose queue is full rejects new work
+with ``ExecutorFullError``. On interpreter exit every pool stops taking
+work and drains its queue for up to ``EXECUTOR_DRAIN_TIMEOUT`` seconds.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# name -> (workers, queue limit)
+POOL_DEFAULTS: Dict[str, Tuple[int, int]] = {
+    "transcription": (4, 100),
+    "summary": (4, 100),
+    "jobs": (4, 200),
+    "maintenance": (1, 10000),
+    "llm_io": (8, 10000),
+}
+
+EXECUTOR_DRAIN_TIMEOUT = float(os.getenv('EXECUTOR_DRAIN_TIMEOUT', '30'))
+
+_executors: Dict[str, "ManagedExecutor"] = {}
+_executors_lock = threading.Lock()
+
+
+class ExecutorFullError(RuntimeError):
+    """Raised when a pool's queue is full (or the pool is shutting down)."""
+
+
+class ManagedExecutor:
+    """Bounded thread pool with queue metrics and drain on shutdown."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = 0):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[Optional[Tuple[Future, Callable, tuple, dict, float]]]" = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._idle = 0
+        # Tasks queued and not yet taken by a worker (updated with _idle)
+        self._pending = 0
+        # Set when the pool starts draining; long waits inside tasks should use it
+        self.stopping = threading.Event()
+
+        # Counters for diagnostics
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queued = 0
+        self.queue_wait_total = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue ``fn(*args, **kwargs)``; raises ExecutorFullError when the queue is full."""
+        future: Future = Future()
+        with self._lock:
+            if self.stopping.is_set():
+                self.rejected += 1
+                raise ExecutorFullError(f"Executor {self.name} is shutting down")
+            try:
+                self._queue.put_nowait((future, fn, args, kwargs, time.monotonic()))
+            except queue.Full:
+                self.rejected += 1
+                raise ExecutorFullError(f"Executor {self.name} queue is full ({self.max_queue} tasks)")
+            self.submitted += 1
+            self.max_queued = max(self.max_queued, self._queue.qsize())
+            # Workers count as idle until they take a task, so a burst needs
+            # a thread for every task beyond the ones already waiting
+            self._pending += 1
+            if self._pending > self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._work, name=f"{self.name}_{len(self._threads)}", daemon=True
+                )
+                self._threads.append(thread)
+                self._idle += 1
+                thread.start()
+        return future
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, queued_at = item
+            with self._lock:
+                self._idle -= 1
+                self._pending -= 1
+                self.running += 1
+                self.queue_wait_total += time.monotonic() - queued_at
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    print(f"[ERROR] Task in executor {self.name} failed: {e}")
+                    future.set_exception(e)
+
+            with self._lock:
+                self.running -= 1
+                self._idle += 1
+                if future.cancelled() or future.exception() is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None) -> bool:
+        """Stop taking work and let queued tasks finish; False if ``timeout`` ran out first."""
+        with self._lock:
+            self.stopping.set()
+            threads = list(self._threads)
+        for _ in threads:
+            # Blocks only while the queue is full, which drains as workers run
+            self._queue.put(None)
+        if not wait:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+        return not any(thread.is_alive() for thread in threads)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self.completed + self.failed + self.running
+            return {
+                "workers": len(self._threads),
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": self._queue.qsize(),
+                "max_queued": self.max_queued,
+                "queue_limit": self.max_queue,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "mean_queue_wait": round(self.queue_wait_total / started, 3) if started else 0.0,
+            }
+
+
+def get_executor(name: str) -> ManagedExecutor:
+    """The process's pool for a workload class, created on first use."""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            workers, max_queue = POOL_DEFAULTS.get(name, (4, 100))
+            workers = int(os.getenv(f'EXECUTOR_{name.upper()}_WORKERS', workers))
+            executor = _executors[name] = ManagedExecutor(name, workers, max_queue)
+        return executor
+
+
+def all_executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every managed executor in this process."""
+    with _executors_lock:
+        executors = list(_executors.values())
+    return {executor.name: executor.stats() for executor in executors}
+
+
+def shutdown_executors(timeout: float = EXECUTOR_DRAIN_TIMEOUT) -> None:
+    """Drain every pool, sharing ``timeout`` seconds between them."""
+    with _executors_lock:
+        executors = list(_executors.values())
+    for executor in executors:
+        executor.stopping.set()
+
+    deadline = time.monotonic() + timeout
+    for executor in executors:
+        if not executor.shutdown(wait=True, timeout=max(0.0, deadline - time.monotonic())):
+            print(f"[WARNING] Executor {executor.name} did not drain within {timeout:.0f}s")
+
+
+atexit.register(shutdown_executors)
@@ -0,0 +1,129 @@
+"""
+Job State Cache
+---------------
+Process-local read-through cache of job data and chunk results, kept
+coherent across gunicorn workers with the per-job change versions published
+by job storage (see job_events).
+
+An entry is the job snapshot read at a given version. It is served from
+memory while it is current:
+
+- the version is at least the newest one this process has seen (from
+  change events, including its own writes), and
+- it was verified against Redis within ``JOB_CACHE_MAX_AGE`` seconds, or
+  since the event listener (re)connected.
+
+Otherwise the version is re-read (one small GET) and the snapshot is only
+reloaded when it actually changed. Without Redis the storage is already
+local and reads go straight to it.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from memory_store import BoundedTTLStore
+
+# Upper bound on how long an entry is trusted on events alone
+JOB_CACHE_MAX_AGE = float(os.getenv('JOB_CACHE_MAX_AGE', '30'))
+
+
+class _CacheEntry:
+    __slots__ = ("version", "job", "chunks", "verified_at")
+
+    def __init__(self, version: int, job: Optional[Dict[str, Any]], chunks: Dict[str, Any]):
+        self.version = version
+        self.job = job
+        self.chunks = chunks
+        self.verified_at = time.time()
+
+
+class JobStateCache:
+    """Versioned read-through cache in front of a PersistentJobStorage.
+
+    Returned dicts are copies, so callers may add fields to them freely.
+    """
+
+    def __init__(self, storage, max_age: Optional[float] = None):
+        self.storage = storage
+        self.max_age = JOB_CACHE_MAX_AGE if max_age is None else max_age
+        self._entries = BoundedTTLStore(f"{storage.EVENT_CHANNEL}_state_cache", ttl=storage.JOB_TTL)
+        self._lock = threading.Lock()
+
+        # Counters for diagnostics
+        self.hits = 0
+        self.verified_hits = 0
+        self.reloads = 0
+
+        if storage.redis_available:
+            storage.events.start()
+
+    def get_state(self, job_id: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Job data (None if missing) and chunk results of a job."""
+        if not self.storage.redis_available:
+            _, job, chunks = self.storage.get_job_state(job_id)
+            return self._copy(job, chunks)
+
+        entry = self._entries.get(job_id)
+        if entry is not None and not self._is_current(job_id, entry):
+            # Cheap check before reloading everything
+            if self.storage.get_version(job_id) == entry.version:
+                entry.verified_at = time.time()
+                self.verified_hits += 1
+            else:
+                entry = None
+        elif entry is not None:
+            self.hits += 1
+
+        if entry is None:
+            entry = self._load(job_id)
+        return self._copy(entry.job, entry.chunks)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_state(job_id)[0]
+
+    def get_chunk_results(self, job_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.get_state(job_id)[1]
+
+    def get_chunk_result(self, job_id: str, chunk_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_state(job_id)[1].get(chunk_id)
+
+    def invalidate(self, job_id: str) -> None:
+        self._entries.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "verified_hits": self.verified_hits,
+            "reloads": self.reloads,
+            "max_age": self.max_age,
+        }
+
+    def _is_current(self, job_id: str, entry: _CacheEntry) -> bool:
+        connected_since = self.storage.events.connected_since
+        return (
+            connected_since is not None
+            and entry.verified_at > connected_since
+            and time.time() - entry.verified_at < self.max_age
+            and entry.version >= self.storage.events.latest_version(job_id)
+        )
+
+    def _load(self, job_id: str) -> _CacheEntry:
+        version, job, chunks = self.storage.get_job_state(job_id)
+        entry = _CacheEntry(version, job, chunks)
+        with self._lock:
+            current = self._entries.get(job_id)
+            # Never replace a newer snapshot loaded concurrently
+            if current is None or current.version <= version:
+                self._entries[job_id] = entry
+        self.reloads += 1
+        return entry
+
+    @staticmethod
+    def _copy(job: Optional[Dict[str, Any]], chunks: Dict[str, Any]):
+        return (
+            dict(job) if job is not None else None,
+            {chunk_id: dict(chunk) for chunk_id, chunk in chunks.items()},
+        )
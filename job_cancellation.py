@@ -0,0 +1,107 @@
+"""
+Job Cancellation
+----------------
+Cooperative cancellation of ZD and WR jobs. ``cancel`` marks the job in
+storage (its ``cancel_requested`` field) and closes the LLM response
+streams this process has open for it (see ``track``), which ends their
+streaming loops at once and frees the workers.
+
+Chunks check ``is_cancelled`` before they start and between streamed
+tokens, so chunks running in other processes (e.g. worker.py) stop within
+``JOB_CANCEL_CHECK_INTERVAL`` seconds of their next token. The flag is
+cached per process; storage is read at most once per interval per job.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from memory_store import BoundedTTLStore
+
+JOB_CANCEL_CHECK_INTERVAL = float(os.getenv('JOB_CANCEL_CHECK_INTERVAL', '1'))
+
+
+class JobCancelledError(Exception):
+    """Raised inside a chunk whose job was cancelled."""
+
+
+class CancellationRegistry:
+    """Cancel flags and open response streams of one storage namespace."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._cancelled = BoundedTTLStore(f"{storage.namespace}_cancelled", ttl=storage.JOB_TTL)
+        self._checked_at: Dict[str, float] = {}
+        self._streams: Dict[str, List[Any]] = {}
+
+        # Counters for diagnostics
+        self.jobs_cancelled = 0
+        self.streams_closed = 0
+
+    def cancel(self, job_id: str) -> int:
+        """Flag the job as cancelled and close its open streams; returns how many were closed."""
+        self._cancelled[job_id] = True
+        self.storage.update_job(job_id, {"cancel_requested": True, "last_update": time.time()})
+        with self._lock:
+            streams = self._streams.pop(job_id, [])
+        for stream in streams:
+            try:
+                stream.close()
+            except Exception as e:
+                print(f"[WARNING] Failed to close a stream of cancelled job {job_id}: {e}")
+        self.jobs_cancelled += 1
+        self.streams_closed += len(streams)
+        return len(streams)
+
+    def is_cancelled(self, job_id: str) -> bool:
+        cancelled = self.cached(job_id)
+        return self.refresh(job_id) if cancelled is None else cancelled
+
+    def cached(self, job_id: str) -> Optional[bool]:
+        """The flag as known to this process, or None when storage is due to be
+        read (``refresh``); never blocks, so coroutines can call it per token."""
+        if self._cancelled.get(job_id):
+            return True
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._checked_at.get(job_id)
+            if checked_at is not None and now - checked_at < JOB_CANCEL_CHECK_INTERVAL:
+                return False
+            self._checked_at[job_id] = now
+        return None
+
+    def refresh(self, job_id: str) -> bool:
+        """Read the job's cancel flag from storage."""
+        if self.storage.get_job_fields(job_id, ["cancel_requested"]).get("cancel_requested"):
+            self._cancelled[job_id] = True
+            return True
+        return False
+
+    @contextmanager
+    def track(self, job_id: str, stream: Any) -> Iterator[Any]:
+        """Keep ``stream`` (anything with ``close()``) open until the block
+        ends or the job is cancelled."""
+        with self._lock:
+            self._streams.setdefault(job_id, []).append(stream)
+        try:
+            yield stream
+        finally:
+            with self._lock:
+                streams = self._streams.get(job_id)
+                if streams and stream in streams:
+                    streams.remove(stream)
+                if not streams:
+                    self._streams.pop(job_id, None)
+                    self._checked_at.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_streams = sum(len(streams) for streams in self._streams.values())
+        return {
+            "open_streams": open_streams,
+            "jobs_cancelled": self.jobs_cancelled,
+            "streams_closed": self.streams_closed,
+        }
@@ -0,0 +1,203 @@
+"""
+Job Change Events
+-----------------
+Compact change notifications published by job storage on every write::
+
+    {"version": 7, "job_id": "...", "chunk_id": "ck_0001" | null, "fields": ["status", ...]}
+
+``version`` increases with every change of a job (across all workers), so a
+subscriber can tell whether its copy of the job is current. The bus also
+remembers the latest version it has seen per job (``latest_version``),
+which the job state cache uses to validate its entries. A ``fields``
+value of ``["*"]`` means the whole job changed (created or deleted).
+
+With Redis, events travel over pub/sub so every worker sees writes made by
+any other worker; one listener thread per bus relays them to the local
+subscribers. Without Redis, events are delivered within this process.
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from memory_store import BoundedTTLStore
+
+# Wildcard field list for events that affect the whole job
+ALL_FIELDS = ["*"]
+
+
+class Subscription:
+    """Queue of change events for one subscriber (optionally a single job).
+
+    If the subscriber falls behind and its queue fills up, further events
+    are dropped and ``lagged`` is set; the subscriber should re-read the job.
+    """
+
+    def __init__(self, bus: "JobEventBus", job_id: Optional[str] = None, max_queue: int = 1000):
+        self.bus = bus
+        self.job_id = job_id
+        self.lagged = False
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if none arrived within ``timeout`` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while not self.closed:
+            event = self.get(timeout=1.0)
+            if event is not None:
+                yield event
+
+    def close(self) -> None:
+        self.closed = True
+        self.bus._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        return False
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        if self.job_id is not None and event.get("job_id") != self.job_id:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+
+
+class JobEventBus:
+    """Delivers job change events to subscribers in this process."""
+
+    def __init__(self, channel: str, redis_client=None):
+        self.channel = channel
+        self.redis_client = redis_client
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._versions = BoundedTTLStore(f"{channel}_versions")
+
+        # When the Redis listener last (re)subscribed; None while disconnected.
+        # Events published before then may have been missed.
+        self.connected_since: Optional[float] = None
+
+        # Counters for diagnostics
+        self.delivered = 0
+
+    def subscribe(self, job_id: Optional[str] = None, max_queue: int = 1000) -> Subscription:
+        """Subscribe to events of one job (or all jobs when ``job_id`` is None)."""
+        subscription = Subscription(self, job_id, max_queue)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        self.start()
+        return subscription
+
+    def start(self) -> None:
+        """Start relaying Redis events to this process (idempotent)."""
+        with self._lock:
+            if self.redis_client is not None and self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name=f"{self.channel}_listener", daemon=True
+                )
+                self._listener.start()
+
+    def publish_local(self, event: Dict[str, Any]) -> None:
+        """Deliver an event to this process's subscribers."""
+        self.observe_version(event.get("job_id"), event.get("version"))
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription._deliver(event)
+        self.delivered += 1
+
+    def observe_version(self, job_id: Optional[str], version: Optional[int]) -> None:
+        """Record that ``job_id`` has reached at least ``version``."""
+        if job_id is None or version is None:
+            return
+        with self._lock:
+            if version > self._versions.get(job_id, 0):
+                self._versions[job_id] = version
+
+    def latest_version(self, job_id: str) -> int:
+        """Newest version of a job seen by this process (0 if none)."""
+        return self._versions.get(job_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "channel": self.channel,
+                "subscribers": len(self._subscriptions),
+                "delivered": self.delivered,
+                "listening": self._listener is not None,
+                "connected": self.connected_since is not None,
+            }
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def _listen(self) -> None:
+        """Relay Redis pub/sub messages to local subscribers, reconnecting on errors."""
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub()
+                pubsub.subscribe(self.channel)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message.get("type") == "subscribe":
+                        # Delivery is guaranteed from here on
+                        self.connected_since = time.time()
+                        continue
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        event = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    self.publish_local(event)
+            except Exception as e:
+                self.connected_since = None
+                print(f"[WARNING] Job event listener for {self.channel} failed, reconnecting: {e}")
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+def event_stream(subscription: Subscription, heartbeat: float = 15.0) -> Iterator[str]:
+    """Server-Sent Events body for a subscription.
+
+    Sends a comment line every ``heartbeat`` seconds without events so that
+    proxies keep the connection open and disconnected clients are noticed.
+    The subscription is closed when the client goes away.
+    """
+    try:
+        yield ": connected\n\n"
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            if subscription.lagged:
+                # Events were dropped; tell the client to re-read everything
+                subscription.lagged = False
+                event = dict(event, fields=ALL_FIELDS)
+            yield f"id: {event.get('version', '')}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
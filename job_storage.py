@@ -6,15 +6,294 @@ preventing data loss on server restarts.
 """
 
 import json
+import threading
 import time
 import redis
-from typing import Dict, Any, Optional, List
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
+from chunk_leases import LeaseManager
+from chunk_scheduler import CHUNK_DURATION_WINDOW, FairShareScheduler, job_concurrency_cap
+from job_cache import JobStateCache
+from job_cancellation import CancellationRegistry
+from job_events import ALL_FIELDS, JobEventBus, Subscription
+from memory_store import BoundedTTLStore
+from storage_codec import StorageCodec
 
 load_dotenv()
 
+# Chunks each process keeps in flight per chunk queue. Handlers that hand
+# their chunk to the LLM engine free their worker thread, so a few workers
+# can keep many chunks streaming.
+CHUNK_MAX_IN_FLIGHT = int(os.getenv('CHUNK_MAX_IN_FLIGHT', '16'))
+
+# Shared by the job scripts below: refresh a job's entry in the expiry index
+# and its status index. KEYS[2] = index ZSET, KEYS[3] = job -> status hash,
+# ARGV[2] = job id, ARGV[3] = expiry score, ARGV[4] = new status ('' if
+# unchanged), ARGV[5] = per-status ZSET key prefix.
+TOUCH_INDEX_LUA = """
+local function touch_index()
+    local job_id, score, new_status, status_prefix = ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+    redis.call('zadd', KEYS[2], score, job_id)
+    if new_status ~= '' then
+        local old_status = redis.call('hget', KEYS[3], job_id)
+        if old_status and old_status ~= new_status then
+            redis.call('zrem', status_prefix .. old_status, job_id)
+        end
+        redis.call('hset', KEYS[3], job_id, new_status)
+    end
+    local status = redis.call('hget', KEYS[3], job_id)
+    if status then
+        redis.call('zadd', status_prefix .. status, score, job_id)
+    end
+end
+"""
+
+# Update fields of an existing job hash, refresh its TTL and index entries.
+# KEYS[1] = job key, ARGV[1] = TTL, ARGV[2..5] = index args, ARGV[6..] = field/value pairs
+UPDATE_JOB_SCRIPT = TOUCH_INDEX_LUA + """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+if #ARGV > 5 then
+    redis.call('hset', KEYS[1], unpack(ARGV, 6))
+end
+redis.call('expire', KEYS[1], ARGV[1])
+touch_index()
+return 1
+"""
+
+# Atomically bump an integer field of an existing job hash (floored at 0).
+# KEYS[1] = job key, ARGV[1] = TTL, ARGV[2..5] = index args,
+# ARGV[6..8] = field, amount, serialized last_update
+INCR_COUNTER_SCRIPT = TOUCH_INDEX_LUA + """
+if redis.call('exists', KEYS[1]) == 0 then
+    return false
+end
+local value = redis.call('hincrby', KEYS[1], ARGV[6], ARGV[7])
+if value < 0 then
+    value = 0
+    redis.call('hset', KEYS[1], ARGV[6], 0)
+end
+redis.call('hset', KEYS[1], 'last_update', ARGV[8])
+redis.call('expire', KEYS[1], ARGV[1])
+touch_index()
+return value
+"""
+
+# Drop index entries whose jobs have expired (in batches of 1000).
+# KEYS[1] = index ZSET, KEYS[2] = job -> status hash,
+# ARGV[1] = now, ARGV[2] = per-status ZSET key prefix
+TRIM_INDEX_SCRIPT = """
+local expired = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1000)
+for _, job_id in ipairs(expired) do
+    local status = redis.call('hget', KEYS[2], job_id)
+    if status then
+        redis.call('zrem', ARGV[2] .. status, job_id)
+    end
+    redis.call('hdel', KEYS[2], job_id)
+    redis.call('zrem', KEYS[1], job_id)
+end
+return #expired
+"""
+
+# Bump a job's change version and publish a change event carrying it.
+# Skipped (returns false) if the optional KEYS[2] does not exist.
+# KEYS[1] = version key, KEYS[2] = job key, ARGV[1] = channel, ARGV[2] = TTL,
+# ARGV[3] = event JSON object without the version
+PUBLISH_EVENT_SCRIPT = """
+if KEYS[2] and redis.call('exists', KEYS[2]) == 0 then
+    return false
+end
+local version = redis.call('incr', KEYS[1])
+redis.call('expire', KEYS[1], ARGV[2])
+redis.call('publish', ARGV[1], '{"version": ' .. version .. ', ' .. string.sub(ARGV[3], 2))
+return version
+"""
+
+class BatchResult:
+    """Result of an operation queued on a StorageBatch.
+
+    ``value`` is filled in when the batch executes; until then it holds the
+    operation's failure value (False, None, ...).
+    """
+
+    def __init__(self, value: Any = None, done: bool = False):
+        self.value = value
+        self.done = done
+        self._callbacks: List[Callable[[Any], None]] = []
+
+    def set(self, value: Any) -> None:
+        self.value = value
+        self.done = True
+        for callback in self._callbacks:
+            callback(value)
+
+    def add_done_callback(self, callback: Callable[[Any], None]) -> None:
+        """Call ``callback(value)`` once the result is available."""
+        if self.done:
+            callback(self.value)
+        else:
+            self._callbacks.append(callback)
+
+
+class _BatchOperation:
+    __slots__ = ("queue", "parse", "job_key", "event", "result")
+
+    def __init__(self, queue, parse, default, job_key, event):
+        self.queue = queue
+        self.parse = parse
+        self.job_key = job_key
+        self.event = event
+        self.result = BatchResult(default)
+
+
+class StorageBatch:
+    """Queues storage operations and sends them to Redis in one pipeline.
+
+    Obtained from ``PersistentJobStorage.batch()``::
+
+        with job_storage.batch() as batch:
+            batch.set_chunk_result(job_id, chunk_id, chunk_data)
+            completed = batch.incr_job_counter(job_id, "chunks_completed")
+        print(completed.value)
+
+    Each operation returns a BatchResult that is set when the batch is
+    executed on exit (one round-trip for the whole batch). Change events
+    are coalesced to one per job and chunk and published by the same
+    pipeline. With
+    ``transaction=True`` the commands run inside MULTI/EXEC. Without Redis
+    the operations apply immediately to the in-memory store; a
+    transactional batch then holds the storage lock until it exits.
+    """
+
+    def __init__(self, storage: "PersistentJobStorage", transaction: bool = False):
+        self.storage = storage
+        self.transaction = transaction
+        self._operations: List[_BatchOperation] = []
+        self._holds_lock = False
+
+    def __enter__(self) -> "StorageBatch":
+        self.storage._begin_batch(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        try:
+            if exc_type is None:
+                self.execute()
+            else:
+                self._operations = []
+        finally:
+            self.storage._end_batch(self, exc)
+        return False
+
+    # Queued operations (same arguments as the PersistentJobStorage methods)
+    def create_job(self, job_id: str, job_data: Dict[str, Any]) -> BatchResult:
+        return self.storage.create_job(job_id, job_data, batch=self)
+
+    def update_job(self, job_id: str, updates: Dict[str, Any]) -> BatchResult:
+        return self.storage.update_job(job_id, updates, batch=self)
+
+    def incr_job_counter(self, job_id: str, field: str, amount: int = 1) -> BatchResult:
+        return self.storage.incr_job_counter(job_id, field, amount, batch=self)
+
+    def get_job_fields(self, job_id: str, fields: List[str]) -> BatchResult:
+        return self.storage.get_job_fields(job_id, fields, batch=self)
+
+    def set_chunk_result(self, job_id: str, chunk_id: str, chunk_data: Dict[str, Any]) -> BatchResult:
+        return self.storage.set_chunk_result(job_id, chunk_id, chunk_data, batch=self)
+
+    def append_stream_output(self, job_id: str, chunk_id: str, text: str) -> BatchResult:
+        return self.storage.append_stream_output(job_id, chunk_id, text, batch=self)
+
+    def reset_stream_output(self, job_id: str, chunk_id: str) -> BatchResult:
+        return self.storage.reset_stream_output(job_id, chunk_id, batch=self)
+
+    # Execution
+    def add(self, queue: Callable[[Any], None], parse: Optional[Callable[[List[Any]], Any]] = None,
+            default: Any = None, job_key: Optional[str] = None,
+            event: Optional[Tuple[str, Optional[str], List[str]]] = None) -> BatchResult:
+        """Queue an operation.
+
+        ``queue(pipe)`` adds its commands to the pipeline and
+        ``parse(replies)`` turns their replies into the result value.
+        ``job_key`` marks operations on a job hash, which are replayed once
+        after converting a legacy string job. ``event`` is the
+        ``(job_id, chunk_id, fields)`` change to publish.
+        """
+        operation = _BatchOperation(queue, parse, default, job_key, event)
+        self._operations.append(operation)
+        return operation.result
+
+    def execute(self) -> bool:
+        """Send every queued operation in one pipeline; returns False on error."""
+        operations, self._operations = self._operations, []
+        if not operations:
+            return True
+
+        try:
+            legacy = self._execute_pipeline(operations)
+            if legacy:
+                for job_key in {operation.job_key for operation in legacy}:
+                    self.storage._migrate_legacy_job(job_key)
+                self._execute_pipeline(legacy, replay=True)
+            return True
+        except Exception as e:
+            print(f"[ERROR] Failed to execute storage batch ({len(operations)} operations): {e}")
+            return False
+
+    def _execute_pipeline(self, operations: List[_BatchOperation], replay: bool = False) -> List[_BatchOperation]:
+        pipe = self.storage.redis_client.pipeline(transaction=self.transaction)
+        spans = []
+        for operation in operations:
+            start = len(pipe)
+            operation.queue(pipe)
+            spans.append((operation, start, len(pipe)))
+        events = []
+        for (job_id, chunk_id), fields in self._coalesce_events(operations).items():
+            events.append((job_id, len(pipe)))
+            # Job-level events come from create/update/counter writes, which
+            # only happen if the job exists afterwards
+            self.storage._queue_event(pipe, job_id, chunk_id, fields, require_job=chunk_id is None)
+        replies = pipe.execute(raise_on_error=False)
+
+        # Our own writes are visible to this process's cache without waiting
+        # for the pub/sub round-trip
+        for job_id, index in events:
+            if isinstance(replies[index], int):
+                self.storage.events.observe_version(job_id, replies[index])
+
+        legacy = []
+        first_error = None
+        for operation, start, end in spans:
+            operation_replies = replies[start:end]
+            error = next((reply for reply in operation_replies if isinstance(reply, Exception)), None)
+            if error is None:
+                operation.result.set(operation.parse(operation_replies) if operation.parse else operation_replies)
+            elif operation.job_key and not replay and 'WRONGTYPE' in str(error):
+                legacy.append(operation)
+            elif first_error is None:
+                first_error = error
+        if first_error is not None:
+            raise first_error
+        return legacy
+
+    @staticmethod
+    def _coalesce_events(operations: List[_BatchOperation]) -> Dict[Tuple[str, Optional[str]], List[str]]:
+        events: Dict[Tuple[str, Optional[str]], set] = {}
+        for operation in operations:
+            if operation.event is None:
+                continue
+            job_id, chunk_id, fields = operation.event
+            events.setdefault((job_id, chunk_id), set()).update(fields)
+        return {
+            key: ALL_FIELDS if "*" in fields else sorted(fields)
+            for key, fields in events.items()
+        }
+
+
 class PersistentJobStorage:
     """Redis-based persistent storage for modular job/result tracking."""
 
@@ -26,28 +305,82 @@ class PersistentJobStorage:
         """
 
         # Redis connection with fallback to in-memory for development
+        self.redis_available = self._connect_redis()
+        self.backend = "redis" if self.redis_available else "memory"
+
+        # Guards read-modify-write sequences on the in-memory fallback
+        self._memory_lock = threading.RLock()
+
+        # Key prefixes (scoped by namespace)
+        namespace = prefix.strip() or "zd"
+        self.namespace = namespace
+        self.JOB_PREFIX = f"{namespace}_job:"
+        self.RESULT_PREFIX = f"{namespace}_result:"
+        self.JOB_LIST_KEY = f"{namespace}_jobs_list"  # legacy SET, migrated to the index
+        self.JOB_INDEX_KEY = f"{namespace}_jobs_index"
+        self.JOB_STATUS_KEY = f"{namespace}_job_statuses"
+        self.STATUS_INDEX_PREFIX = f"{namespace}_jobs_by_status:"
+        self.STREAM_PREFIX = f"{namespace}_stream:"
+        self.VERSION_PREFIX = f"{namespace}_version:"
+        self.EVENT_CHANNEL = f"{namespace}_events"
+        self.TIMER_INDEX_KEY = f"{namespace}_timers"
+        self.TIMER_PAYLOAD_KEY = f"{namespace}_timer_payloads"
+
+        # Result hash field used by the legacy single-blob chunk layout
+        self.LEGACY_CHUNKS_FIELD = "chunks"
+
+        # TTL for jobs (24 hours)
+        self.JOB_TTL = 86400
+
+        # Value encoding (serializer + compression) for stored payloads
+        self.codec = StorageCodec.from_env()
+
+        # Change notifications (Redis pub/sub, or in-process without Redis)
+        self.events = JobEventBus(self.EVENT_CHANNEL, self.redis_client if self.redis_available else None)
+
+        if self.redis_available:
+            self._migrate_legacy_job_list()
+        else:
+            self._open_local_store(namespace)
+
+        # Version-checked local cache for hot status reads
+        self.cache = JobStateCache(self)
+
+        # Chunk ownership leases and expired-lease recovery
+        self.leases = LeaseManager(self)
+
+        # Cancel flags and the open LLM streams of cancellable jobs
+        self.cancellations = CancellationRegistry(self)
+
+    def _connect_redis(self) -> bool:
+        """Connect to REDIS_URL and register the storage scripts; False if unreachable."""
         try:
             redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
             self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            # Byte-level client for range reads of append-only stream output
+            self.raw_redis_client = redis.from_url(redis_url)
             # Test connection
             self.redis_client.ping()
-            self.redis_available = True
             print("[INFO] Redis connected successfully")
+
+            # Server-side scripts for partial job updates and counters
+            self._update_job_script = self.redis_client.register_script(UPDATE_JOB_SCRIPT)
+            self._incr_counter_script = self.redis_client.register_script(INCR_COUNTER_SCRIPT)
+            self._trim_index_script = self.redis_client.register_script(TRIM_INDEX_SCRIPT)
+            self._publish_event_script = self.redis_client.register_script(PUBLISH_EVENT_SCRIPT)
+            return True
         except (redis.ConnectionError, redis.RedisError) as e:
             print(f"[WARNING] Redis not available, falling back to in-memory storage: {e}")
-            self.redis_available = False
-            # Fallback to in-memory dictionaries
-            self._memory_jobs = {}
-            self._memory_results = {}
-
-        # Key prefixes (scoped by namespace)
-        namespace = prefix.strip() or "zd"
-        self.JOB_PREFIX = f"{namespace}_job:"
-        self.RESULT_PREFIX = f"{namespace}_result:"
-        self.JOB_LIST_KEY = f"{namespace}_jobs_list"
+            return False
 
-        # TTL for jobs (24 hours)
-        self.JOB_TTL = 86400
+    def _open_local_store(self, namespace: str) -> None:
+        """Fallback to bounded in-memory stores that honor the job TTL."""
+        self._memory_jobs = BoundedTTLStore(f"{namespace}_jobs", ttl=self.JOB_TTL)
+        self._memory_results = BoundedTTLStore(f"{namespace}_results", ttl=self.JOB_TTL)
+        self._memory_streams = BoundedTTLStore(f"{namespace}_streams", ttl=self.JOB_TTL)
+        self._memory_versions = BoundedTTLStore(f"{namespace}_versions", ttl=self.JOB_TTL)
+        # timer key -> (deadline, payload)
+        self._memory_timers: Dict[str, Tuple[float, Dict[str, Any]]] = {}
 
     def _get_job_key(self, job_id: str) -> str:
         """Get Redis key for job data."""
@@ -57,16 +390,118 @@ class PersistentJobStorage:
         """Get Redis key for job results."""
         return f"{self.RESULT_PREFIX}{job_id}"
 
+    def _get_stream_key(self, job_id: str, chunk_id: str) -> str:
+        """Get Redis key for a chunk's append-only streaming output."""
+        return f"{self.STREAM_PREFIX}{job_id}:{chunk_id}"
+
+    def _get_version_key(self, job_id: str) -> str:
+        """Get Redis key for a job's change version counter."""
+        return f"{self.VERSION_PREFIX}{job_id}"
+
+    def _index_keys(self, job_key: str) -> List[str]:
+        """Keys used by the job scripts: job hash, expiry index, status map."""
+        return [job_key, self.JOB_INDEX_KEY, self.JOB_STATUS_KEY]
+
+    def _index_args(self, job_id: str, status: Any = None) -> List[Any]:
+        """Leading script arguments: TTL and the job's index entry."""
+        expires_at = time.time() + self.JOB_TTL
+        return [self.JOB_TTL, job_id, expires_at, "" if status is None else str(status), self.STATUS_INDEX_PREFIX]
+
+    # Batching
+    def batch(self, transaction: bool = False) -> StorageBatch:
+        """Queue several operations and send them in one round-trip.
+
+        See StorageBatch; pass ``transaction=True`` to apply them atomically.
+        """
+        return StorageBatch(self, transaction=transaction)
+
+    def _begin_batch(self, batch: StorageBatch) -> None:
+        """Called when a batch block is entered."""
+        if batch.transaction and not self.redis_available:
+            self._memory_lock.acquire()
+            batch._holds_lock = True
+
+    def _end_batch(self, batch: StorageBatch, exc: Optional[BaseException]) -> None:
+        """Called when a batch block exits (after executing it unless ``exc`` is set)."""
+        if batch._holds_lock:
+            batch._holds_lock = False
+            self._memory_lock.release()
+
+    def _submit(self, batch: Optional[StorageBatch], queue, parse=None, default: Any = None,
+                job_key: Optional[str] = None, event=None, transaction: bool = False) -> Any:
+        """Queue Redis commands on ``batch``, or run them now in their own pipeline."""
+        if batch is not None:
+            return batch.add(queue, parse, default, job_key, event)
+        single = StorageBatch(self, transaction=transaction)
+        result = single.add(queue, parse, default, job_key, event)
+        single.execute()
+        return result.value
+
+    @staticmethod
+    def _resolved(batch: Optional[StorageBatch], value: Any) -> Any:
+        """Return ``value`` directly, or as a finished BatchResult inside a batch."""
+        return value if batch is None else BatchResult(value, done=True)
+
+    # Change Events
+    #
+    # Every write publishes ``{version, job_id, chunk_id, fields}`` (see
+    # job_events); updates of a job that does not exist publish nothing.
+    # Versions are per job and shared by all workers.
+    def subscribe(self, job_id: Optional[str] = None) -> Subscription:
+        """Subscribe to change events of one job, or of every job in this namespace."""
+        return self.events.subscribe(job_id)
+
+    def get_version(self, job_id: str) -> int:
+        """Current change version of a job (0 if it was never written)."""
+        try:
+            if self.redis_available:
+                return int(self.redis_client.get(self._get_version_key(job_id)) or 0)
+            else:
+                return self._memory_versions.get(job_id, 0)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get version of job {job_id}: {e}")
+            return 0
+
+    def _queue_event(self, pipe, job_id: str, chunk_id: Optional[str], fields: List[str],
+                     require_job: bool = False) -> None:
+        """Queue a change event; with ``require_job`` it is dropped if the job
+        hash does not exist when it runs (job writes skip a missing job)."""
+        payload = json.dumps({"job_id": job_id, "chunk_id": chunk_id, "fields": fields})
+        keys = [self._get_version_key(job_id)]
+        if require_job:
+            keys.append(self._get_job_key(job_id))
+        self._publish_event_script(
+            keys=keys,
+            args=[self.EVENT_CHANNEL, self.JOB_TTL, payload],
+            client=pipe,
+        )
+
+    def _publish_event(self, job_id: str, chunk_id: Optional[str], fields: List[str]) -> None:
+        """Publish a change event directly (in-memory mode)."""
+        with self._memory_lock:
+            version = self._memory_versions.get(job_id, 0) + 1
+            self._memory_versions[job_id] = version
+        self.events.publish_local({"version": version, "job_id": job_id, "chunk_id": chunk_id, "fields": list(fields)})
+
     def _serialize(self, data: Any) -> str:
-        """Serialize data for Redis storage."""
-        return json.dumps(data, default=str, ensure_ascii=False)
+        """Serialize data for Redis storage using the configured codec."""
+        return self.codec.encode(data)
 
     def _deserialize(self, data: str) -> Any:
-        """Deserialize data from Redis."""
-        return json.loads(data)
+        """Deserialize data from Redis, whichever codec wrote it."""
+        return self.codec.decode(data)
 
     # Job Management
-    def create_job(self, job_id: str, job_data: Dict[str, Any]) -> bool:
+    #
+    # A job is a Redis hash with one JSON-encoded value per top-level field,
+    # so updates only rewrite the fields that changed and integer counters
+    # can be bumped server-side with HINCRBY. Jobs written by older versions
+    # as a single JSON string are converted on first access.
+    #
+    # Write methods accept an optional ``batch`` (see ``batch()``); inside a
+    # batch they return a BatchResult instead of the plain value.
+    def create_job(self, job_id: str, job_data: Dict[str, Any], batch: Optional[StorageBatch] = None) -> bool:
         """Create a new job entry."""
         try:
             job_data['created_at'] = time.time()
@@ -74,31 +509,36 @@ class PersistentJobStorage:
 
             if self.redis_available:
                 job_key = self._get_job_key(job_id)
-                serialized_data = self._serialize(job_data)
-
-                # Store job data with TTL
-                self.redis_client.setex(job_key, self.JOB_TTL, serialized_data)
+                fields = self._serialize_fields(job_data)
+                keys = self._index_keys(job_key)
+                args = self._index_args(job_id, job_data.get('status'))
 
-                # Add to jobs list
-                self.redis_client.sadd(self.JOB_LIST_KEY, job_id)
+                # Store job fields with TTL and add to the job index
+                def queue(pipe):
+                    pipe.delete(job_key)
+                    pipe.hset(job_key, mapping=fields)
+                    self._update_job_script(keys=keys, args=args, client=pipe)
 
-                return True
+                return self._submit(batch, queue, lambda replies: True, default=False,
+                                    event=(job_id, None, ALL_FIELDS), transaction=True)
             else:
-                self._memory_jobs[job_id] = job_data.copy()
-                return True
+                with self._memory_lock:
+                    self._memory_jobs[job_id] = job_data.copy()
+                self._publish_event(job_id, None, ALL_FIELDS)
+                return self._resolved(batch, True)
 
         except Exception as e:
             print(f"[ERROR] Failed to create job {job_id}: {e}")
-            return False
+            return self._resolved(batch, False)
 
     def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """Get job data by ID."""
         try:
             if self.redis_available:
                 job_key = self._get_job_key(job_id)
-                data = self.redis_client.get(job_key)
+                data = self._with_legacy_job(job_key, lambda: self.redis_client.hgetall(job_key))
                 if data:
-                    return self._deserialize(data)
+                    return self._deserialize_fields(data)
                 return None
             else:
                 return self._memory_jobs.get(job_id)
@@ -107,78 +547,234 @@ class PersistentJobStorage:
             print(f"[ERROR] Failed to get job {job_id}: {e}")
             return None
 
-    def update_job(self, job_id: str, updates: Dict[str, Any]) -> bool:
-        """Update job data."""
+    def get_job_state(self, job_id: str) -> Tuple[int, Optional[Dict[str, Any]], Dict[str, Any]]:
+        """Read a job's version, job data and chunk results as one snapshot.
+
+        With Redis the three reads run in one MULTI/EXEC, so the data is
+        exactly the state at the returned version.
+        """
+        try:
+            if self.redis_available:
+                job_key = self._get_job_key(job_id)
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.get(self._get_version_key(job_id))
+                pipe.hgetall(job_key)
+                pipe.hgetall(self._get_result_key(job_id))
+                version, job, chunks = pipe.execute(raise_on_error=False)
+                version = int(version or 0) if not isinstance(version, Exception) else 0
+
+                if isinstance(job, Exception) or isinstance(chunks, Exception) or self.LEGACY_CHUNKS_FIELD in chunks:
+                    # Legacy layouts are converted by the regular reads; the
+                    # data is then at least as new as the version read above
+                    return version, self.get_job(job_id), self.get_chunk_results(job_id)
+
+                return (
+                    version,
+                    self._deserialize_fields(job) if job else None,
+                    {chunk_id: self._deserialize(value) for chunk_id, value in chunks.items()},
+                )
+            else:
+                with self._memory_lock:
+                    return self.get_version(job_id), self.get_job(job_id), dict(self.get_chunk_results(job_id))
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get job state {job_id}: {e}")
+            return 0, None, {}
+
+    def get_job_fields(self, job_id: str, fields: List[str],
+                       batch: Optional[StorageBatch] = None) -> Dict[str, Any]:
+        """Get selected job fields without loading the whole job (HMGET)."""
+        try:
+            if self.redis_available:
+                job_key = self._get_job_key(job_id)
+
+                def parse(replies):
+                    return {
+                        field: self._deserialize(value)
+                        for field, value in zip(fields, replies[0])
+                        if value is not None
+                    }
+
+                return self._submit(batch, lambda pipe: pipe.hmget(job_key, fields), parse,
+                                    default={}, job_key=job_key)
+            else:
+                job = self._memory_jobs.get(job_id) or {}
+                return self._resolved(batch, {field: job[field] for field in fields if field in job})
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get job fields {job_id}: {e}")
+            return self._resolved(batch, {})
+
+    def update_job(self, job_id: str, updates: Dict[str, Any], batch: Optional[StorageBatch] = None) -> bool:
+        """Update job data.
+
+        Only the given fields are written; the update is skipped (and False
+        returned) if the job does not exist.
+        """
         try:
             updates['last_update'] = time.time()
 
             if self.redis_available:
                 job_key = self._get_job_key(job_id)
+                keys = self._index_keys(job_key)
+
+                args = self._index_args(job_id, updates.get('status'))
+                for field, value in self._serialize_fields(updates).items():
+                    args.extend((field, value))
 
-                # Get existing data
-                existing_data = self.redis_client.get(job_key)
-                if existing_data:
-                    job_data = self._deserialize(existing_data)
-                    job_data.update(updates)
-
-                    # Update with new TTL
-                    serialized_data = self._serialize(job_data)
-                    self.redis_client.setex(job_key, self.JOB_TTL, serialized_data)
-                    return True
-                return False
+                return self._submit(
+                    batch,
+                    lambda pipe: self._update_job_script(keys=keys, args=args, client=pipe),
+                    lambda replies: bool(replies[0]),
+                    default=False,
+                    job_key=job_key,
+                    event=(job_id, None, list(updates)),
+                )
             else:
-                if job_id in self._memory_jobs:
-                    self._memory_jobs[job_id].update(updates)
-                    return True
-                return False
+                updated = self._memory_jobs.update_fields(job_id, updates)
+                if updated:
+                    self._publish_event(job_id, None, list(updates))
+                return self._resolved(batch, updated)
 
         except Exception as e:
             print(f"[ERROR] Failed to update job {job_id}: {e}")
-            return False
+            return self._resolved(batch, False)
+
+    def incr_job_counter(self, job_id: str, field: str, amount: int = 1,
+                         batch: Optional[StorageBatch] = None) -> Optional[int]:
+        """Atomically add ``amount`` to an integer job field.
+
+        Returns the new value, or None if the job does not exist. Counters
+        never drop below zero.
+        """
+        try:
+            now = time.time()
+
+            if self.redis_available:
+                job_key = self._get_job_key(job_id)
+                keys = self._index_keys(job_key)
+                args = self._index_args(job_id) + [field, amount, self._serialize(now)]
+
+                return self._submit(
+                    batch,
+                    lambda pipe: self._incr_counter_script(keys=keys, args=args, client=pipe),
+                    lambda replies: int(replies[0]) if replies[0] is not None else None,
+                    job_key=job_key,
+                    event=(job_id, None, [field, 'last_update']),
+                )
+            else:
+                with self._memory_lock:
+                    job = self._memory_jobs.get(job_id)
+                    if job is None:
+                        return self._resolved(batch, None)
+                    value = max(0, int(job.get(field) or 0) + amount)
+                    self._memory_jobs.update_fields(job_id, {field: value, 'last_update': now})
+                self._publish_event(job_id, None, [field, 'last_update'])
+                return self._resolved(batch, value)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to increment {field} for job {job_id}: {e}")
+            return self._resolved(batch, None)
+
+    def _serialize_fields(self, data: Dict[str, Any]) -> Dict[str, str]:
+        """Serialize each top-level field of a job for a Redis hash."""
+        return {field: self._serialize(value) for field, value in data.items()}
+
+    def _deserialize_fields(self, data: Dict[str, str]) -> Dict[str, Any]:
+        """Deserialize a Redis job hash back into a job dict."""
+        return {field: self._deserialize(value) for field, value in data.items()}
+
+    def _with_legacy_job(self, job_key: str, operation):
+        """Run a job hash operation, converting a legacy string job first if needed."""
+        try:
+            return operation()
+        except redis.ResponseError as e:
+            if 'WRONGTYPE' not in str(e):
+                raise
+            self._migrate_legacy_job(job_key)
+            return operation()
+
+    def _migrate_legacy_job(self, job_key: str) -> None:
+        """Convert a job stored as one JSON string into a hash, keeping its TTL."""
+        legacy_data = self.redis_client.get(job_key)
+        if legacy_data is None:
+            return
+        ttl = self.redis_client.ttl(job_key)
+        job_data = self._deserialize(legacy_data)
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(job_key)
+        if job_data:
+            pipe.hset(job_key, mapping=self._serialize_fields(job_data))
+            pipe.expire(job_key, ttl if ttl and ttl > 0 else self.JOB_TTL)
+        pipe.execute()
 
     # Chunk Results Management
-    def set_chunk_result(self, job_id: str, chunk_id: str, chunk_data: Dict[str, Any]) -> bool:
+    #
+    # Each job's results live in one Redis hash with one field per chunk, so
+    # a single chunk can be written or read without touching its siblings.
+    # Older deployments stored every chunk in a single JSON blob under the
+    # ``chunks`` field; those hashes are migrated lazily on first read.
+    def set_chunk_result(self, job_id: str, chunk_id: str, chunk_data: Dict[str, Any],
+                         batch: Optional[StorageBatch] = None) -> bool:
         """Set chunk result data."""
         try:
             chunk_data['last_update'] = time.time()
 
             if self.redis_available:
                 result_key = self._get_result_key(job_id)
+                value = self._serialize(chunk_data)
 
-                # Get existing results
-                existing_results = self.redis_client.hget(result_key, "chunks") or "{}"
-                results_data = self._deserialize(existing_results)
+                # Write only this chunk's field and refresh the TTL
+                def queue(pipe):
+                    pipe.hset(result_key, chunk_id, value)
+                    pipe.expire(result_key, self.JOB_TTL)
 
-                # Update chunk data
-                results_data[chunk_id] = chunk_data
-
-                # Store back with TTL
-                serialized_data = self._serialize(results_data)
-                self.redis_client.hset(result_key, "chunks", serialized_data)
-                self.redis_client.expire(result_key, self.JOB_TTL)
-
-                return True
+                return self._submit(batch, queue, lambda replies: True, default=False,
+                                    event=(job_id, chunk_id, list(chunk_data)))
             else:
-                if job_id not in self._memory_results:
-                    self._memory_results[job_id] = {}
-                self._memory_results[job_id][chunk_id] = chunk_data.copy()
-                return True
+                self._memory_results.update_fields(job_id, {chunk_id: chunk_data.copy()}, create=True)
+                self._publish_event(job_id, chunk_id, list(chunk_data))
+                return self._resolved(batch, True)
 
         except Exception as e:
             print(f"[ERROR] Failed to set chunk result {job_id}:{chunk_id}: {e}")
-            return False
+            return self._resolved(batch, False)
+
+    def get_chunk_results(self, job_id: str, chunk_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get chunk results for a job.
 
-    def get_chunk_results(self, job_id: str) -> Dict[str, Any]:
-        """Get all chunk results for a job."""
+        Returns every chunk (HGETALL) or, when ``chunk_ids`` is given, only
+        the requested chunks (HMGET).
+        """
         try:
             if self.redis_available:
                 result_key = self._get_result_key(job_id)
-                chunks_data = self.redis_client.hget(result_key, "chunks")
-                if chunks_data:
-                    return self._deserialize(chunks_data)
-                return {}
+
+                if chunk_ids is not None:
+                    if not chunk_ids:
+                        return {}
+                    fields = list(chunk_ids) + [self.LEGACY_CHUNKS_FIELD]
+                    values = self.redis_client.hmget(result_key, fields)
+                    if values[-1] is not None:
+                        self._migrate_legacy_chunks(result_key, values[-1])
+                        values = self.redis_client.hmget(result_key, list(chunk_ids))
+                    return {
+                        chunk_id: self._deserialize(value)
+                        for chunk_id, value in zip(chunk_ids, values)
+                        if value is not None
+                    }
+
+                raw = self.redis_client.hgetall(result_key)
+                if self.LEGACY_CHUNKS_FIELD in raw:
+                    self._migrate_legacy_chunks(result_key, raw[self.LEGACY_CHUNKS_FIELD])
+                    raw = self.redis_client.hgetall(result_key)
+                return {chunk_id: self._deserialize(value) for chunk_id, value in raw.items()}
             else:
-                return self._memory_results.get(job_id, {})
+                chunks = self._memory_results.get(job_id, {})
+                if chunk_ids is not None:
+                    return {chunk_id: chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks}
+                return chunks
 
         except Exception as e:
             print(f"[ERROR] Failed to get chunk results {job_id}: {e}")
@@ -186,24 +782,162 @@ class PersistentJobStorage:
 
     def get_chunk_result(self, job_id: str, chunk_id: str) -> Optional[Dict[str, Any]]:
         """Get specific chunk result."""
-        chunks = self.get_chunk_results(job_id)
+        chunks = self.get_chunk_results(job_id, [chunk_id])
         return chunks.get(chunk_id)
 
+    def _migrate_legacy_chunks(self, result_key: str, legacy_blob: str) -> int:
+        """Split a legacy ``chunks`` JSON blob into per-chunk hash fields.
+
+        Uses HSETNX so that chunks already written in the new layout (which
+        are always newer than the blob) are never overwritten.
+        """
+        legacy_chunks = self._deserialize(legacy_blob) or {}
+        pipe = self.redis_client.pipeline(transaction=True)
+        for chunk_id, chunk_data in legacy_chunks.items():
+            pipe.hsetnx(result_key, chunk_id, self._serialize(chunk_data))
+        pipe.hdel(result_key, self.LEGACY_CHUNKS_FIELD)
+        pipe.execute()
+        return len(legacy_chunks)
+
+    def migrate_legacy_results(self) -> int:
+        """Migrate every legacy result hash in this namespace.
+
+        Returns the number of result keys that were converted. Safe to run
+        repeatedly and while jobs are being processed.
+        """
+        if not self.redis_available:
+            return 0
+
+        migrated = 0
+        try:
+            for result_key in self.redis_client.scan_iter(match=f"{self.RESULT_PREFIX}*", count=500):
+                legacy_blob = self.redis_client.hget(result_key, self.LEGACY_CHUNKS_FIELD)
+                if legacy_blob is None:
+                    continue
+                self._migrate_legacy_chunks(result_key, legacy_blob)
+                migrated += 1
+        except Exception as e:
+            print(f"[ERROR] Failed to migrate legacy results: {e}")
+        if migrated:
+            print(f"[INFO] Migrated {migrated} legacy result hashes to per-chunk layout")
+        return migrated
+
+    # Streaming Output
+    #
+    # Streamed model output is kept out of the chunk record in an append-only
+    # string per chunk, so each flush costs O(delta) and chunk metadata stays
+    # small. Offsets are byte offsets into the UTF-8 encoded text.
+    def append_stream_output(self, job_id: str, chunk_id: str, text: str,
+                             batch: Optional[StorageBatch] = None) -> int:
+        """Append streamed text for a chunk and return the new length in bytes."""
+        try:
+            if self.redis_available:
+                stream_key = self._get_stream_key(job_id, chunk_id)
+
+                def queue(pipe):
+                    pipe.append(stream_key, text)
+                    pipe.expire(stream_key, self.JOB_TTL)
+
+                return self._submit(batch, queue, lambda replies: replies[0], default=0,
+                                    event=(job_id, chunk_id, ['streaming_output']))
+            else:
+                with self._memory_lock:
+                    buffer = self._memory_streams.get((job_id, chunk_id))
+                    if buffer is None:
+                        buffer = self._memory_streams[(job_id, chunk_id)] = bytearray()
+                    buffer.extend(text.encode('utf-8'))
+                    self._memory_streams.touch((job_id, chunk_id), resize=True)
+                    length = len(buffer)
+                self._publish_event(job_id, chunk_id, ['streaming_output'])
+                return self._resolved(batch, length)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to append stream output {job_id}:{chunk_id}: {e}")
+            return self._resolved(batch, 0)
+
+    def get_stream_output(self, job_id: str, chunk_id: str, offset: int = 0,
+                          tail: Optional[int] = None) -> Tuple[str, int]:
+        """Read a chunk's streaming output.
+
+        Returns ``(text, next_offset)``: the text after ``offset`` (limited
+        to the last ``tail`` bytes when given) and the offset to pass on
+        the next call to receive only newer output.
+        """
+        try:
+            if self.redis_available:
+                stream_key = self._get_stream_key(job_id, chunk_id)
+                length = self.raw_redis_client.strlen(stream_key)
+                start = self._stream_read_start(offset, tail, length)
+                data = self.raw_redis_client.getrange(stream_key, start, length - 1) if start < length else b""
+            else:
+                with self._memory_lock:
+                    buffer = self._memory_streams.get((job_id, chunk_id), bytearray())
+                    length = len(buffer)
+                    start = self._stream_read_start(offset, tail, length)
+                    data = bytes(buffer[start:length])
+
+            # A tail read may start inside a multi-byte character
+            return data.decode('utf-8', errors='ignore'), start + len(data)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to read stream output {job_id}:{chunk_id}: {e}")
+            return "", offset
+
+    def get_stream_outputs(self, job_id: str, chunk_ids: List[str]) -> Dict[str, str]:
+        """Read the full streaming output of several chunks in one round-trip."""
+        try:
+            if self.redis_available:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for chunk_id in chunk_ids:
+                    pipe.get(self._get_stream_key(job_id, chunk_id))
+                return {chunk_id: text or "" for chunk_id, text in zip(chunk_ids, pipe.execute())}
+            else:
+                with self._memory_lock:
+                    return {
+                        chunk_id: self._memory_streams.get((job_id, chunk_id), bytearray()).decode('utf-8', errors='ignore')
+                        for chunk_id in chunk_ids
+                    }
+
+        except Exception as e:
+            print(f"[ERROR] Failed to read stream outputs {job_id}: {e}")
+            return {}
+
+    def reset_stream_output(self, job_id: str, chunk_id: str, batch: Optional[StorageBatch] = None) -> bool:
+        """Discard a chunk's streaming output (e.g. before a retry)."""
+        try:
+            if self.redis_available:
+                stream_key = self._get_stream_key(job_id, chunk_id)
+                return self._submit(batch, lambda pipe: pipe.delete(stream_key), lambda replies: True,
+                                    default=False, event=(job_id, chunk_id, ['streaming_output']))
+            else:
+                with self._memory_lock:
+                    self._memory_streams.pop((job_id, chunk_id), None)
+                self._publish_event(job_id, chunk_id, ['streaming_output'])
+                return self._resolved(batch, True)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to reset stream output {job_id}:{chunk_id}: {e}")
+            return self._resolved(batch, False)
+
+    @staticmethod
+    def _stream_read_start(offset: int, tail: Optional[int], length: int) -> int:
+        start = max(0, min(offset, length))
+        if tail is not None:
+            start = max(start, length - tail)
+        return start
+
     # Job Discovery and Recovery
+    #
+    # Jobs are indexed in a sorted set scored by their expiry time (refreshed
+    # on every job write), plus one sorted set per status. Active jobs are a
+    # single range query and expired entries are trimmed by score.
     def get_active_jobs(self) -> List[str]:
         """Get list of active job IDs."""
         try:
             if self.redis_available:
-                job_ids = self.redis_client.smembers(self.JOB_LIST_KEY)
-                # Filter out expired jobs
-                active_jobs = []
-                for job_id in job_ids:
-                    if self.redis_client.exists(self._get_job_key(job_id)):
-                        active_jobs.append(job_id)
-                    else:
-                        # Clean up expired job from list
-                        self.redis_client.srem(self.JOB_LIST_KEY, job_id)
-                return active_jobs
+                now = time.time()
+                self.trim_job_index(now)
+                return self.redis_client.zrangebyscore(self.JOB_INDEX_KEY, f"({now}", "+inf")
             else:
                 return list(self._memory_jobs.keys())
 
@@ -211,6 +945,157 @@ class PersistentJobStorage:
             print(f"[ERROR] Failed to get active jobs: {e}")
             return []
 
+    def list_jobs(self, status: Optional[str] = None, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """List active jobs, most recently updated first, optionally by status."""
+        try:
+            if self.redis_available:
+                now = time.time()
+                self.trim_job_index(now)
+                index_key = self.JOB_INDEX_KEY if status is None else f"{self.STATUS_INDEX_PREFIX}{status}"
+                entries = self.redis_client.zrevrangebyscore(
+                    index_key, "+inf", f"({now}", start=offset, num=limit, withscores=True
+                )
+                if not entries:
+                    return []
+                statuses = self.redis_client.hmget(self.JOB_STATUS_KEY, [job_id for job_id, _ in entries])
+                return [
+                    {"job_id": job_id, "status": job_status, "last_update": expires_at - self.JOB_TTL}
+                    for (job_id, expires_at), job_status in zip(entries, statuses)
+                ]
+            else:
+                jobs = [
+                    {"job_id": job_id, "status": job.get('status'), "last_update": job.get('last_update', 0)}
+                    for job_id, job in ((job_id, self._memory_jobs.get(job_id)) for job_id in self._memory_jobs)
+                    if job is not None and (status is None or job.get('status') == status)
+                ]
+                jobs.sort(key=lambda job: job["last_update"], reverse=True)
+                return jobs[offset:offset + limit]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to list jobs: {e}")
+            return []
+
+    def count_jobs(self, status: Optional[str] = None) -> int:
+        """Count active jobs, optionally by status."""
+        try:
+            if self.redis_available:
+                index_key = self.JOB_INDEX_KEY if status is None else f"{self.STATUS_INDEX_PREFIX}{status}"
+                return self.redis_client.zcount(index_key, f"({time.time()}", "+inf")
+            else:
+                return len(self.list_jobs(status=status, limit=len(self._memory_jobs)))
+
+        except Exception as e:
+            print(f"[ERROR] Failed to count jobs: {e}")
+            return 0
+
+    def trim_job_index(self, now: Optional[float] = None) -> int:
+        """Remove expired jobs from the job and status indexes."""
+        if not self.redis_available:
+            return self._memory_jobs.purge_expired()
+
+        now = time.time() if now is None else now
+        trimmed = 0
+        while True:
+            removed = self._trim_index_script(
+                keys=[self.JOB_INDEX_KEY, self.JOB_STATUS_KEY],
+                args=[now, self.STATUS_INDEX_PREFIX],
+            )
+            trimmed += removed
+            if removed < 1000:
+                return trimmed
+
+    # Timers
+    #
+    # Pending deadlines of persistent timers (see timer_scheduler), so they
+    # survive restarts: a sorted set of timer keys scored by deadline plus a
+    # hash of their payloads.
+    def save_timer(self, key: str, deadline: float, payload: Dict[str, Any]) -> bool:
+        """Store (or move) a timer's deadline and payload."""
+        try:
+            if self.redis_available:
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.zadd(self.TIMER_INDEX_KEY, {key: deadline})
+                pipe.hset(self.TIMER_PAYLOAD_KEY, key, self._serialize(payload))
+                pipe.execute()
+            else:
+                with self._memory_lock:
+                    self._memory_timers[key] = (deadline, payload)
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to save timer {key}: {e}")
+            return False
+
+    def delete_timer(self, key: str) -> bool:
+        """Remove a timer; True only for the caller that actually removed it."""
+        try:
+            if self.redis_available:
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.zrem(self.TIMER_INDEX_KEY, key)
+                pipe.hdel(self.TIMER_PAYLOAD_KEY, key)
+                return bool(pipe.execute()[0])
+            with self._memory_lock:
+                return self._memory_timers.pop(key, None) is not None
+
+        except Exception as e:
+            print(f"[ERROR] Failed to delete timer {key}: {e}")
+            return False
+
+    def load_timers(self, prefix: str = "") -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Pending timers whose key starts with ``prefix``, as (key, deadline, payload)."""
+        try:
+            if self.redis_available:
+                entries = [
+                    (key, deadline)
+                    for key, deadline in self.redis_client.zrange(self.TIMER_INDEX_KEY, 0, -1, withscores=True)
+                    if key.startswith(prefix)
+                ]
+                if not entries:
+                    return []
+                payloads = self.redis_client.hmget(self.TIMER_PAYLOAD_KEY, [key for key, _ in entries])
+                return [
+                    (key, deadline, self._deserialize(payload))
+                    for (key, deadline), payload in zip(entries, payloads)
+                    if payload is not None
+                ]
+            with self._memory_lock:
+                return [
+                    (key, deadline, payload)
+                    for key, (deadline, payload) in self._memory_timers.items()
+                    if key.startswith(prefix)
+                ]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to load timers: {e}")
+            return []
+
+    def _migrate_legacy_job_list(self) -> None:
+        """Move job IDs from the legacy SET into the expiry-scored index."""
+        try:
+            job_ids = list(self.redis_client.smembers(self.JOB_LIST_KEY))
+            if not job_ids:
+                return
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            for job_id in job_ids:
+                pipe.ttl(self._get_job_key(job_id))
+            ttls = pipe.execute()
+
+            now = time.time()
+            for job_id, ttl in zip(job_ids, ttls):
+                if ttl is None or ttl <= 0:
+                    continue
+                job_key = self._get_job_key(job_id)
+                status = self.get_job_fields(job_id, ['status']).get('status')
+                args = self._index_args(job_id, status)
+                args[0], args[2] = ttl, now + ttl
+                self._update_job_script(keys=self._index_keys(job_key), args=args)
+
+            self.redis_client.delete(self.JOB_LIST_KEY)
+            print(f"[INFO] Migrated {len(job_ids)} job IDs to the {self.JOB_INDEX_KEY} index")
+        except Exception as e:
+            print(f"[ERROR] Failed to migrate legacy job list: {e}")
+
     def cleanup_job(self, job_id: str) -> bool:
         """Clean up job and its results."""
         try:
@@ -218,13 +1103,30 @@ class PersistentJobStorage:
                 job_key = self._get_job_key(job_id)
                 result_key = self._get_result_key(job_id)
 
-                # Remove from Redis
-                self.redis_client.delete(job_key, result_key)
-                self.redis_client.srem(self.JOB_LIST_KEY, job_id)
+                # Remove from Redis, including per-chunk stream output
+                stream_keys = [
+                    self._get_stream_key(job_id, chunk_id)
+                    for chunk_id in self.redis_client.hkeys(result_key)
+                ]
+                status = self.redis_client.hget(self.JOB_STATUS_KEY, job_id)
+
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.delete(job_key, result_key, *stream_keys)
+                pipe.zrem(self.JOB_INDEX_KEY, job_id)
+                pipe.hdel(self.JOB_STATUS_KEY, job_id)
+                if status is not None:
+                    pipe.zrem(f"{self.STATUS_INDEX_PREFIX}{status}", job_id)
+                # The version key is left to expire so versions never go backwards
+                self._queue_event(pipe, job_id, None, ALL_FIELDS)
+                pipe.execute()
                 return True
             else:
-                self._memory_jobs.pop(job_id, None)
-                self._memory_results.pop(job_id, None)
+                with self._memory_lock:
+                    self._memory_jobs.pop(job_id, None)
+                    self._memory_results.pop(job_id, None)
+                    for stream_key in [key for key in self._memory_streams if key[0] == job_id]:
+                        del self._memory_streams[stream_key]
+                self._publish_event(job_id, None, ALL_FIELDS)
                 return True
 
         except Exception as e:
@@ -233,19 +1135,116 @@ class PersistentJobStorage:
 
 
 class ZDThreadPoolManager:
-    """Manages ThreadPool for chunk processing."""
+    """Manages ThreadPool for chunk processing.
+
+    Chunks wait in a FairShareScheduler and are handed to the executor only
+    when a worker is free, so jobs share the workers instead of running in
+    submission order.
 
-    def __init__(self, max_workers: int = 5, thread_name_prefix: str = "zd_worker"):
+    A handler may return a ``Future`` (e.g. from the LLM engine) instead of
+    finishing in the worker thread: the chunk then keeps its in-flight slot
+    until that future resolves, while the worker takes the next chunk. Up to
+    ``max_in_flight`` chunks are in flight at once.
+    """
+
+    # Queued chunks are lost with the process
+    durable = False
+
+    def __init__(self, max_workers: int = 5, thread_name_prefix: str = "zd_worker",
+                 max_in_flight: Optional[int] = None):
         self.max_workers = max_workers
+        self.max_in_flight = max(max_workers, max_in_flight or max_workers)
         self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.scheduler = FairShareScheduler(job_concurrency_cap(self.max_in_flight))
         self.active_futures = {}
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._running = 0
+        self._stopped = False
+        # Seconds taken by recently finished chunks, for admission control
+        self._durations = deque(maxlen=CHUNK_DURATION_WINDOW)
+
+    def register(self, name: str, func):
+        """Task registration (see RedisWorkQueue); functions are called directly here."""
+        return func
+
+    def start(self):
+        """Workers start on demand."""
 
-    def submit_chunk(self, job_id: str, chunk_id: str, func, *args, **kwargs):
-        """Submit chunk processing task."""
-        future = self.executor.submit(func, *args, **kwargs)
-        self.active_futures[f"{job_id}:{chunk_id}"] = future
+    def submit_chunk(self, job_id: str, chunk_id: str, func, *args, priority: bool = False, weight: int = 1, **kwargs):
+        """Submit chunk processing task.
+
+        ``priority`` puts interactive work (retries, rechecks) ahead of the
+        job queues; ``weight`` is the job's share in the round-robin.
+        """
+        key = f"{job_id}:{chunk_id}"
+        future = Future()
+        self.active_futures[key] = future
+        # Drop the bookkeeping once the chunk is done (or cancelled)
+        future.add_done_callback(lambda done: self._forget(key, done))
+        self.scheduler.push(job_id, (future, func, args, kwargs), priority=priority, weight=weight)
+        self._dispatch()
         return future
 
+    def cancel_job(self, job_id: str) -> int:
+        """Cancel a job's chunks that are still queued; returns how many."""
+        dropped = self.scheduler.drop_job(job_id)
+        for future, _, _, _ in dropped:
+            future.cancel()
+        return len(dropped)
+
+    def _dispatch(self):
+        """Hand scheduled chunks to free workers."""
+        with self._lock:
+            while not self._stopped and self._busy < self.max_workers and self._running < self.max_in_flight:
+                entry = self.scheduler.pop()
+                if entry is None:
+                    break
+                self._busy += 1
+                self._running += 1
+                self.executor.submit(self._execute, *entry)
+
+    def _execute(self, job_id: str, task):
+        future, func, args, kwargs = task
+        started = time.monotonic()
+        result = None
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    self._durations.append(time.monotonic() - started)
+                else:
+                    if not isinstance(result, Future):
+                        future.set_result(result)
+                        self._durations.append(time.monotonic() - started)
+        finally:
+            with self._lock:
+                self._busy -= 1
+            if isinstance(result, Future):
+                # The chunk continues elsewhere; this worker is free meanwhile
+                result.add_done_callback(lambda done: self._resolve(job_id, future, done, started))
+                self._dispatch()
+            else:
+                self._release(job_id)
+
+    def _resolve(self, job_id: str, future: Future, done: Future, started: float):
+        if done.cancelled():
+            future.set_exception(CancelledError())
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+        self._durations.append(time.monotonic() - started)
+        self._release(job_id)
+
+    def _release(self, job_id: str):
+        with self._lock:
+            self._running -= 1
+        self.scheduler.done(job_id)
+        self._dispatch()
+
     def get_chunk_future(self, job_id: str, chunk_id: str):
         """Get future for specific chunk."""
         return self.active_futures.get(f"{job_id}:{chunk_id}")
@@ -256,15 +1255,73 @@ class ZDThreadPoolManager:
         if key in self.active_futures:
             del self.active_futures[key]
 
+    def _forget(self, key: str, future: Future):
+        # A retry may have replaced the entry with a newer future
+        if self.active_futures.get(key) is future:
+            self.active_futures.pop(key, None)
+
     def get_job_futures(self, job_id: str):
         """Get all futures for a job."""
         return {k: v for k, v in self.active_futures.items() if k.startswith(f"{job_id}:")}
 
     def shutdown(self, wait: bool = True):
-        """Shutdown the executor."""
+        """Shutdown the executor; chunks still waiting in the scheduler are dropped."""
+        with self._lock:
+            self._stopped = True
         self.executor.shutdown(wait=wait)
 
+    def backlog(self) -> Dict[str, Any]:
+        """Chunks waiting and running, workers and recent chunk durations."""
+        scheduler = self.scheduler.stats()
+        return {
+            "queued": scheduler["waiting"] + scheduler["priority_waiting"],
+            "running": self._running,
+            "workers": self.max_in_flight,
+            "durations": list(self._durations),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "consumers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "running": self._running,
+            "scheduler": self.scheduler.stats(),
+        }
+
+
+def create_chunk_queue(storage: PersistentJobStorage, max_workers: int = 5, thread_name_prefix: str = "zd_worker"):
+    """Chunk executor for a storage namespace.
+
+    With Redis (and CHUNK_QUEUE=redis, the default) chunks go through the
+    durable RedisWorkQueue shared by all processes; otherwise they run on a
+    local ZDThreadPoolManager. Either keeps up to CHUNK_MAX_IN_FLIGHT chunks
+    in flight per process (at least ``max_workers``).
+    """
+    max_in_flight = max(max_workers, CHUNK_MAX_IN_FLIGHT)
+    if storage.redis_available and os.getenv('CHUNK_QUEUE', 'redis').strip().lower() == 'redis':
+        from work_queue import RedisWorkQueue
+        return RedisWorkQueue(storage, max_workers=max_workers, thread_name_prefix=thread_name_prefix,
+                              max_in_flight=max_in_flight)
+    return ZDThreadPoolManager(max_workers=max_workers, thread_name_prefix=thread_name_prefix,
+                               max_in_flight=max_in_flight)
+
+
+def create_job_storage(prefix: str = "zd") -> PersistentJobStorage:
+    """Create the storage for a namespace on the backend selected by JOB_STORAGE_BACKEND.
+
+    ``redis`` (default; in-memory fallback when Redis is unreachable) or
+    ``sqlite`` (a local WAL-mode database, see sqlite_storage).
+    """
+    backend = os.getenv('JOB_STORAGE_BACKEND', 'redis').strip().lower()
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteJobStorage
+        return SQLiteJobStorage(prefix=prefix)
+    if backend != 'redis':
+        print(f"[WARNING] Unknown JOB_STORAGE_BACKEND '{backend}', using redis")
+    return PersistentJobStorage(prefix=prefix)
+
 
 # Global instances for the ZD tool (default namespace)
-job_storage = PersistentJobStorage(prefix="zd")
-thread_pool = ZDThreadPoolManager(max_workers=5, thread_name_prefix="zd_worker")
+job_storage = create_job_storage(prefix="zd")
+thread_pool = create_chunk_queue(job_storage, max_workers=5, thread_name_prefix="zd_worker")
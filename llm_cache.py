@@ -0,0 +1,137 @@
+"""
+LLM Response Cache
+------------------
+Content-addressed cache of LLM responses shared by ZD chunks, WR chunks and
+transcript summaries. Every call runs at fixed sampling settings, so the
+same prompt gets the same answer; rechecks excepted, a byte-identical
+request (re-running a deck, re-submitting it in another mode) is answered
+from the cache instead of the provider.
+
+- The key is a SHA-256 of (provider, model, system prompt, user message,
+  sampling parameters).
+- A per-process memory tier (``BoundedTTLStore``, LRU + TTL, bounded by
+  ``LLM_CACHE_MAX_ENTRIES`` / ``LLM_CACHE_MAX_MB``) sits in front of a Redis
+  tier shared by every process (``SETEX`` with ``LLM_CACHE_TTL``); without
+  Redis only the memory tier is used.
+- Responses larger than ``LLM_CACHE_MAX_ENTRY_KB`` are not cached.
+
+Callers decide when to bypass the cache (rechecks ask for a fresh answer,
+which then replaces the cached one).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from job_storage import job_storage
+from memory_store import BoundedTTLStore, estimate_size
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 86400)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '500'))
+LLM_CACHE_MAX_BYTES = int(float(os.getenv('LLM_CACHE_MAX_MB', '64')) * 1024 * 1024)
+LLM_CACHE_MAX_ENTRY_BYTES = int(float(os.getenv('LLM_CACHE_MAX_ENTRY_KB', '512')) * 1024)
+
+
+def cache_key(provider: str, model: str, system_prompt: str, user_message: str, **params: Any) -> str:
+    """Hash identifying a request: same key, same (deterministic) response."""
+    material = json.dumps(
+        [provider, model, system_prompt, user_message, params],
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Memory tier in front of an optional Redis tier."""
+
+    def __init__(self, redis_client=None, codec=None, namespace: str = "llm"):
+        self.redis_client = redis_client
+        self.codec = codec
+        self.KEY_PREFIX = f"{namespace}_response:"
+        self._memory = BoundedTTLStore(
+            f"{namespace}_responses", ttl=LLM_CACHE_TTL,
+            max_entries=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES,
+        )
+        self._lock = threading.Lock()
+
+        # Counters for diagnostics
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.oversized = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached response for ``key`` ({"text": ..., ...}), or None."""
+        if not LLM_CACHE_ENABLED:
+            return None
+        value = self._memory.get(key)
+        if value is None and self.redis_client is not None:
+            try:
+                data = self.redis_client.get(f"{self.KEY_PREFIX}{key}")
+                if data is not None:
+                    value = self.codec.decode(data)
+                    self._memory[key] = value
+                    with self._lock:
+                        self.shared_hits += 1
+            except Exception as e:
+                print(f"[WARNING] Failed to read LLM response cache: {e}")
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> bool:
+        """Cache a complete response; False if it was not stored."""
+        if not LLM_CACHE_ENABLED:
+            return False
+        if estimate_size(value) > LLM_CACHE_MAX_ENTRY_BYTES:
+            with self._lock:
+                self.oversized += 1
+            return False
+        self._memory[key] = value
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(f"{self.KEY_PREFIX}{key}", LLM_CACHE_TTL, self.codec.encode(value))
+            except Exception as e:
+                print(f"[WARNING] Failed to write LLM response cache: {e}")
+        with self._lock:
+            self.stores += 1
+        return True
+
+    def bypass(self) -> None:
+        """Count a request that skipped the cache on purpose (e.g. a recheck)."""
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "shared": self.redis_client is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "oversized": self.oversized,
+                "memory": self._memory.stats(),
+            }
+
+
+def _create_llm_cache() -> LLMResponseCache:
+    if job_storage.redis_available:
+        return LLMResponseCache(job_storage.redis_client, job_storage.codec)
+    return LLMResponseCache()
+
+
+# Process-wide cache shared by ZD, WR and summaries
+llm_cache = _create_llm_cache()
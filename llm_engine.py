@@ -0,0 +1,249 @@
+"""
+Async LLM Engine
+----------------
+One asyncio event loop on a dedicated thread that runs the streaming LLM
+calls of ZD and WR chunks. Each stream is a coroutine on the loop instead
+of an OS thread blocked for up to the request timeout, so a process can
+keep hundreds of streams open on a few threads.
+
+- Clients are ``AsyncOpenAI`` instances registered by name
+  (``register_client``) and created on the loop on first use; they share
+  one pooled HTTP client (``LLM_ENGINE_MAX_CONNECTIONS`` connections).
+- ``submit`` is the thread-safe entry point: it schedules a coroutine on
+  the loop and returns a ``concurrent.futures.Future``. The chunk queues
+  treat a handler that returns such a Future as running until it resolves,
+  without holding a worker thread.
+- Blocking work (job storage, Redis) runs on the ``llm_io`` executor via
+  ``offload``, so the loop itself never waits on it.
+- ``open_stream`` sends a streaming request under a watchdog: the stream
+  is closed once no token has arrived for ``LLM_FIRST_TOKEN_TIMEOUT``
+  seconds after the request, or ``LLM_STREAM_IDLE_TIMEOUT`` seconds after
+  the previous token, and the consumer gets a ``StreamStalledError`` to
+  retry on.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from executors import ExecutorFullError, get_executor
+
+LLM_ENGINE_MAX_CONNECTIONS = int(os.getenv('LLM_ENGINE_MAX_CONNECTIONS', '200'))
+# Longest wait for the first token of a response, and between two tokens
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv('LLM_FIRST_TOKEN_TIMEOUT', '240'))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', '60'))
+
+# Longest interval between two watchdog checks
+WATCHDOG_MAX_INTERVAL = 1.0
+
+
+class StreamStalledError(TimeoutError):
+    """A response stream produced no token within its time limit."""
+
+
+class StreamCloser:
+    """Closes an async response stream from any thread (see CancellationRegistry.track)."""
+
+    def __init__(self, stream: Any, loop: asyncio.AbstractEventLoop):
+        self.stream = stream
+        self.loop = loop
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.stream.close(), self.loop)
+
+
+class StreamWatchdog:
+    """Iterates a response stream and closes it when tokens stop coming.
+
+    The limits are checked by a separate task, so a stream whose server
+    stopped sending (no parts at all) is caught as well. Parts without
+    content (role headers, keep-alives) do not count as tokens.
+    """
+
+    def __init__(self, engine: "LLMEngine", stream: Any, idle_timeout: float,
+                 first_token_timeout: float, started_at: float):
+        self.engine = engine
+        self.stream = stream
+        self.idle_timeout = idle_timeout
+        self.first_token_timeout = first_token_timeout
+        self.started_at = started_at
+        self.last_token_at: Optional[float] = None
+        self.stalled: Optional[str] = None
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        task = asyncio.ensure_future(self._watch())
+        try:
+            async for part in self.stream:
+                if self.stalled:
+                    break
+                if _has_token(part):
+                    self.last_token_at = time.monotonic()
+                yield part
+        except Exception as e:
+            # Closing the stream surfaces as a read error in the iterator
+            if self.stalled:
+                raise StreamStalledError(self.stalled) from e
+            raise
+        finally:
+            task.cancel()
+        if self.stalled:
+            raise StreamStalledError(self.stalled)
+
+    async def _watch(self) -> None:
+        while True:
+            if self.last_token_at is None:
+                limit, since, what = self.first_token_timeout, self.started_at, "first token"
+            else:
+                limit, since, what = self.idle_timeout, self.last_token_at, "next token"
+            remaining = since + limit - time.monotonic()
+            if remaining <= 0:
+                self.stalled = f"No {what} received for {limit:.0f} seconds"
+                self.engine.stalled += 1
+                print(f"[WARNING] Closing stalled LLM stream: {self.stalled}")
+                await self.stream.close()
+                return
+            await asyncio.sleep(min(remaining, WATCHDOG_MAX_INTERVAL))
+
+    async def close(self) -> None:
+        await self.stream.close()
+
+
+def _has_token(part: Any) -> bool:
+    for choice in getattr(part, "choices", None) or []:
+        delta = getattr(choice, "delta", None)
+        if getattr(delta, "content", None) or getattr(delta, "reasoning_content", None):
+            return True
+    return False
+
+
+class LLMEngine:
+    """Event loop thread, shared async clients and the submission API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client_options: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, AsyncOpenAI] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+        # Counters for diagnostics
+        self.submitted = 0
+        self.active = 0
+        self.max_active = 0
+        self.failed = 0
+        self.stalled = 0
+
+    # Submission (any thread)
+    def submit(self, coroutine_function: Callable[..., Coroutine], *args, **kwargs) -> Future:
+        """Run ``coroutine_function(*args, **kwargs)`` on the engine's loop.
+
+        The returned future is resolved on the ``llm_io`` executor, so its
+        done-callbacks (e.g. queue acknowledgements) never block the loop.
+        """
+        loop = self._ensure_loop()
+        self.submitted += 1
+        outcome: Future = Future()
+        running = asyncio.run_coroutine_threadsafe(self._run(coroutine_function(*args, **kwargs)), loop)
+        running.add_done_callback(lambda done: self._deliver(done, outcome))
+        return outcome
+
+    @staticmethod
+    def _deliver(done: Future, outcome: Future) -> None:
+        def copy():
+            if done.cancelled():
+                outcome.cancel()
+            elif done.exception() is not None:
+                outcome.set_exception(done.exception())
+            else:
+                outcome.set_result(done.result())
+        try:
+            get_executor("llm_io").submit(copy)
+        except ExecutorFullError:
+            copy()
+
+    async def _run(self, coroutine: Coroutine) -> Any:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            return await coroutine
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="llm_engine", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    # Clients
+    def register_client(self, name: str, **options: Any) -> None:
+        """Options for ``AsyncOpenAI`` (api_key, base_url, timeout, ...) under ``name``."""
+        self._client_options[name] = options
+
+    def has_client(self, name: str) -> bool:
+        return name in self._client_options
+
+    def client(self, name: str) -> AsyncOpenAI:
+        """The shared async client registered as ``name`` (call on the engine's loop)."""
+        client = self._clients.get(name)
+        if client is None:
+            if self._http_client is None:
+                self._http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(
+                    max_connections=LLM_ENGINE_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_ENGINE_MAX_CONNECTIONS,
+                ))
+            client = self._clients[name] = AsyncOpenAI(
+                **self._client_options[name], http_client=self._http_client
+            )
+        return client
+
+    # Helpers for coroutines on the loop
+    async def offload(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run blocking ``fn`` on the ``llm_io`` executor and wait for it."""
+        return await asyncio.wrap_future(get_executor("llm_io").submit(fn, *args, **kwargs))
+
+    async def open_stream(self, request: Coroutine, idle_timeout: float = LLM_STREAM_IDLE_TIMEOUT,
+                          first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT) -> StreamWatchdog:
+        """Await a streaming ``request`` (e.g. ``client.chat.completions.create(...,
+        stream=True)``) and return its stream, to be read with ``async for``.
+
+        Waiting for the response counts against the first-token limit.
+        """
+        started_at = time.monotonic()
+        try:
+            stream = await asyncio.wait_for(request, first_token_timeout)
+        except asyncio.TimeoutError as e:
+            self.stalled += 1
+            raise StreamStalledError(f"No response received for {first_token_timeout:.0f} seconds") from e
+        return StreamWatchdog(self, stream, idle_timeout, first_token_timeout, started_at)
+
+    def closer(self, stream: Any) -> StreamCloser:
+        """Thread-safe handle that closes ``stream`` on this loop."""
+        return StreamCloser(stream, self._ensure_loop())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "submitted": self.submitted,
+            "active": self.active,
+            "max_active": self.max_active,
+            "failed": self.failed,
+            "stalled_streams": self.stalled,
+            "clients": sorted(self._client_options),
+        }
+
+
+# Process-wide engine shared by ZD and WR
+llm_engine = LLMEngine()
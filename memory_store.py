@@ -0,0 +1,200 @@
+"""
+Bounded In-Memory Store
+-----------------------
+Dictionary-like store used for in-process job state (the Redis fallback and
+the per-worker mirrors). Entries expire after a TTL like their Redis
+counterparts, and the least recently used entries are evicted once the
+store exceeds its entry or memory budget.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_TTL = 86400
+MEMORY_STORE_MAX_ENTRIES = int(os.getenv('MEMORY_STORE_MAX_ENTRIES', '1000'))
+MEMORY_STORE_MAX_BYTES = int(float(os.getenv('MEMORY_STORE_MAX_MB', '256')) * 1024 * 1024)
+
+# Every store created in this process, for health reporting
+_stores: List["BoundedTTLStore"] = []
+_stores_lock = threading.Lock()
+
+
+def estimate_size(value: Any) -> int:
+    """Cheap approximation of the memory held by a JSON-like value."""
+    if isinstance(value, (str, bytes, bytearray)):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 56 + sum(estimate_size(item) for item in value)
+    return 28
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class BoundedTTLStore(MutableMapping):
+    """Thread-safe mapping with per-entry TTL and LRU eviction.
+
+    Writes (set, ``update_fields``, ``touch``) refresh an entry's TTL; reads
+    only mark it as recently used. Values mutated in place keep the size
+    recorded at their last write until ``touch(key, resize=True)``.
+    """
+
+    def __init__(self, name: str, ttl: float = DEFAULT_TTL,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = MEMORY_STORE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = MEMORY_STORE_MAX_BYTES if max_bytes is None else max_bytes
+
+        self._entries: "OrderedDict[Any, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+
+        # Eviction counters
+        self.expired_evictions = 0
+        self.lru_evictions = 0
+
+        with _stores_lock:
+            _stores.append(self)
+
+    # Mapping interface
+    def __getitem__(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                raise KeyError(key)
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, estimate_size(value))
+
+    def __delitem__(self, key: Any) -> None:
+        with self._lock:
+            entry = self._entries.pop(key)
+            self._total_bytes -= entry.size
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return self._live_entry(key) is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        with self._lock:
+            self.purge_expired()
+            return iter(list(self._entries.keys()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.purge_expired()
+            return len(self._entries)
+
+    # Partial updates
+    def update_fields(self, key: Any, updates: Dict[str, Any], create: bool = False) -> bool:
+        """Merge ``updates`` into a dict value, adjusting its size incrementally.
+
+        Returns False if the entry does not exist and ``create`` is False.
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                if not create:
+                    return False
+                self._store(key, dict(updates), estimate_size(updates))
+                return True
+
+            size = entry.size
+            for field, value in updates.items():
+                if field in entry.value:
+                    size -= estimate_size(field) + estimate_size(entry.value[field])
+                size += estimate_size(field) + estimate_size(value)
+            entry.value.update(updates)
+            self._store(key, entry.value, size)
+            return True
+
+    def touch(self, key: Any, resize: bool = False) -> bool:
+        """Refresh an entry's TTL (and re-measure it after in-place changes)."""
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                return False
+            self._store(key, entry.value, estimate_size(entry.value) if resize else entry.size)
+            return True
+
+    # Maintenance
+    def purge_expired(self) -> int:
+        """Drop every expired entry; returns how many were removed."""
+        with self._lock:
+            now = time.time()
+            expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in expired:
+                self._total_bytes -= self._entries.pop(key).size
+            self.expired_evictions += len(expired)
+            return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "expired_evictions": self.expired_evictions,
+                "lru_evictions": self.lru_evictions,
+            }
+
+    def _live_entry(self, key: Any) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.time():
+            self._total_bytes -= self._entries.pop(key).size
+            self.expired_evictions += 1
+            return None
+        return entry
+
+    def _store(self, key: Any, value: Any, size: int) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous.size
+        self._entries[key] = _Entry(value, time.time() + self.ttl, size)
+        self._total_bytes += size
+        self._enforce_budget()
+
+    def _over_budget(self) -> bool:
+        return ((self.max_entries and len(self._entries) > self.max_entries) or
+                (self.max_bytes and self._total_bytes > self.max_bytes))
+
+    def _enforce_budget(self) -> None:
+        if not self._over_budget():
+            return
+        self.purge_expired()
+        # Evict least recently used entries, but never the one just written
+        while self._over_budget() and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            self.lru_evictions += 1
+
+
+def all_store_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every in-memory store in this process."""
+    with _stores_lock:
+        stores = list(_stores)
+    return {store.name: store.stats() for store in stores}
+
+
+def purge_all_stores() -> int:
+    """Drop expired entries from every in-memory store; returns how many were removed."""
+    with _stores_lock:
+        stores = list(_stores)
+    return sum(store.purge_expired() for store in stores)
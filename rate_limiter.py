@@ -0,0 +1,240 @@
+"""
+LLM Rate Limiter
+----------------
+Token buckets for requests per minute and (estimated) tokens per minute
+per provider, shared by every LLM call of the deployment: ZD chunks, WR
+chunks, summaries, retries and rechecks. Callers wait for capacity
+instead of running into the provider's quota.
+
+Limits come from ``{PROVIDER}_RPM_LIMIT`` / ``{PROVIDER}_TPM_LIMIT``
+(e.g. ``OPENAI_RPM_LIMIT``), falling back to ``LLM_RPM_LIMIT`` /
+``LLM_TPM_LIMIT``; 0 means unlimited. With Redis (and
+``LLM_RATE_LIMIT_SHARED``, the default) the buckets live in Redis and are
+shared by every process; otherwise each process has its own.
+
+Requests reserve an estimate up front (prompt characters / 4 plus
+``LLM_COMPLETION_TOKEN_ESTIMATE``); ``settle`` corrects the token bucket
+once the real output size is known.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from job_storage import job_storage
+
+LLM_RPM_LIMIT = int(os.getenv('LLM_RPM_LIMIT', '0'))
+LLM_TPM_LIMIT = int(os.getenv('LLM_TPM_LIMIT', '0'))
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv('LLM_COMPLETION_TOKEN_ESTIMATE', '1000'))
+LLM_RATE_LIMIT_SHARED = os.getenv('LLM_RATE_LIMIT_SHARED', 'true').lower() == 'true'
+
+# Rough characters per token for estimates
+CHARS_PER_TOKEN = 4
+
+# Take request and token capacity together, or report how long to wait.
+# KEYS[1] = bucket hash; ARGV[1] = now, ARGV[2] = requests/min,
+# ARGV[3] = tokens/min (0 = unlimited), ARGV[4] = tokens wanted.
+# Returns the wait in milliseconds (0 = taken)
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local want = tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'requests', 'tokens', 'ts')
+local elapsed = math.max(0, now - tonumber(state[3] or now))
+local requests = math.min(rpm, tonumber(state[1] or rpm) + elapsed * rpm / 60)
+local tokens = math.min(tpm, tonumber(state[2] or tpm) + elapsed * tpm / 60)
+local wait = 0
+if rpm > 0 and requests < 1 then
+    wait = math.max(wait, (1 - requests) * 60 / rpm)
+end
+if tpm > 0 and tokens < want then
+    wait = math.max(wait, (want - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    if rpm > 0 then
+        requests = requests - 1
+    end
+    if tpm > 0 then
+        tokens = tokens - want
+    end
+end
+redis.call('hset', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('expire', KEYS[1], 3600)
+return math.ceil(wait * 1000)
+"""
+
+# Correct the token bucket by ARGV[4] tokens (positive = more were used).
+# KEYS and ARGV[1..3] as above
+SETTLE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+if not state[1] then
+    return 0
+end
+local elapsed = math.max(0, now - tonumber(state[2] or now))
+local tokens = math.min(tpm, tonumber(state[1]) + elapsed * tpm / 60) - tonumber(ARGV[4])
+redis.call('hset', KEYS[1], 'tokens', tostring(math.min(tpm, tokens)), 'ts', tostring(now))
+return 1
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def provider_limits(provider: str) -> Tuple[int, int]:
+    """(requests per minute, tokens per minute) for a provider; 0 = unlimited."""
+    rpm = int(os.getenv(f'{provider.upper()}_RPM_LIMIT', LLM_RPM_LIMIT))
+    tpm = int(os.getenv(f'{provider.upper()}_TPM_LIMIT', LLM_TPM_LIMIT))
+    return rpm, tpm
+
+
+class LLMRateLimiter:
+    """Per-provider RPM/TPM token buckets, in Redis or in-process."""
+
+    def __init__(self, redis_client=None, namespace: str = "llm"):
+        self.redis_client = redis_client
+        self.KEY_PREFIX = f"{namespace}_ratelimit:"
+        if redis_client is not None:
+            self._acquire_script = redis_client.register_script(ACQUIRE_SCRIPT)
+            self._settle_script = redis_client.register_script(SETTLE_SCRIPT)
+
+        self._lock = threading.Lock()
+        # provider -> [requests, tokens, updated_at]
+        self._buckets: Dict[str, list] = {}
+
+        # Counters for diagnostics
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, provider: str, tokens: int) -> float:
+        """Wait until a request of ``tokens`` (see ``estimate``) fits the
+        provider's limits; returns the seconds waited."""
+        rpm, tpm = provider_limits(provider)
+        self.requests += 1
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+
+        # A request larger than the whole bucket must still get through
+        want = min(tokens, tpm) if tpm > 0 else 0
+
+        start = time.monotonic()
+        wait = self._try_take(provider, rpm, tpm, want)
+        if wait <= 0:
+            return 0.0
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._try_take(provider, rpm, tpm, want)
+
+        waited = time.monotonic() - start
+        self.waits += 1
+        self.wait_seconds += waited
+        return waited
+
+    async def acquire_async(self, provider: str, tokens: int) -> float:
+        """``acquire`` for coroutines: sleeps without blocking the event loop."""
+        rpm, tpm = provider_limits(provider)
+        self.requests += 1
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+
+        want = min(tokens, tpm) if tpm > 0 else 0
+
+        start = time.monotonic()
+        wait = self._try_take(provider, rpm, tpm, want)
+        if wait <= 0:
+            return 0.0
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._try_take(provider, rpm, tpm, want)
+
+        waited = time.monotonic() - start
+        self.waits += 1
+        self.wait_seconds += waited
+        return waited
+
+    def settle(self, provider: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once a request's real size is known."""
+        rpm, tpm = provider_limits(provider)
+        delta = actual_tokens - estimated_tokens
+        if tpm <= 0 or delta == 0:
+            return
+        now = time.time()
+        try:
+            if self.redis_client is not None:
+                self._settle_script(keys=[f"{self.KEY_PREFIX}{provider}"], args=[now, rpm, tpm, delta])
+                return
+        except Exception as e:
+            print(f"[WARNING] Failed to settle LLM rate limit for {provider}: {e}")
+            return
+        with self._lock:
+            bucket = self._bucket(provider, rpm, tpm, now)
+            bucket[1] = min(tpm, bucket[1] - delta)
+
+    @staticmethod
+    def estimate(prompt: str) -> int:
+        """Tokens to reserve for a request with ``prompt``, completion included."""
+        return estimate_tokens(prompt) + LLM_COMPLETION_TOKEN_ESTIMATE
+
+    def _try_take(self, provider: str, rpm: int, tpm: int, want: int) -> float:
+        """Take capacity if available; otherwise the seconds until it may be."""
+        now = time.time()
+        if self.redis_client is not None:
+            try:
+                wait_ms = self._acquire_script(
+                    keys=[f"{self.KEY_PREFIX}{provider}"], args=[now, rpm, tpm, want]
+                )
+                return int(wait_ms) / 1000
+            except Exception as e:
+                # Fall back to this process's buckets rather than blocking calls
+                print(f"[WARNING] Shared LLM rate limit unavailable, using local limits: {e}")
+
+        with self._lock:
+            bucket = self._bucket(provider, rpm, tpm, now)
+            wait = 0.0
+            if rpm > 0 and bucket[0] < 1:
+                wait = max(wait, (1 - bucket[0]) * 60 / rpm)
+            if tpm > 0 and bucket[1] < want:
+                wait = max(wait, (want - bucket[1]) * 60 / tpm)
+            if wait == 0:
+                bucket[0] -= 1 if rpm > 0 else 0
+                bucket[1] -= want
+            return wait
+
+    def _bucket(self, provider: str, rpm: int, tpm: int, now: float) -> list:
+        bucket = self._buckets.get(provider)
+        if bucket is None:
+            bucket = self._buckets[provider] = [float(rpm), float(tpm), now]
+        elapsed = max(0.0, now - bucket[2])
+        bucket[0] = min(rpm, bucket[0] + elapsed * rpm / 60)
+        bucket[1] = min(tpm, bucket[1] + elapsed * tpm / 60)
+        bucket[2] = now
+        return bucket
+
+    def stats(self) -> Dict[str, Any]:
+        providers = {}
+        for provider in ("openai", "deepseek"):
+            rpm, tpm = provider_limits(provider)
+            providers[provider] = {"rpm": rpm, "tpm": tpm}
+        return {
+            "shared": self.redis_client is not None,
+            "limits": providers,
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 1),
+        }
+
+
+def _create_rate_limiter() -> LLMRateLimiter:
+    if LLM_RATE_LIMIT_SHARED and job_storage.redis_available:
+        return LLMRateLimiter(job_storage.redis_client)
+    return LLMRateLimiter()
+
+
+# Process-wide limiter shared by ZD and WR
+rate_limiter = _create_rate_limiter()
@@ -0,0 +1,605 @@
+"""
+SQLite Job Storage
+------------------
+Drop-in ``PersistentJobStorage`` backend on a local SQLite database in WAL
+mode, for single-node deployments and development without Redis. Job state
+survives restarts and several processes on the same host can share the
+database file.
+
+The layout mirrors the Redis one:
+
+- ``jobs``: one row per job with its status and expiry time, indexed by
+  ``(namespace, status, expires_at)`` for status listings and counts;
+- ``job_fields``: one row per top-level job field (the Redis job hash), so
+  updates only rewrite the fields that changed;
+- ``chunk_results``: one row per chunk (the per-chunk result hash);
+- ``stream_outputs``: append-only streamed model output per chunk;
+- ``job_versions``: per-job change versions;
+- ``timers``: pending deadlines of persistent timers.
+
+Rows expire after the job TTL like Redis keys: reads ignore expired rows and
+``trim_job_index`` deletes them. A batch (see ``StorageBatch``) is a single
+SQLite transaction, committed once on exit. Its change events are
+coalesced and published after the commit.
+
+Change events, the job state cache and chunk leases are process-local, as
+in the in-memory fallback.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from job_events import ALL_FIELDS
+from job_storage import PersistentJobStorage, StorageBatch
+
+SQLITE_STORAGE_PATH = os.getenv(
+    'SQLITE_STORAGE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_storage.sqlite3'),
+)
+
+# Expired rows are hidden from reads immediately; deleting them is throttled
+PURGE_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    namespace TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    status TEXT,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, job_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_by_expiry ON jobs (namespace, expires_at);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (namespace, status, expires_at);
+
+CREATE TABLE IF NOT EXISTS job_fields (
+    namespace TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, job_id, field)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chunk_results (
+    namespace TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, job_id, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunk_results_by_expiry ON chunk_results (namespace, expires_at);
+
+CREATE TABLE IF NOT EXISTS stream_outputs (
+    namespace TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, job_id, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stream_outputs_by_expiry ON stream_outputs (namespace, expires_at);
+
+CREATE TABLE IF NOT EXISTS job_versions (
+    namespace TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, job_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS job_versions_by_expiry ON job_versions (namespace, expires_at);
+
+CREATE TABLE IF NOT EXISTS timers (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    deadline REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteJobStorage(PersistentJobStorage):
+    """PersistentJobStorage on a local SQLite database (WAL mode)."""
+
+    def __init__(self, prefix: str = "zd", path: Optional[str] = None):
+        self.db_path = path or SQLITE_STORAGE_PATH
+        super().__init__(prefix)
+
+    def _connect_redis(self) -> bool:
+        self.redis_client = None
+        return False
+
+    def _open_local_store(self, namespace: str) -> None:
+        self.backend = "sqlite"
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        print(f"[INFO] Using SQLite job storage at {self.db_path}")
+
+    # Connections and transactions
+    #
+    # Each thread has its own connection in autocommit mode; transactions
+    # are explicit. A transaction opened while another one is active on the
+    # same thread (e.g. a write inside a batch) becomes a savepoint of it.
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.depth = 0
+            self._local.events = {}
+        return connection
+
+    def _begin(self) -> sqlite3.Connection:
+        connection = self._connection()
+        depth = self._local.depth
+        if depth == 0:
+            # Take the write lock up front so read-then-write never deadlocks
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.events = {}
+        else:
+            connection.execute(f"SAVEPOINT batch_{depth}")
+        self._local.depth = depth + 1
+        return connection
+
+    def _finish(self, commit: bool) -> None:
+        connection = self._connection()
+        self._local.depth -= 1
+        depth = self._local.depth
+
+        if depth > 0:
+            if not commit:
+                connection.execute(f"ROLLBACK TO batch_{depth}")
+            connection.execute(f"RELEASE batch_{depth}")
+            return
+
+        events = []
+        try:
+            if commit:
+                events = self._bump_versions(connection, self._local.events)
+                connection.execute("COMMIT")
+            else:
+                connection.execute("ROLLBACK")
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.events = {}
+
+        # Only announce changes once they are visible to other connections
+        for event in events:
+            self.events.publish_local(event)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._begin()
+        try:
+            yield connection
+        except BaseException:
+            self._finish(commit=False)
+            raise
+        self._finish(commit=True)
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Consistent reads across several statements."""
+        connection = self._connection()
+        if self._local.depth:
+            yield connection
+            return
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        finally:
+            connection.execute("COMMIT")
+
+    def _begin_batch(self, batch: StorageBatch) -> None:
+        self._begin()
+
+    def _end_batch(self, batch: StorageBatch, exc: Optional[BaseException]) -> None:
+        try:
+            self._finish(commit=exc is None)
+        except Exception as e:
+            print(f"[ERROR] Failed to commit storage batch: {e}")
+
+    # Change Events
+    def _emit(self, job_id: str, chunk_id: Optional[str], fields: List[str]) -> None:
+        """Record a change of the current transaction, published on commit."""
+        self._local.events.setdefault((job_id, chunk_id), set()).update(fields)
+
+    def _bump_versions(self, connection: sqlite3.Connection,
+                       pending: Dict[Tuple[str, Optional[str]], set]) -> List[Dict[str, Any]]:
+        events = []
+        expires_at = time.time() + self.JOB_TTL
+        for (job_id, chunk_id), fields in pending.items():
+            # Versions keep counting past expiry so they never go backwards
+            version = connection.execute(
+                "INSERT INTO job_versions (namespace, job_id, version, expires_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (namespace, job_id) DO UPDATE SET version = version + 1, expires_at = excluded.expires_at "
+                "RETURNING version",
+                (self.namespace, job_id, expires_at),
+            ).fetchone()[0]
+            events.append({
+                "version": version,
+                "job_id": job_id,
+                "chunk_id": chunk_id,
+                "fields": ALL_FIELDS if "*" in fields else sorted(fields),
+            })
+        return events
+
+    def get_version(self, job_id: str) -> int:
+        try:
+            row = self._connection().execute(
+                "SELECT version FROM job_versions WHERE namespace = ? AND job_id = ? AND expires_at > ?",
+                (self.namespace, job_id, time.time()),
+            ).fetchone()
+            return row[0] if row else 0
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get version of job {job_id}: {e}")
+            return 0
+
+    # Job Management
+    def create_job(self, job_id: str, job_data: Dict[str, Any], batch: Optional[StorageBatch] = None) -> bool:
+        try:
+            job_data['created_at'] = time.time()
+            job_data['last_update'] = time.time()
+
+            with self._transaction() as db:
+                db.execute("DELETE FROM job_fields WHERE namespace = ? AND job_id = ?", (self.namespace, job_id))
+                db.execute(
+                    "INSERT OR REPLACE INTO jobs (namespace, job_id, status, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, job_id, self._status_value(job_data.get('status')), time.time() + self.JOB_TTL),
+                )
+                self._write_fields(db, job_id, job_data)
+                self._emit(job_id, None, ALL_FIELDS)
+            return self._resolved(batch, True)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to create job {job_id}: {e}")
+            return self._resolved(batch, False)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._read_job(self._connection(), job_id)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get job {job_id}: {e}")
+            return None
+
+    def get_job_state(self, job_id: str) -> Tuple[int, Optional[Dict[str, Any]], Dict[str, Any]]:
+        try:
+            with self._snapshot():
+                return self.get_version(job_id), self.get_job(job_id), self.get_chunk_results(job_id)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get job state {job_id}: {e}")
+            return 0, None, {}
+
+    def get_job_fields(self, job_id: str, fields: List[str],
+                       batch: Optional[StorageBatch] = None) -> Dict[str, Any]:
+        try:
+            return self._resolved(batch, self._read_job(self._connection(), job_id, fields) or {})
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get job fields {job_id}: {e}")
+            return self._resolved(batch, {})
+
+    def update_job(self, job_id: str, updates: Dict[str, Any], batch: Optional[StorageBatch] = None) -> bool:
+        try:
+            updates['last_update'] = time.time()
+
+            with self._transaction() as db:
+                updated = self._touch_job(db, job_id, updates.get('status'))
+                if updated:
+                    self._write_fields(db, job_id, updates)
+                    self._emit(job_id, None, list(updates))
+            return self._resolved(batch, updated)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to update job {job_id}: {e}")
+            return self._resolved(batch, False)
+
+    def incr_job_counter(self, job_id: str, field: str, amount: int = 1,
+                         batch: Optional[StorageBatch] = None) -> Optional[int]:
+        try:
+            now = time.time()
+
+            with self._transaction() as db:
+                if not self._touch_job(db, job_id):
+                    return self._resolved(batch, None)
+                current = (self._read_job(db, job_id, [field]) or {}).get(field)
+                value = max(0, int(current or 0) + amount)
+                self._write_fields(db, job_id, {field: value, 'last_update': now})
+                self._emit(job_id, None, [field, 'last_update'])
+            return self._resolved(batch, value)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to increment {field} for job {job_id}: {e}")
+            return self._resolved(batch, None)
+
+    def _read_job(self, db: sqlite3.Connection, job_id: str,
+                  fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Fields of a live job (all, or the given ones); None if it does not exist."""
+        query = (
+            "SELECT f.field, f.value FROM jobs j JOIN job_fields f "
+            "ON f.namespace = j.namespace AND f.job_id = j.job_id "
+            "WHERE j.namespace = ? AND j.job_id = ? AND j.expires_at > ?"
+        )
+        params: List[Any] = [self.namespace, job_id, time.time()]
+        if fields is not None:
+            query += f" AND f.field IN ({','.join('?' * len(fields))})"
+            params.extend(fields)
+        rows = db.execute(query, params).fetchall()
+        if not rows:
+            return None
+        return {field: self._deserialize(value) for field, value in rows}
+
+    def _write_fields(self, db: sqlite3.Connection, job_id: str, data: Dict[str, Any]) -> None:
+        db.executemany(
+            "INSERT OR REPLACE INTO job_fields (namespace, job_id, field, value) VALUES (?, ?, ?, ?)",
+            [(self.namespace, job_id, field, value) for field, value in self._serialize_fields(data).items()],
+        )
+
+    def _touch_job(self, db: sqlite3.Connection, job_id: str, status: Any = None) -> bool:
+        """Refresh a live job's expiry (and status); False if it does not exist."""
+        now = time.time()
+        cursor = db.execute(
+            "UPDATE jobs SET expires_at = ?, status = COALESCE(?, status) "
+            "WHERE namespace = ? AND job_id = ? AND expires_at > ?",
+            (now + self.JOB_TTL, self._status_value(status), self.namespace, job_id, now),
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _status_value(status: Any) -> Optional[str]:
+        return None if status is None else str(status)
+
+    # Chunk Results Management
+    def set_chunk_result(self, job_id: str, chunk_id: str, chunk_data: Dict[str, Any],
+                         batch: Optional[StorageBatch] = None) -> bool:
+        try:
+            chunk_data['last_update'] = time.time()
+            expires_at = time.time() + self.JOB_TTL
+
+            with self._transaction() as db:
+                # Like the Redis result hash, every write refreshes the whole job's chunks
+                db.execute(
+                    "UPDATE chunk_results SET expires_at = ? WHERE namespace = ? AND job_id = ?",
+                    (expires_at, self.namespace, job_id),
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO chunk_results (namespace, job_id, chunk_id, value, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, job_id, chunk_id, self._serialize(chunk_data), expires_at),
+                )
+                self._emit(job_id, chunk_id, list(chunk_data))
+            return self._resolved(batch, True)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to set chunk result {job_id}:{chunk_id}: {e}")
+            return self._resolved(batch, False)
+
+    def get_chunk_results(self, job_id: str, chunk_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        try:
+            query = (
+                "SELECT chunk_id, value FROM chunk_results "
+                "WHERE namespace = ? AND job_id = ? AND expires_at > ?"
+            )
+            params: List[Any] = [self.namespace, job_id, time.time()]
+            if chunk_ids is not None:
+                if not chunk_ids:
+                    return {}
+                query += f" AND chunk_id IN ({','.join('?' * len(chunk_ids))})"
+                params.extend(chunk_ids)
+            rows = self._connection().execute(query, params).fetchall()
+            return {chunk_id: self._deserialize(value) for chunk_id, value in rows}
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get chunk results {job_id}: {e}")
+            return {}
+
+    # Streaming Output
+    def append_stream_output(self, job_id: str, chunk_id: str, text: str,
+                             batch: Optional[StorageBatch] = None) -> int:
+        try:
+            now = time.time()
+
+            with self._transaction() as db:
+                length = db.execute(
+                    "INSERT INTO stream_outputs (namespace, job_id, chunk_id, data, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, job_id, chunk_id) DO UPDATE SET "
+                    "data = CASE WHEN expires_at > ? THEN data || excluded.data ELSE excluded.data END, "
+                    "expires_at = excluded.expires_at "
+                    "RETURNING length(CAST(data AS BLOB))",
+                    (self.namespace, job_id, chunk_id, text, now + self.JOB_TTL, now),
+                ).fetchone()[0]
+                self._emit(job_id, chunk_id, ['streaming_output'])
+            return self._resolved(batch, length)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to append stream output {job_id}:{chunk_id}: {e}")
+            return self._resolved(batch, 0)
+
+    def get_stream_output(self, job_id: str, chunk_id: str, offset: int = 0,
+                          tail: Optional[int] = None) -> Tuple[str, int]:
+        try:
+            key = (self.namespace, job_id, chunk_id, time.time())
+            where = "WHERE namespace = ? AND job_id = ? AND chunk_id = ? AND expires_at > ?"
+            with self._snapshot() as db:
+                row = db.execute(f"SELECT length(CAST(data AS BLOB)) FROM stream_outputs {where}", key).fetchone()
+                length = row[0] if row else 0
+                start = self._stream_read_start(offset, tail, length)
+                data = b""
+                if start < length:
+                    data = db.execute(
+                        f"SELECT substr(CAST(data AS BLOB), ?) FROM stream_outputs {where}", (start + 1,) + key
+                    ).fetchone()[0]
+
+            # A tail read may start inside a multi-byte character
+            return bytes(data).decode('utf-8', errors='ignore'), start + len(data)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to read stream output {job_id}:{chunk_id}: {e}")
+            return "", offset
+
+    def get_stream_outputs(self, job_id: str, chunk_ids: List[str]) -> Dict[str, str]:
+        try:
+            outputs = {chunk_id: "" for chunk_id in chunk_ids}
+            if not chunk_ids:
+                return outputs
+            rows = self._connection().execute(
+                "SELECT chunk_id, data FROM stream_outputs "
+                f"WHERE namespace = ? AND job_id = ? AND expires_at > ? AND chunk_id IN ({','.join('?' * len(chunk_ids))})",
+                [self.namespace, job_id, time.time(), *chunk_ids],
+            ).fetchall()
+            outputs.update(rows)
+            return outputs
+
+        except Exception as e:
+            print(f"[ERROR] Failed to read stream outputs {job_id}: {e}")
+            return {}
+
+    def reset_stream_output(self, job_id: str, chunk_id: str, batch: Optional[StorageBatch] = None) -> bool:
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    "DELETE FROM stream_outputs WHERE namespace = ? AND job_id = ? AND chunk_id = ?",
+                    (self.namespace, job_id, chunk_id),
+                )
+                self._emit(job_id, chunk_id, ['streaming_output'])
+            return self._resolved(batch, True)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to reset stream output {job_id}:{chunk_id}: {e}")
+            return self._resolved(batch, False)
+
+    # Job Discovery and Recovery
+    def get_active_jobs(self) -> List[str]:
+        try:
+            self._purge_if_due()
+            rows = self._connection().execute(
+                "SELECT job_id FROM jobs WHERE namespace = ? AND expires_at > ?",
+                (self.namespace, time.time()),
+            ).fetchall()
+            return [job_id for job_id, in rows]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to get active jobs: {e}")
+            return []
+
+    def list_jobs(self, status: Optional[str] = None, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        try:
+            self._purge_if_due()
+            query = "SELECT job_id, status, expires_at FROM jobs WHERE namespace = ? AND expires_at > ?"
+            params: List[Any] = [self.namespace, time.time()]
+            if status is not None:
+                query += " AND status = ?"
+                params.append(status)
+            query += " ORDER BY expires_at DESC LIMIT ? OFFSET ?"
+            params.extend((limit, offset))
+            return [
+                {"job_id": job_id, "status": job_status, "last_update": expires_at - self.JOB_TTL}
+                for job_id, job_status, expires_at in self._connection().execute(query, params)
+            ]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to list jobs: {e}")
+            return []
+
+    def count_jobs(self, status: Optional[str] = None) -> int:
+        try:
+            query = "SELECT COUNT(*) FROM jobs WHERE namespace = ? AND expires_at > ?"
+            params: List[Any] = [self.namespace, time.time()]
+            if status is not None:
+                query += " AND status = ?"
+                params.append(status)
+            return self._connection().execute(query, params).fetchone()[0]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to count jobs: {e}")
+            return 0
+
+    def trim_job_index(self, now: Optional[float] = None) -> int:
+        """Delete expired jobs, chunk results, stream output and versions."""
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM job_fields WHERE namespace = ? AND job_id IN "
+                "(SELECT job_id FROM jobs WHERE namespace = ? AND expires_at <= ?)",
+                (self.namespace, self.namespace, now),
+            )
+            trimmed = db.execute(
+                "DELETE FROM jobs WHERE namespace = ? AND expires_at <= ?", (self.namespace, now)
+            ).rowcount
+            for table in ("chunk_results", "stream_outputs", "job_versions"):
+                db.execute(f"DELETE FROM {table} WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        self._last_purge = now
+        return trimmed
+
+    def _purge_if_due(self) -> None:
+        if time.time() - self._last_purge >= PURGE_INTERVAL:
+            self.trim_job_index()
+
+    def save_timer(self, key: str, deadline: float, payload: Dict[str, Any]) -> bool:
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO timers (namespace, key, deadline, payload) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, deadline, self._serialize(payload)),
+                )
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to save timer {key}: {e}")
+            return False
+
+    def delete_timer(self, key: str) -> bool:
+        try:
+            with self._transaction() as db:
+                return db.execute(
+                    "DELETE FROM timers WHERE namespace = ? AND key = ?", (self.namespace, key)
+                ).rowcount > 0
+
+        except Exception as e:
+            print(f"[ERROR] Failed to delete timer {key}: {e}")
+            return False
+
+    def load_timers(self, prefix: str = "") -> List[Tuple[str, float, Dict[str, Any]]]:
+        try:
+            with self._snapshot() as db:
+                rows = db.execute(
+                    "SELECT key, deadline, payload FROM timers WHERE namespace = ? AND substr(key, 1, ?) = ? "
+                    "ORDER BY deadline",
+                    (self.namespace, len(prefix), prefix),
+                ).fetchall()
+            return [(key, deadline, self._deserialize(payload)) for key, deadline, payload in rows]
+
+        except Exception as e:
+            print(f"[ERROR] Failed to load timers: {e}")
+            return []
+
+    def cleanup_job(self, job_id: str) -> bool:
+        try:
+            with self._transaction() as db:
+                for table in ("jobs", "job_fields", "chunk_results", "stream_outputs"):
+                    db.execute(f"DELETE FROM {table} WHERE namespace = ? AND job_id = ?", (self.namespace, job_id))
+                # The version row is left to expire so versions never go backwards
+                self._emit(job_id, None, ALL_FIELDS)
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to cleanup job {job_id}: {e}")
+            return False
@@ -0,0 +1,165 @@
+"""
+Storage Codec
+-------------
+Encodes job and chunk values for Redis. Small values and scalars are stored
+as plain JSON text (which keeps HINCRBY counters and data written by older
+versions working); containers may use a faster serializer and are
+compressed once they exceed a size threshold.
+
+Encoded values that are not plain JSON carry a tag describing how to read
+them back::
+
+    ~1:<serializer>:<compression>:<base64 payload>
+
+The leading ``~`` can never start a JSON document, so untagged values are
+always decoded as JSON.
+"""
+
+import base64
+import json
+import os
+import zlib
+from typing import Any
+
+# Optional faster serializers / compressors
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_TAG = "~"
+FORMAT_VERSION = "1"
+
+SERIALIZERS = ("json", "orjson", "msgpack")
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+
+class StorageCodec:
+    """Serializer plus optional compression for stored values."""
+
+    def __init__(self, serializer: str = "json", compression: str = "zlib",
+                 compress_min_bytes: int = 4096):
+        if serializer == "auto":
+            serializer = "orjson" if orjson is not None else "json"
+        if serializer not in SERIALIZERS:
+            print(f"[WARNING] Unknown storage serializer '{serializer}', using json")
+            serializer = "json"
+        if serializer == "orjson" and orjson is None:
+            print("[WARNING] orjson not installed, using json storage serializer")
+            serializer = "json"
+        if serializer == "msgpack" and msgpack is None:
+            print("[WARNING] msgpack not installed, using json storage serializer")
+            serializer = "json"
+
+        if compression not in COMPRESSIONS:
+            print(f"[WARNING] Unknown storage compression '{compression}', using zlib")
+            compression = "zlib"
+        if compression == "zstd" and zstandard is None:
+            print("[WARNING] zstandard not installed, using zlib storage compression")
+            compression = "zlib"
+
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+
+        if compression == "zstd":
+            self._zstd_compressor = zstandard.ZstdCompressor(level=3)
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    @classmethod
+    def from_env(cls) -> "StorageCodec":
+        """Build the codec configured by JOB_STORAGE_* environment variables."""
+        return cls(
+            serializer=os.getenv('JOB_STORAGE_CODEC', 'json').lower(),
+            compression=os.getenv('JOB_STORAGE_COMPRESSION', 'zlib').lower(),
+            compress_min_bytes=int(os.getenv('JOB_STORAGE_COMPRESS_MIN_BYTES', '4096')),
+        )
+
+    @property
+    def name(self) -> str:
+        return f"{self.serializer}+{self.compression}"
+
+    # Encoding
+    def encode(self, value: Any) -> str:
+        """Encode a value for storage."""
+        # Scalars stay plain JSON so Redis can still increment counters
+        if not isinstance(value, (dict, list, tuple)):
+            return json.dumps(value, default=str, ensure_ascii=False)
+
+        serializer = self.serializer
+        if serializer == "msgpack":
+            payload = msgpack.packb(value, default=str, use_bin_type=True)
+        else:
+            text = self._dumps_json(value)
+            if self.compression == "none" or len(text) < self.compress_min_bytes:
+                return text
+            payload = text.encode('utf-8')
+            serializer = "json"
+
+        compression = "none"
+        if self.compression != "none" and len(payload) >= self.compress_min_bytes:
+            payload = self._compress(payload)
+            compression = self.compression
+
+        encoded = base64.b64encode(payload).decode('ascii')
+        return f"{CODEC_TAG}{FORMAT_VERSION}:{serializer}:{compression}:{encoded}"
+
+    def _dumps_json(self, value: Any) -> str:
+        if self.serializer == "orjson":
+            try:
+                return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits; the stdlib handles them
+                pass
+        return json.dumps(value, default=str, ensure_ascii=False)
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.compression == "zstd":
+            return self._zstd_compressor.compress(payload)
+        return zlib.compress(payload, 6)
+
+    # Decoding
+    def decode(self, data: str) -> Any:
+        """Decode a stored value written by any supported codec."""
+        if not data.startswith(CODEC_TAG):
+            return self._loads_json(data)
+
+        version, serializer, compression, encoded = data[1:].split(":", 3)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported storage format version: {version}")
+
+        payload = base64.b64decode(encoded)
+        if compression == "zlib":
+            payload = zlib.decompress(payload)
+        elif compression == "zstd":
+            if self._zstd_decompressor is None:
+                raise ValueError("zstandard is required to read this value")
+            payload = self._zstd_decompressor.decompress(payload)
+        elif compression != "none":
+            raise ValueError(f"Unsupported storage compression: {compression}")
+
+        if serializer == "msgpack":
+            if msgpack is None:
+                raise ValueError("msgpack is required to read this value")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        return self._loads_json(payload.decode('utf-8'))
+
+    @staticmethod
+    def _loads_json(text: str) -> Any:
+        if orjson is not None:
+            try:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError:
+                # NaN/Infinity or oversized integers written by the stdlib encoder
+                pass
+        return json.loads(text)
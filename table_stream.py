@@ -0,0 +1,89 @@
+"""
+Incremental Table Parsing
+-------------------------
+Parses the markdown table of an LLM response while it streams. Deltas are
+fed in as they arrive and every table row is returned as soon as its line
+is complete, so chunks can show their findings long before the response
+ends. Parsing a whole response is the same as feeding it in one piece,
+which is how the ZD and WR result parsers use it.
+
+- ``<think>...</think>`` blocks are skipped, inline or over several lines.
+- Lines before the table header (``is_header``) are ignored; after it,
+  each line goes to ``parse_row``, which returns a row or None (separators,
+  prose, malformed rows).
+"""
+
+from typing import Any, Callable, List, Optional
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class IncrementalTableParser:
+    """Line-by-line markdown table parser for one streamed response."""
+
+    def __init__(self, is_header: Callable[[str], bool], parse_row: Callable[[str], Optional[Any]]):
+        self.is_header = is_header
+        self.parse_row = parse_row
+        self.rows: List[Any] = []
+        self.header_found = False
+        self._partial_line = ""
+        self._in_think = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume a delta; returns the rows completed by it."""
+        if "\n" not in text:
+            self._partial_line += text
+            return []
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        return [row for row in map(self._consume, lines) if row is not None]
+
+    def finish(self) -> List[Any]:
+        """End of the response: parse the last, unterminated line."""
+        line, self._partial_line = self._partial_line, ""
+        row = self._consume(line)
+        return [] if row is None else [row]
+
+    def _consume(self, line: str) -> Optional[Any]:
+        line = self._outside_think(line).strip()
+        if not line:
+            return None
+        if not self.header_found:
+            self.header_found = self.is_header(line)
+            return None
+        row = self.parse_row(line)
+        if row is not None:
+            self.rows.append(row)
+        return row
+
+    def _outside_think(self, line: str) -> str:
+        # Tags never span lines, so a complete line can be scanned on its own
+        visible = []
+        lower = line.lower()
+        position = 0
+        while position < len(line):
+            if self._in_think:
+                end = lower.find(THINK_CLOSE, position)
+                if end < 0:
+                    break
+                self._in_think = False
+                position = end + len(THINK_CLOSE)
+            else:
+                start = lower.find(THINK_OPEN, position)
+                if start < 0:
+                    visible.append(line[position:])
+                    break
+                visible.append(line[position:start])
+                self._in_think = True
+                position = start + len(THINK_OPEN)
+        return "".join(visible)
+
+
+def parse_table(text: str, is_header: Callable[[str], bool],
+                parse_row: Callable[[str], Optional[Any]]) -> List[Any]:
+    """Parse a complete response."""
+    parser = IncrementalTableParser(is_header, parse_row)
+    parser.feed(text)
+    parser.finish()
+    return parser.rows
@@ -0,0 +1,237 @@
+"""
+Timer Scheduler
+---------------
+Delayed and periodic work for the whole process on one thread, instead of
+a sleeping thread (or a blocked pool worker) per timer. Timers sit in a
+heap ordered by deadline; a due timer's callback is handed to the
+``maintenance`` executor, so a slow callback never holds up the others.
+
+- ``call_later`` / ``call_at`` run a callback once;
+- ``call_every`` runs it periodically; the next run is scheduled when the
+  current one finishes, so runs never overlap;
+- every timer has a key: scheduling an existing key replaces that timer,
+  and ``cancel`` / ``reschedule`` act on it.
+
+Persistent timers (``schedule_persistent``) survive restarts. Their
+deadline and payload are saved in the job storage and ``restore`` re-arms
+them on startup, calling the handler ``register``-ed under their name. They
+belong to the host that scheduled them (they typically clean up local
+files), and a timer fires only after it has been removed from storage, so
+it runs once even if several processes restored it.
+"""
+
+import heapq
+import itertools
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from executors import ExecutorFullError, get_executor
+
+# Persistent timers are restored by processes on the host that created them
+TIMER_HOST = socket.gethostname()
+
+
+class _Timer:
+    __slots__ = ("key", "deadline", "fn", "args", "interval", "persisted", "seq")
+
+    def __init__(self, key: str, deadline: float, fn: Callable[..., Any], args: tuple,
+                 interval: Optional[float], persisted: bool):
+        self.key = key
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.interval = interval
+        self.persisted = persisted
+        self.seq = 0
+
+
+class TimerScheduler:
+    """Heap of delayed and periodic callbacks served by one thread."""
+
+    def __init__(self, executor_name: str = "maintenance"):
+        self.executor_name = executor_name
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, _Timer]] = []
+        self._timers: Dict[str, _Timer] = {}
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._storage = None
+
+        # Counters for diagnostics
+        self.fired = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.lateness_total = 0.0
+
+    # Scheduling
+    def call_at(self, when: float, fn: Callable[..., Any], *args, key: Optional[str] = None) -> str:
+        """Run ``fn(*args)`` at epoch time ``when``; returns the timer key."""
+        return self._arm(key or uuid.uuid4().hex, when, fn, args, None, False)
+
+    def call_later(self, delay: float, fn: Callable[..., Any], *args, key: Optional[str] = None) -> str:
+        """Run ``fn(*args)`` in ``delay`` seconds; returns the timer key."""
+        return self.call_at(time.time() + delay, fn, *args, key=key)
+
+    def call_every(self, interval: float, fn: Callable[..., Any], *args, key: Optional[str] = None,
+                   initial_delay: Optional[float] = None) -> str:
+        """Run ``fn(*args)`` every ``interval`` seconds (first after ``initial_delay``,
+        default one interval); returns the timer key."""
+        delay = interval if initial_delay is None else initial_delay
+        return self._arm(key or uuid.uuid4().hex, time.time() + delay, fn, args, interval, False)
+
+    def cancel(self, key: str) -> bool:
+        """Drop a pending timer; False if there was none."""
+        with self._cond:
+            timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        self.cancelled += 1
+        if timer.persisted and self._storage is not None:
+            self._storage.delete_timer(f"{TIMER_HOST}:{key}")
+        return True
+
+    def reschedule(self, key: str, delay: float) -> bool:
+        """Move a pending timer to ``delay`` seconds from now; False if there was none."""
+        deadline = time.time() + delay
+        with self._cond:
+            timer = self._timers.get(key)
+            if timer is None:
+                return False
+            self._push(timer, deadline)
+        if timer.persisted and self._storage is not None:
+            name, payload = timer.args
+            self._storage.save_timer(f"{TIMER_HOST}:{key}", deadline, {"name": name, "payload": payload})
+        return True
+
+    # Persistent timers
+    def register(self, name: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        """Handler called with the payload of persistent timers named ``name``."""
+        self._handlers[name] = handler
+
+    def attach_storage(self, storage) -> None:
+        """Job storage that keeps persistent timers (see ``save_timer``)."""
+        self._storage = storage
+
+    def schedule_persistent(self, name: str, key: str, delay: float, payload: Dict[str, Any]) -> str:
+        """Run the ``name`` handler with ``payload`` in ``delay`` seconds, even
+        across a restart; returns the timer key."""
+        timer_key = f"{name}:{key}"
+        deadline = time.time() + delay
+        if self._storage is not None:
+            self._storage.save_timer(f"{TIMER_HOST}:{timer_key}", deadline, {"name": name, "payload": payload})
+        return self._arm(timer_key, deadline, self._run_handler, (name, payload), None, True)
+
+    def restore(self) -> int:
+        """Re-arm this host's persistent timers from storage; returns how many."""
+        if self._storage is None:
+            return 0
+        prefix = f"{TIMER_HOST}:"
+        restored = 0
+        for stored_key, deadline, record in self._storage.load_timers(prefix):
+            key = stored_key[len(prefix):]
+            name = record.get("name")
+            if name not in self._handlers:
+                print(f"[WARNING] No handler for persistent timer {key}, leaving it in storage")
+                continue
+            with self._cond:
+                if key in self._timers:
+                    continue
+            self._arm(key, deadline, self._run_handler, (name, record.get("payload") or {}), None, True)
+            restored += 1
+        if restored:
+            print(f"[INFO] Restored {restored} persistent timers")
+        return restored
+
+    def _run_handler(self, name: str, payload: Dict[str, Any]) -> None:
+        self._handlers[name](payload)
+
+    # Internals
+    def _arm(self, key: str, deadline: float, fn: Callable[..., Any], args: tuple,
+             interval: Optional[float], persisted: bool) -> str:
+        timer = _Timer(key, deadline, fn, args, interval, persisted)
+        with self._cond:
+            self._timers[key] = timer
+            self._push(timer, deadline)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timer_scheduler", daemon=True)
+                self._thread.start()
+        return key
+
+    def _push(self, timer: _Timer, deadline: float) -> None:
+        # Entries of replaced or moved timers stay in the heap and are skipped
+        # when they come up (their seq no longer matches)
+        timer.deadline = deadline
+        timer.seq = next(self._seq)
+        heapq.heappush(self._heap, (deadline, timer.seq, timer))
+        self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, seq, timer = heapq.heappop(self._heap)
+                        if timer.seq == seq and self._timers.get(timer.key) is timer:
+                            break
+                    else:
+                        self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if timer.interval is None:
+                    del self._timers[timer.key]
+            self._fire(timer, now)
+
+    def _fire(self, timer: _Timer, now: float) -> None:
+        self.lateness_total += max(0.0, now - timer.deadline)
+        try:
+            get_executor(self.executor_name).submit(self._invoke, timer)
+        except ExecutorFullError as e:
+            print(f"[WARNING] Timer {timer.key} skipped: {e}")
+            self._rearm(timer)
+
+    def _invoke(self, timer: _Timer) -> None:
+        # Another process may have restored and fired the same persistent timer
+        if timer.persisted and self._storage is not None:
+            if not self._storage.delete_timer(f"{TIMER_HOST}:{timer.key}"):
+                return
+        self.fired += 1
+        try:
+            timer.fn(*timer.args)
+        except Exception as e:
+            self.failed += 1
+            print(f"[ERROR] Timer {timer.key} failed: {e}")
+        finally:
+            self._rearm(timer)
+
+    def _rearm(self, timer: _Timer) -> None:
+        if timer.interval is None:
+            return
+        with self._cond:
+            # Not if it was cancelled or replaced meanwhile
+            if self._timers.get(timer.key) is timer:
+                self._push(timer, time.time() + timer.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._timers)
+            periodic = sum(1 for timer in self._timers.values() if timer.interval is not None)
+            persisted = sum(1 for timer in self._timers.values() if timer.persisted)
+            next_due = min((timer.deadline for timer in self._timers.values()), default=None)
+        fired = self.fired
+        return {
+            "pending": pending,
+            "periodic": periodic,
+            "persistent": persisted,
+            "next_due_in": round(max(0.0, next_due - time.time()), 1) if next_due is not None else None,
+            "fired": fired,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "mean_lateness": round(self.lateness_total / fired, 3) if fired else 0.0,
+        }
+
+
+# Process-wide scheduler
+timers = TimerScheduler()
@@ -0,0 +1,357 @@
+"""
+Chunk Work Queue
+----------------
+Durable chunk task queue on a Redis Stream with a consumer group, used in
+place of the per-process ``ZDThreadPoolManager`` when Redis is available.
+
+Tasks are enqueued by name (handlers are registered with ``register``)
+with JSON arguments, so any process that registered the handler can run
+them: the web workers and any number of ``worker.py`` processes on any
+machine. Each process runs ``CHUNK_QUEUE_CONSUMERS`` consumer threads.
+
+- Submitted tasks wait in a fair-share scheduler (see chunk_scheduler) and
+  are moved onto the stream one at a time, when a consumer is free, so the
+  order in which jobs get workers is decided by the scheduler.
+- A task is acknowledged (and deleted) once its handler returns. A
+  handler may instead return a ``Future`` (e.g. from the LLM engine): the
+  task is settled when that resolves, and the consumer moves on meanwhile.
+  Each process keeps at most ``max_in_flight`` tasks running.
+- A handler that raises is re-enqueued up to ``CHUNK_QUEUE_MAX_ATTEMPTS``
+  times, then moved to the dead-letter stream.
+- While a task runs, its consumer keeps it fresh with a heartbeat. Tasks of
+  a process that died go idle; after ``CHUNK_QUEUE_CLAIM_IDLE`` seconds
+  they are claimed and run by another consumer (dead-lettered once they
+  have been delivered ``CHUNK_QUEUE_MAX_ATTEMPTS`` times). This takes the
+  place of the lease watcher, so the claim idle time follows the chunk
+  lease TTL: 1.5 x ``CHUNK_LEASE_TTL`` by default, the shortest idle time
+  at which the dead worker's lease is sure to have expired (the heartbeat
+  runs every third of it), so the claiming consumer can take the lease.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from chunk_leases import LEASE_TTL, LEASE_WATCH_INTERVAL
+from chunk_scheduler import CHUNK_DURATION_WINDOW, RedisFairShareScheduler, job_concurrency_cap
+
+CHUNK_QUEUE_CONSUMERS = os.getenv('CHUNK_QUEUE_CONSUMERS')
+CHUNK_QUEUE_CLAIM_IDLE = float(os.getenv('CHUNK_QUEUE_CLAIM_IDLE', str(LEASE_TTL * 1.5)))
+CHUNK_QUEUE_MAX_ATTEMPTS = int(os.getenv('CHUNK_QUEUE_MAX_ATTEMPTS', '3'))
+
+# How long an idle consumer waits for a wake-up before looking again
+IDLE_WAIT = 2.0
+
+# How often a process looks for tasks abandoned by dead consumers
+CLAIM_CHECK_INTERVAL = LEASE_WATCH_INTERVAL
+
+
+class RedisWorkQueue:
+    """Chunk task queue on a Redis Stream; same interface as ZDThreadPoolManager."""
+
+    # Tasks outlive the process that enqueued or ran them
+    durable = True
+
+    def __init__(self, storage, max_workers: int = 5, thread_name_prefix: str = "zd_worker",
+                 max_in_flight: Optional[int] = None):
+        self.redis_client = storage.redis_client
+        self.thread_name_prefix = thread_name_prefix
+        self.max_workers = int(CHUNK_QUEUE_CONSUMERS) if CHUNK_QUEUE_CONSUMERS is not None else max_workers
+        self.max_in_flight = max(self.max_workers, max_in_flight or self.max_workers)
+
+        namespace = storage.namespace
+        self.STREAM_KEY = f"{namespace}_tasks"
+        self.DEAD_LETTER_KEY = f"{namespace}_tasks_dead"
+        self.DURATIONS_KEY = f"{namespace}_task_durations"
+        self.GROUP = f"{namespace}_workers"
+        self.consumer_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.scheduler = RedisFairShareScheduler(
+            self.redis_client, namespace, job_concurrency_cap(self.max_in_flight)
+        )
+
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._task_names: Dict[Callable[..., Any], str] = {}
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # Taken by a consumer before it reads a task, released when the task is settled
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._last_claim_check = 0.0
+
+        # "job_id:chunk_id" -> message id of the tasks running in this process
+        self.active_futures: Dict[str, str] = {}
+
+        # Counters for diagnostics
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.reclaimed = 0
+
+        try:
+            self.redis_client.xgroup_create(self.STREAM_KEY, self.GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # Producer side
+    def register(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Make ``func`` runnable as task ``name`` in this process."""
+        self._handlers[name] = func
+        self._task_names[func] = name
+        return func
+
+    def submit_chunk(self, job_id: str, chunk_id: str, func, *args, priority: bool = False, weight: int = 1) -> None:
+        """Queue ``func(*args)`` for a chunk.
+
+        ``priority`` puts interactive work (retries, rechecks) ahead of the
+        job queues; ``weight`` is the job's share in the round-robin.
+        """
+        name = self._task_names.get(func)
+        if name is None:
+            raise ValueError(f"{func.__name__} is not registered as a work queue task")
+        self.scheduler.push({
+            "task": name,
+            "job_id": job_id,
+            "chunk_id": chunk_id,
+            "args": json.dumps(args),
+            "attempts": 0,
+        }, priority=priority, weight=weight)
+
+    def cancel_job(self, job_id: str) -> int:
+        """Drop a job's tasks that have not been dispatched yet; returns how many.
+
+        Tasks already on the stream still run but see the job's cancel flag.
+        """
+        return self.scheduler.drop_job(job_id)
+
+    def get_chunk_future(self, job_id: str, chunk_id: str) -> Optional[str]:
+        """Message id of a chunk task running in this process."""
+        return self.active_futures.get(f"{job_id}:{chunk_id}")
+
+    def cleanup_chunk(self, job_id: str, chunk_id: str) -> None:
+        self.active_futures.pop(f"{job_id}:{chunk_id}", None)
+
+    def get_job_futures(self, job_id: str) -> Dict[str, str]:
+        return {k: v for k, v in self.active_futures.items() if k.startswith(f"{job_id}:")}
+
+    # Consumer side
+    def start(self) -> None:
+        """Start this process's consumer threads and task heartbeat (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.max_workers):
+                thread = threading.Thread(
+                    target=self._consume, name=f"{self.thread_name_prefix}_{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            if self._threads:
+                threading.Thread(
+                    target=self._heartbeat, name=f"{self.thread_name_prefix}_heartbeat", daemon=True
+                ).start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop taking tasks; with ``wait`` let the running ones finish."""
+        self._stopping.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            # Tasks handed to async handlers hold their slots until settled
+            for _ in range(self.max_in_flight):
+                self._slots.acquire()
+
+    def backlog(self) -> Dict[str, Any]:
+        """Chunks waiting and running, workers and recent chunk durations, across all processes."""
+        scheduler = self.scheduler.stats()
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xlen(self.STREAM_KEY)
+        pipe.xinfo_consumers(self.STREAM_KEY, self.GROUP)
+        pipe.lrange(self.DURATIONS_KEY, 0, -1)
+        dispatched, consumers, durations = pipe.execute()
+        # Consumer processes poll every IDLE_WAIT seconds while alive; each
+        # keeps as many tasks in flight as this one
+        live = sum(1 for consumer in consumers if consumer["idle"] < CHUNK_QUEUE_CLAIM_IDLE * 1000)
+        return {
+            "queued": scheduler["waiting"] + scheduler["priority_waiting"],
+            "running": dispatched,
+            "workers": max(1, live) * self.max_in_flight,
+            "durations": [float(duration) for duration in durations],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            queued = self.redis_client.xlen(self.STREAM_KEY)
+            pending = self.redis_client.xpending(self.STREAM_KEY, self.GROUP)["pending"]
+            dead = self.redis_client.xlen(self.DEAD_LETTER_KEY)
+            scheduler = self.scheduler.stats()
+        except Exception as e:
+            print(f"[ERROR] Failed to read work queue stats: {e}")
+            queued = pending = dead = scheduler = None
+        return {
+            "backend": "redis",
+            "consumers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "running": len(self.active_futures),
+            "queued": queued,
+            "pending": pending,
+            "dead_lettered": dead,
+            "completed": self.completed,
+            "retried": self.retried,
+            "reclaimed": self.reclaimed,
+            "scheduler": scheduler,
+        }
+
+    def _consume(self) -> None:
+        while not self._stopping.is_set():
+            if not self._slots.acquire(timeout=IDLE_WAIT):
+                continue
+            message = None
+            try:
+                message = self._claim_abandoned() or self._read()
+                if message is None:
+                    self.scheduler.wait(IDLE_WAIT)
+            except Exception as e:
+                print(f"[ERROR] Work queue consumer error on {self.STREAM_KEY}: {e}")
+                time.sleep(1)
+            if message is None:
+                self._slots.release()
+            else:
+                # The slot is released once the task is settled
+                self._run(*message)
+
+    def _read(self) -> Optional[Tuple[str, Dict[str, str]]]:
+        # Let the scheduler move the next task onto the stream, then take
+        # whatever is next there (another consumer may have taken that one)
+        while not self._stopping.is_set():
+            dispatched = self.scheduler.dispatch(self.STREAM_KEY)
+            response = self.redis_client.xreadgroup(
+                self.GROUP, self.consumer_name, {self.STREAM_KEY: ">"}, count=1
+            )
+            for _, messages in response or []:
+                for message_id, fields in messages:
+                    return message_id, fields
+            if dispatched is None:
+                break
+        return None
+
+    def _claim_abandoned(self) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Take over one task whose consumer stopped heartbeating."""
+        now = time.time()
+        if now - self._last_claim_check < CLAIM_CHECK_INTERVAL:
+            return None
+        self._last_claim_check = now
+
+        _, messages, _ = self.redis_client.xautoclaim(
+            self.STREAM_KEY, self.GROUP, self.consumer_name,
+            min_idle_time=int(CHUNK_QUEUE_CLAIM_IDLE * 1000), start_id="0-0", count=1,
+        )
+        for message_id, fields in messages:
+            if not fields:
+                continue
+            self._last_claim_check = 0.0  # there may be more
+            self.reclaimed += 1
+            pending = self.redis_client.xpending_range(self.STREAM_KEY, self.GROUP, message_id, message_id, 1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            print(f"[WARNING] Reclaimed task {message_id} ({fields.get('task')} {fields.get('job_id')}:"
+                  f"{fields.get('chunk_id')}) from a lost worker, delivery {deliveries}")
+            if deliveries > CHUNK_QUEUE_MAX_ATTEMPTS:
+                self._dead_letter(message_id, fields, f"Worker lost {deliveries - 1} times")
+                return None
+            return message_id, fields
+        return None
+
+    def _run(self, message_id: str, fields: Dict[str, str]) -> None:
+        key = f"{fields.get('job_id')}:{fields.get('chunk_id')}"
+        self.active_futures[key] = message_id
+        started = time.monotonic()
+        try:
+            handler = self._handlers.get(fields.get("task"))
+            if handler is None:
+                raise LookupError(f"No handler registered for task {fields.get('task')}")
+            result = handler(*json.loads(fields["args"]))
+        except Exception as e:
+            self._settle(message_id, fields, started, e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(
+                lambda done: self._settle(message_id, fields, started, _future_error(done))
+            )
+        else:
+            self._settle(message_id, fields, started, None)
+
+    def _settle(self, message_id: str, fields: Dict[str, str], started: float,
+                error: Optional[BaseException]) -> None:
+        """Acknowledge a finished task, or retry it if it failed; frees its slot."""
+        key = f"{fields.get('job_id')}:{fields.get('chunk_id')}"
+        try:
+            if error is not None:
+                print(f"[ERROR] Task {message_id} ({fields.get('task')} {key}) failed: {error}")
+                self._retry(message_id, fields, error)
+            else:
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.xack(self.STREAM_KEY, self.GROUP, message_id)
+                pipe.xdel(self.STREAM_KEY, message_id)
+                self.scheduler.release(fields.get("job_id", ""), client=pipe)
+                # Shared by every process, for admission control
+                pipe.lpush(self.DURATIONS_KEY, round(time.monotonic() - started, 2))
+                pipe.ltrim(self.DURATIONS_KEY, 0, CHUNK_DURATION_WINDOW - 1)
+                pipe.execute()
+                self.completed += 1
+        except Exception as e:
+            # Left pending; reclaimed once it goes idle
+            print(f"[ERROR] Failed to settle task {message_id} on {self.STREAM_KEY}: {e}")
+        finally:
+            self.active_futures.pop(key, None)
+            self._slots.release()
+
+    def _retry(self, message_id: str, fields: Dict[str, str], error: BaseException) -> None:
+        attempts = int(fields.get("attempts", 0)) + 1
+        if attempts >= CHUNK_QUEUE_MAX_ATTEMPTS:
+            self._dead_letter(message_id, fields, str(error))
+            return
+        pipe = self.redis_client.pipeline(transaction=True)
+        self.scheduler.push({**fields, "attempts": attempts, "error": str(error)}, client=pipe)
+        pipe.xack(self.STREAM_KEY, self.GROUP, message_id)
+        pipe.xdel(self.STREAM_KEY, message_id)
+        self.scheduler.release(fields.get("job_id", ""), client=pipe)
+        pipe.execute()
+        self.retried += 1
+
+    def _dead_letter(self, message_id: str, fields: Dict[str, str], reason: str) -> None:
+        print(f"[ERROR] Moving task {message_id} ({fields.get('task')} {fields.get('job_id')}:"
+              f"{fields.get('chunk_id')}) to {self.DEAD_LETTER_KEY}: {reason}")
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.xadd(self.DEAD_LETTER_KEY, {**fields, "error": reason, "failed_at": time.time()})
+        pipe.xack(self.STREAM_KEY, self.GROUP, message_id)
+        pipe.xdel(self.STREAM_KEY, message_id)
+        self.scheduler.release(fields.get("job_id", ""), client=pipe)
+        pipe.execute()
+        self.dead_lettered += 1
+
+    def _heartbeat(self) -> None:
+        """Reset the idle time of running tasks so they are not reclaimed."""
+        while True:
+            time.sleep(CHUNK_QUEUE_CLAIM_IDLE / 3)
+            message_ids = list(self.active_futures.values())
+            if not message_ids:
+                continue
+            try:
+                self.redis_client.xclaim(
+                    self.STREAM_KEY, self.GROUP, self.consumer_name, 0, message_ids, justid=True
+                )
+            except Exception as e:
+                print(f"[WARNING] Work queue heartbeat failed: {e}")
+
+
+def _future_error(future: Future) -> Optional[BaseException]:
+    """The exception a finished future ended with, if any."""
+    if future.cancelled():
+        return RuntimeError("Task was cancelled")
+    return future.exception()
@@ -0,0 +1,48 @@
+"""
+Chunk Worker
+------------
+Standalone consumer of the ZD and WR chunk work queues (see work_queue).
+Run as many as needed, on any machine that reaches the same Redis:
+
+    CHUNK_QUEUE_CONSUMERS=8 python worker.py
+
+Each process runs CHUNK_QUEUE_CONSUMERS consumer threads per queue. Web
+processes consume too unless they set CHUNK_QUEUE_CONSUMERS=0. On SIGTERM
+or SIGINT the worker stops taking tasks and finishes the running ones.
+"""
+
+import signal
+import sys
+import threading
+
+# Importing the apps registers the chunk tasks and starts the consumers
+from app import thread_pool
+from wr.storage import thread_pool as wr_thread_pool
+
+
+def main():
+    if not thread_pool.durable:
+        print("[ERROR] The chunk work queue needs Redis (REDIS_URL) and CHUNK_QUEUE=redis")
+        sys.exit(1)
+
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"[INFO] Chunk worker consuming {thread_pool.STREAM_KEY} ({thread_pool.max_workers} consumers) "
+          f"and {wr_thread_pool.STREAM_KEY} ({wr_thread_pool.max_workers} consumers)")
+    while not stopping.wait(1):
+        pass
+
+    print("[INFO] Chunk worker stopping, finishing running tasks...")
+    thread_pool.shutdown(wait=True)
+    wr_thread_pool.shutdown(wait=True)
+    print("[INFO] Chunk worker stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,17 +4,22 @@ from __future__ import annotations
 
 import os
 import tempfile
-import threading
 import time
 import uuid
 from typing import Any, Dict, Optional
 
 from flask import Blueprint, Response, jsonify, request, session
 
+from admission import admit
+from deck_diff import plan_rerun
+from executors import ExecutorFullError, get_executor
+from job_events import event_stream
+
 from .chunker import chunk_slides
 from .config import DEFAULT_MODEL, DEFAULT_MODE
 from .export import to_csv, to_xlsx, to_json
-from .llm import process_chunk, update_thinking_progress
+from .llm import attempt_merge, carry_over_chunk, process_chunk, slide_content, update_thinking_progress
+from .parse_table import merge_rows
 from .parser import extract_slim_json
 from .storage import (
     create_job,
@@ -23,6 +28,10 @@ from .storage import (
     get_chunk_results,
     get_chunk_result,
     update_chunk_result,
+    get_stream_output,
+    reset_stream_output,
+    with_stream_output,
+    storage,
     thread_pool,
 )
 from .models import ChunkResultRow
@@ -58,6 +67,21 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@wr_bp.route("/jobs", methods=["GET"])
+def list_wr_jobs():
+    status = request.args.get("status") or None
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = min(max(1, request.args.get("limit", 50, type=int)), 500)
+    return jsonify(
+        {
+            "jobs": storage.list_jobs(status=status, offset=offset, limit=limit),
+            "total": storage.count_jobs(status=status),
+            "offset": offset,
+            "limit": limit,
+        }
+    )
+
+
 @wr_bp.route("/jobs", methods=["POST"])
 def create_wr_job():
     if "ppt_file" not in request.files:
@@ -111,11 +135,36 @@ def run_wr_job(job_id: str):
     if not job:
         return jsonify({"error": "Job not found"}), 404
 
+    # Turn new runs away while the chunk backlog is too long
+    admission = admit(thread_pool)
+    if not admission.accepted:
+        response = jsonify({
+            "error": "Too many jobs are queued, please try again later",
+            "retry_after": admission.retry_after,
+            "admission": admission.to_dict(),
+        })
+        response.headers["Retry-After"] = str(admission.retry_after)
+        return response, 429
+
     payload = request.get_json(silent=True) or {}
     mode = _parse_mode(payload.get("mode"))
     model = _parse_model(payload.get("model"))
 
-    update_job(job_id, {"status": "PARSING", "mode": mode, "model": model, "last_update": time.time()})
+    # Re-run against a previous version of the deck: only chunks with
+    # changed slides go to the model (see deck_diff)
+    previous_job_id = payload.get("previous_job_id")
+    previous_job = None
+    if previous_job_id:
+        previous_job = get_job(previous_job_id)
+        if not previous_job:
+            return jsonify({"error": "Previous job not found"}), 404
+        if previous_job.get("status") != "DONE":
+            return jsonify({"error": "Previous job has not finished"}), 400
+
+    update_job(
+        job_id,
+        {"status": "PARSING", "mode": mode, "model": model, "last_update": time.time(), **admission.job_fields()},
+    )
 
     temp_file_path = job.get("temp_file_path")
 
@@ -125,13 +174,29 @@ def run_wr_job(job_id: str):
             update_job(job_id, {"status": "CHUNKING", "last_update": time.time(), "slides_count": len(slides)})
 
             chunks = chunk_slides(slides, mode)
+            if storage.cancellations.is_cancelled(job_id):
+                return
+            chunks_to_run = chunks
+            rerun_fields: Dict[str, Any] = {}
+            plan = None
+            if previous_job is not None and chunks:
+                plan = plan_rerun(
+                    previous_job.get("chunks", []), previous_job.get("result_rows", []), chunks,
+                    "json_payload", "slide_number", "page", slide_content,
+                )
+                chunks_to_run = plan.run_chunks
+                rerun_fields = plan.job_fields(previous_job_id)
+                print(f"[INFO] Re-running WR job {job_id} against {previous_job_id}: "
+                      f"{len(chunks_to_run)}/{len(chunks)} chunks changed")
             update_job(
                 job_id,
                 {
                     "chunks": chunks,
                     "chunks_total": len(chunks),
                     "status": "PROMPTING/THINKING" if chunks else "MERGING",
+                    "estimated_completion": time.time() + admission.eta(len(chunks_to_run)),
                     "last_update": time.time(),
+                    **rerun_fields,
                 },
             )
 
@@ -150,7 +215,16 @@ def run_wr_job(job_id: str):
                     os.unlink(temp_file_path)
                 return
 
-            for chunk in chunks:
+            # Chunks without changes since the previous version are done already
+            if plan is not None:
+                for chunk in chunks:
+                    if chunk["chunk_id"] in plan.carried:
+                        carry_over_chunk(job_id, chunk, plan.carried[chunk["chunk_id"]])
+                if not chunks_to_run:
+                    attempt_merge(job_id)
+                    return
+
+            for chunk in chunks_to_run:
                 chunk_copy = dict(chunk)
                 chunk_copy["mode"] = mode
                 chunk_copy.setdefault("attempts", 0)
@@ -175,9 +249,30 @@ def run_wr_job(job_id: str):
                 except OSError:
                     pass
 
-    threading.Thread(target=process_job, name=f"wr_main_{job_id}", daemon=True).start()
+    try:
+        get_executor("jobs").submit(process_job)
+    except ExecutorFullError:
+        update_job(job_id, {"status": "UPLOADING", "last_update": time.time()})
+        return jsonify({"error": "Too many jobs starting, please try again later"}), 503
 
-    return jsonify({"success": True})
+    return jsonify({"success": True, "queue_position": admission.queued + 1})
+
+
+@wr_bp.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id: str):
+    """Cancel a job: drop its queued chunks and stop the running ones."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.get("status") in {"DONE", "ERROR", "CANCELLED"}:
+        return jsonify({"error": f"Job is already {job.get('status')}"}), 409
+
+    # Flag first, so chunks dispatched meanwhile skip themselves
+    closed_streams = storage.cancellations.cancel(job_id)
+    dropped_chunks = thread_pool.cancel_job(job_id)
+    update_job(job_id, {"status": "CANCELLED", "completion_time": time.time(), "last_update": time.time()})
+    print(f"[INFO] Cancelled WR job {job_id}: {dropped_chunks} queued chunks dropped, {closed_streams} streams closed")
+    return jsonify({"success": True, "dropped_chunks": dropped_chunks, "closed_streams": closed_streams})
 
 
 @wr_bp.route("/jobs/<job_id>")
@@ -185,8 +280,26 @@ def get_job_status(job_id: str):
     job = get_job(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
-    chunks = get_chunk_results(job_id)
-    return jsonify({"job": job, "chunks": chunks})
+    # Streamed output is read from .../stream after the client's offset
+    return jsonify({"job": job, "chunks": get_chunk_results(job_id)})
+
+
+@wr_bp.route("/jobs/<job_id>/chunks/<chunk_id>/stream")
+def get_chunk_stream(job_id: str, chunk_id: str):
+    offset = request.args.get("offset", 0, type=int)
+    tail = request.args.get("tail", type=int)
+    text, next_offset = get_stream_output(job_id, chunk_id, offset=offset, tail=tail)
+    return jsonify({"job_id": job_id, "chunk_id": chunk_id, "text": text, "offset": next_offset})
+
+
+@wr_bp.route("/jobs/<job_id>/events")
+def stream_job_events(job_id: str):
+    subscription = storage.subscribe(job_id)
+    return Response(
+        event_stream(subscription),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @wr_bp.route("/jobs/<job_id>/result")
@@ -199,6 +312,13 @@ def get_job_result(job_id: str):
         ChunkResultRow(**row_dict) if isinstance(row_dict, dict) else row_dict
         for row_dict in job.get("result_rows", [])
     ]
+    # partial=true serves the rows found so far while the job runs
+    if job.get("status") != "DONE" and request.args.get("partial", "false").lower() == "true":
+        rows = merge_rows([
+            ChunkResultRow(**row_dict)
+            for chunk in get_chunk_results(job_id).values()
+            for row_dict in chunk.get("rows", [])
+        ])
 
     fmt = request.args.get("format", "json").lower()
     include_raw = request.args.get("include_raw", "false").lower() == "true"
@@ -220,7 +340,7 @@ def get_job_result(job_id: str):
 
     result: Dict[str, Any] = {"rows": to_json(rows), "no_edits": job.get("no_edits", False)}
     if include_raw:
-        result["raw_chunks"] = get_chunk_results(job_id)
+        result["raw_chunks"] = with_stream_output(job_id, get_chunk_results(job_id))
     return jsonify(result)
 
 
@@ -229,6 +349,9 @@ def retry_chunk(job_id: str, chunk_id: str):
     job = get_job(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
+    # Its chunks would be dropped on dispatch, leaving the counters wrong
+    if storage.cancellations.is_cancelled(job_id):
+        return jsonify({"error": "Job was cancelled"}), 409
 
     chunk_meta = next((chunk for chunk in job.get("chunks", []) if chunk["chunk_id"] == chunk_id), None)
     if not chunk_meta:
@@ -238,12 +361,14 @@ def retry_chunk(job_id: str, chunk_id: str):
     if chunk_state and chunk_state.get("status") not in {"failed", "completed"}:
         return jsonify({"error": "Chunk is currently processing"}), 400
 
+    reset_stream_output(job_id, chunk_id)
     update_chunk_result(
         job_id,
         chunk_id,
         {
             "status": "starting",
-            "streaming_output": "",
+            "streaming_length": 0,
+            "stream_start_time": time.time(),
             "ai_progress": "Retrying...",
             "result_text": "",
             "error": None,
@@ -264,7 +389,9 @@ def retry_chunk(job_id: str, chunk_id: str):
             "last_update": time.time(),
         },
     )
-    thread_pool.submit_chunk(job_id, chunk_id, process_chunk, job_id, chunk_payload, job.get("model", DEFAULT_MODEL))
+    thread_pool.submit_chunk(
+        job_id, chunk_id, process_chunk, job_id, chunk_payload, job.get("model", DEFAULT_MODEL), priority=True
+    )
     update_thinking_progress(job_id)
     return jsonify({"success": True})
 
@@ -274,17 +401,22 @@ def recheck_chunk(job_id: str, chunk_id: str):
     job = get_job(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
+    # Its chunks would be dropped on dispatch, leaving the counters wrong
+    if storage.cancellations.is_cancelled(job_id):
+        return jsonify({"error": "Job was cancelled"}), 409
 
     chunk_meta = next((chunk for chunk in job.get("chunks", []) if chunk["chunk_id"] == chunk_id), None)
     if not chunk_meta:
         return jsonify({"error": "Chunk not found"}), 404
 
+    reset_stream_output(job_id, chunk_id)
     update_chunk_result(
         job_id,
         chunk_id,
         {
             "status": "starting",
-            "streaming_output": "",
+            "streaming_length": 0,
+            "stream_start_time": time.time(),
             "ai_progress": "Re-checking...",
             "result_text": "",
             "error": None,
@@ -297,6 +429,8 @@ def recheck_chunk(job_id: str, chunk_id: str):
     attempts = chunk_state.get("attempts", 0) if chunk_state else 0
     chunk_payload = dict(chunk_meta)
     chunk_payload["attempts"] = attempts
+    # A recheck asks the model again instead of replaying the cached answer
+    chunk_payload["bypass_cache"] = True
     update_job(
         job_id,
         {
@@ -306,7 +440,9 @@ def recheck_chunk(job_id: str, chunk_id: str):
             "last_update": time.time(),
         },
     )
-    thread_pool.submit_chunk(job_id, chunk_id, process_chunk, job_id, chunk_payload, job.get("model", DEFAULT_MODEL))
+    thread_pool.submit_chunk(
+        job_id, chunk_id, process_chunk, job_id, chunk_payload, job.get("model", DEFAULT_MODEL), priority=True
+    )
     update_thinking_progress(job_id)
     return jsonify({"success": True})
 
@@ -316,5 +452,5 @@ def debug_job(job_id: str):
     job = get_job(job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
-    chunks = get_chunk_results(job_id)
+    chunks = with_stream_output(job_id, get_chunk_results(job_id))
     return jsonify({"job": job, "chunks": chunks})
@@ -3,6 +3,8 @@
 from dataclasses import dataclass
 import os
 
+from llm_engine import LLM_FIRST_TOKEN_TIMEOUT, LLM_STREAM_IDLE_TIMEOUT
+
 
 @dataclass(frozen=True)
 class ChunkConfig:
@@ -21,7 +23,9 @@ DEFAULT_MODEL = "gpt-5-pro"
 MAX_WORKERS = int(os.getenv("WR_MAX_WORKERS", "8"))
 
 REQUEST_TIMEOUT = 300
-STREAM_IDLE_TIMEOUT = 60
-STALL_THRESHOLD = 300
+# Streams with no token for this long are closed and retried; same limits as ZD
+FIRST_TOKEN_TIMEOUT = LLM_FIRST_TOKEN_TIMEOUT
+STREAM_IDLE_TIMEOUT = LLM_STREAM_IDLE_TIMEOUT
+STREAM_MAX_ATTEMPTS = int(os.getenv("WR_STREAM_MAX_ATTEMPTS", "2"))
 
 EXPORT_HEADERS = ["Page", "Original", "Revised"]
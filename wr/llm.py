@@ -7,21 +7,41 @@ import os
 import time
 from typing import Dict, Any, List
 
-from openai import OpenAI
-
-from .config import DEFAULT_MODEL, REQUEST_TIMEOUT, STALL_THRESHOLD
-from .parse_table import parse_wr_table, merge_rows
+from chunk_leases import LEASE_MAX_RECOVERIES, LeaseLostError
+from concurrency_limiter import llm_limiter
+from job_cancellation import JobCancelledError
+from llm_cache import cache_key, llm_cache
+from llm_engine import StreamStalledError, llm_engine
+from rate_limiter import estimate_tokens, rate_limiter
+from stream_buffer import StreamingBuffer
+
+from .config import (
+    DEFAULT_MODEL,
+    FIRST_TOKEN_TIMEOUT,
+    REQUEST_TIMEOUT,
+    STREAM_IDLE_TIMEOUT,
+    STREAM_MAX_ATTEMPTS,
+)
+from .parse_table import parse_wr_table, merge_rows, wr_table_parser
 from .prompt import build_user_message
 from .storage import (
     get_job,
     update_job,
+    incr_job_counter,
     set_chunk_result,
     update_chunk_result,
     get_chunk_results,
+    append_stream_output,
+    reset_stream_output,
+    storage,
+    storage_batch,
+    thread_pool,
 )
 from .models import ChunkResultRow
 
-OPENAI_CLIENT = OpenAI(
+# Chunks stream on the shared async LLM engine
+llm_engine.register_client(
+    "wr",
     api_key=os.getenv("OPENAI_API_KEY"),
     base_url=os.getenv("OPENAI_BASE_URL", "https://chat01.ai"),
     timeout=REQUEST_TIMEOUT,
@@ -29,10 +49,7 @@ OPENAI_CLIENT = OpenAI(
 )
 
 
-ACTIVE_CHUNK_STATUSES = {"starting", "sending", "processing"}
-
-
-def _initialize_chunk(job_id: str, chunk: Dict[str, Any]) -> Dict[str, Any]:
+def _initialize_chunk(job_id: str, chunk: Dict[str, Any], batch=None) -> Dict[str, Any]:
     now = time.time()
     chunk_state = {
         "chunk_id": chunk["chunk_id"],
@@ -43,51 +60,27 @@ def _initialize_chunk(job_id: str, chunk: Dict[str, Any]) -> Dict[str, Any]:
         "word_count": chunk["word_count"],
         "mode": chunk["mode"],
         "start_time": now,
-        "streaming_output": "",
+        "streaming_length": 0,
+        "stream_start_time": now,
         "ai_progress": "Initializing...",
         "result_text": "",
         "rows": [],
         "error": None,
         "attempts": chunk.get("attempts", 0) + 1,
+        "lease_recoveries": chunk.get("lease_recoveries", 0),
         "last_update": now,
     }
-    set_chunk_result(job_id, chunk["chunk_id"], chunk_state)
+    reset_stream_output(job_id, chunk["chunk_id"], batch=batch)
+    set_chunk_result(job_id, chunk["chunk_id"], chunk_state, batch=batch)
     return chunk_state
 
 
-def _recover_stalled_chunks(job_id: str, chunk_results: Dict[str, Any]) -> bool:
-    now = time.time()
-    recovered = False
-    for chunk_id, chunk_state in chunk_results.items():
-        status = chunk_state.get("status")
-        if status not in ACTIVE_CHUNK_STATUSES:
-            continue
-        last_update = chunk_state.get("last_update") or chunk_state.get("start_time") or now
-        if now - last_update <= STALL_THRESHOLD:
-            continue
-        recovered = True
-        update_chunk_result(
-            job_id,
-            chunk_id,
-            {
-                "status": "failed",
-                "completion_time": now,
-                "error": "No response from model (stalled).",
-                "ai_progress": "Failed: stalled without response",
-                "last_update": now,
-            },
-        )
-    return recovered
-
-
 def update_thinking_progress(job_id: str) -> None:
     job = get_job(job_id)
     if not job:
         return
 
     chunk_results = get_chunk_results(job_id)
-    if _recover_stalled_chunks(job_id, chunk_results):
-        chunk_results = get_chunk_results(job_id)
 
     sent = sum(
         1
@@ -105,38 +98,59 @@ def update_thinking_progress(job_id: str) -> None:
         "chunks_failed": failed,
         "last_update": time.time(),
     }
-    if job.get("status") not in {"MERGING", "DONE", "ERROR"} and sent:
+    if job.get("status") not in {"MERGING", "DONE", "ERROR", "CANCELLED"} and sent:
         updates["status"] = "PROMPTING/THINKING"
 
     update_job(job_id, updates)
 
 
-def process_chunk(job_id: str, chunk: Dict[str, Any], model_name: str | None = None) -> None:
-    model = model_name or DEFAULT_MODEL
-    chunk_state = _initialize_chunk(job_id, chunk)
+def process_chunk(job_id: str, chunk: Dict[str, Any], model_name: str | None = None):
+    """Start a chunk on the LLM engine while holding its lease.
 
-    update_job(job_id, {"status": "PROMPTING/THINKING", "last_update": time.time()})
+    Returns the engine's future (None if the chunk is skipped); the chunk
+    queue keeps the chunk in flight until it resolves.
+    """
+    if storage.cancellations.is_cancelled(job_id):
+        print(f"[INFO] Skipping WR chunk {chunk['chunk_id']} of cancelled job {job_id}")
+        return None
+    lease = storage.leases.acquire(job_id, chunk["chunk_id"])
+    if lease is None:
+        print(f"[WARNING] WR chunk {chunk['chunk_id']} of job {job_id} is already being processed, skipping")
+        return None
+    try:
+        return llm_engine.submit(_run_leased, job_id, chunk, model_name, lease)
+    except BaseException:
+        lease.release()
+        raise
 
-    update_chunk_result(
-        job_id,
-        chunk["chunk_id"],
-        {
-            "status": "sending",
-            "ai_progress": "Sending prompt to model...",
-            "last_update": time.time(),
-        },
-    )
 
-    job = get_job(job_id)
-    sent_count = (job or {}).get("chunks_sent", 0) + 1
-    update_job(
-        job_id,
-        {
-            "chunks_sent": sent_count,
-            "status": "PROMPTING/THINKING",
-            "last_update": time.time(),
-        },
-    )
+async def _run_leased(job_id: str, chunk: Dict[str, Any], model_name: str | None, lease) -> None:
+    try:
+        await _run_chunk(job_id, chunk, model_name, lease)
+    finally:
+        await llm_engine.offload(lease.release)
+
+
+def _start_chunk(job_id: str, chunk: Dict[str, Any]) -> str:
+    """Record the chunk as started; returns its user message."""
+    # Initial chunk state, job status and counters go out in one round-trip
+    with storage_batch() as batch:
+        _initialize_chunk(job_id, chunk, batch)
+
+        update_job(job_id, {"status": "PROMPTING/THINKING", "last_update": time.time()}, batch=batch)
+
+        update_chunk_result(
+            job_id,
+            chunk["chunk_id"],
+            {
+                "status": "sending",
+                "ai_progress": "Sending prompt to model...",
+                "last_update": time.time(),
+            },
+            batch=batch,
+        )
+
+        incr_job_counter(job_id, "chunks_sent", batch=batch)
 
     payload_str = json.dumps(chunk["json_payload"], ensure_ascii=False, indent=2)
     user_message = build_user_message(payload_str)
@@ -150,86 +164,318 @@ def process_chunk(job_id: str, chunk: Dict[str, Any], model_name: str | None = N
             "last_update": time.time(),
         },
     )
+    return user_message
+
+
+async def _run_chunk(job_id: str, chunk: Dict[str, Any], model_name: str | None, lease) -> None:
+    """Stream one chunk on the LLM engine's loop; storage work is offloaded."""
+    model = model_name or DEFAULT_MODEL
+    user_message = await llm_engine.offload(_start_chunk, job_id, chunk)
 
     result_text = ""
     last_token_time = time.time()
+    streaming_length = 0
+
+    def flush_stream(text: str, fields: Dict[str, Any]) -> None:
+        # Only this worker appends to the stream, so its length is tracked here
+        nonlocal streaming_length
+        with storage_batch() as batch:
+            if text:
+                append_stream_output(job_id, chunk["chunk_id"], text, batch=batch)
+                streaming_length += len(text.encode("utf-8"))
+                fields["streaming_length"] = streaming_length
+            update_chunk_result(job_id, chunk["chunk_id"], fields, batch=batch)
+
+    # The buffer only collects its flushes; they are written off the loop
+    pending_flushes: List[tuple] = []
+    stream_buffer = StreamingBuffer(lambda text, fields: pending_flushes.append((text, fields)))
+
+    async def write_flushes() -> None:
+        while pending_flushes:
+            await llm_engine.offload(flush_stream, *pending_flushes.pop(0))
+
+    async def cancel_requested() -> bool:
+        cancelled = storage.cancellations.cached(job_id)
+        if cancelled is None:
+            cancelled = await llm_engine.offload(storage.cancellations.refresh, job_id)
+        return cancelled
+
+    estimated_tokens = rate_limiter.estimate(user_message)
+    limiter_wait = 0.0
+
+    # Identical prompts get identical answers; rechecks ask for a fresh one
+    cache_id = cache_key("wr", model, "", user_message, temperature=0, top_p=1)
+    if chunk.get("bypass_cache"):
+        llm_cache.bypass()
+    else:
+        cached = await llm_engine.offload(llm_cache.get, cache_id)
+        if cached is not None:
+            await llm_engine.offload(_replay_chunk, job_id, chunk["chunk_id"], cached["text"])
+            return
 
     try:
-        response = OPENAI_CLIENT.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": user_message}],
-            temperature=0,
-            top_p=1,
-            stream=True,
-            timeout=REQUEST_TIMEOUT,
+        for attempt in range(1, STREAM_MAX_ATTEMPTS + 1):
+            try:
+                result_text = ""
+                table_parser = wr_table_parser()
+                # Wait for the deployment's rate limits, then for a concurrency slot
+                waited = await rate_limiter.acquire_async("openai", estimated_tokens)
+                with await llm_limiter("openai", model).slot_async() as slot:
+                    limiter_wait = round(limiter_wait + waited + slot.waited, 2)
+                    # A watchdog closes the stream if tokens stop coming
+                    response = await llm_engine.open_stream(
+                        llm_engine.client("wr").chat.completions.create(
+                            model=model,
+                            messages=[{"role": "user", "content": user_message}],
+                            temperature=0,
+                            top_p=1,
+                            stream=True,
+                            timeout=REQUEST_TIMEOUT,
+                        ),
+                        idle_timeout=STREAM_IDLE_TIMEOUT,
+                        first_token_timeout=FIRST_TOKEN_TIMEOUT,
+                    )
+                    slot.started()
+
+                    # Closed from the request thread if the job is cancelled
+                    with storage.cancellations.track(job_id, llm_engine.closer(response)):
+                        async for part in response:
+                            # Stop if the lease expired and the chunk was handed to another worker
+                            if lease.lost:
+                                raise LeaseLostError(f"Lease on chunk {chunk['chunk_id']} was lost")
+                            if await cancel_requested():
+                                raise JobCancelledError(f"Job {job_id} was cancelled")
+                            delta = part.choices[0].delta.content if part.choices else None
+                            if delta:
+                                result_text += delta
+                                last_token_time = time.time()
+                                stream_buffer.append(
+                                    delta,
+                                    ai_progress="AI thinking...",
+                                    last_update=last_token_time,
+                                )
+                                # Rows are stored as soon as their line is complete
+                                if table_parser.feed(delta):
+                                    stream_buffer.append(rows=[row.__dict__ for row in table_parser.rows])
+                                await write_flushes()
+                        # A stream closed by a cancellation may just end early
+                        if await cancel_requested():
+                            raise JobCancelledError(f"Job {job_id} was cancelled")
+                break
+            except StreamStalledError as exc:
+                if attempt == STREAM_MAX_ATTEMPTS:
+                    raise
+                print(f"[WARNING] WR chunk {chunk['chunk_id']} of job {job_id} stalled "
+                      f"(attempt {attempt}/{STREAM_MAX_ATTEMPTS}), retrying: {exc}")
+                # The retry streams from scratch
+                stream_buffer.discard()
+                pending_flushes.clear()
+                streaming_length = 0
+                await llm_engine.offload(
+                    _reset_stream, job_id, chunk["chunk_id"], f"Retrying after stalled response ({exc})"
+                )
+        stream_buffer.flush()
+        await write_flushes()
+        rate_limiter.settle("openai", estimated_tokens, estimate_tokens(user_message + result_text))
+        if result_text.strip():
+            await llm_engine.offload(llm_cache.put, cache_id, {"text": result_text})
+
+        await llm_engine.offload(_complete_chunk, job_id, chunk["chunk_id"], result_text, limiter_wait)
+    except LeaseLostError as exc:
+        # The chunk now belongs to whichever worker re-enqueued it
+        print(f"[WARNING] Abandoning WR chunk {chunk['chunk_id']} of job {job_id}: {exc}")
+    except Exception as exc:
+        stream_buffer.flush()
+        await write_flushes()
+        await llm_engine.offload(_fail_chunk, job_id, chunk["chunk_id"], exc, limiter_wait)
+
+
+def slide_content(slide: Dict[str, Any]) -> List[List[str]]:
+    """The reviewed part of a WR slide (element ids are generated per upload)."""
+    return [[element.get("type", ""), element.get("text", "")] for element in slide.get("elements", [])]
+
+
+def carry_over_chunk(job_id: str, chunk: Dict[str, Any], rows: List[Dict[str, Any]]) -> None:
+    """Complete a chunk with the previous job's rows for its (unchanged) slides."""
+    now = time.time()
+    with storage_batch() as batch:
+        set_chunk_result(
+            job_id,
+            chunk["chunk_id"],
+            {
+                "chunk_id": chunk["chunk_id"],
+                "status": "completed",
+                "page_start": chunk["page_start"],
+                "page_end": chunk["page_end"],
+                "page_numbers": chunk["page_numbers"],
+                "word_count": chunk["word_count"],
+                "mode": chunk["mode"],
+                "start_time": now,
+                "completion_time": now,
+                "streaming_length": 0,
+                "ai_progress": "Unchanged since the previous version",
+                "result_text": "",
+                "rows": rows,
+                "carried_over": True,
+                "error": None,
+                "attempts": 0,
+                "last_update": now,
+            },
+            batch=batch,
         )
+        incr_job_counter(job_id, "chunks_sent", batch=batch)
+        incr_job_counter(job_id, "chunks_completed", batch=batch)
 
-        for part in response:
-            delta = part.choices[0].delta.content if part.choices else None
-            if delta:
-                result_text += delta
-                last_token_time = time.time()
-                update_chunk_result(
-                    job_id,
-                    chunk["chunk_id"],
-                    {
-                        "streaming_output": result_text,
-                        "ai_progress": "AI thinking...",
-                        "last_update": last_token_time,
-                    },
-                )
 
-        rows: List[ChunkResultRow] = []
-        cleaned = result_text.strip()
-        if cleaned.lower() == "no edits recommended.":
-            rows = []
-        else:
-            rows = parse_wr_table(result_text)
+def _reset_stream(job_id: str, chunk_id: str, progress: str) -> None:
+    with storage_batch() as batch:
+        reset_stream_output(job_id, chunk_id, batch=batch)
+        update_chunk_result(
+            job_id,
+            chunk_id,
+            {
+                "streaming_length": 0,
+                "stream_start_time": time.time(),
+                "rows": [],
+                "ai_progress": progress,
+                "last_update": time.time(),
+            },
+            batch=batch,
+        )
+
 
+def _replay_chunk(job_id: str, chunk_id: str, result_text: str) -> None:
+    """Complete a chunk with a cached response, streamed out in one piece."""
+    with storage_batch() as batch:
+        append_stream_output(job_id, chunk_id, result_text, batch=batch)
         update_chunk_result(
             job_id,
-            chunk["chunk_id"],
+            chunk_id,
+            {"streaming_length": len(result_text.encode("utf-8")), "last_update": time.time()},
+            batch=batch,
+        )
+    _complete_chunk(job_id, chunk_id, result_text, 0.0, cached=True)
+
+
+def _complete_chunk(job_id: str, chunk_id: str, result_text: str, limiter_wait: float,
+                    cached: bool = False) -> None:
+    rows: List[ChunkResultRow] = []
+    cleaned = result_text.strip()
+    if cleaned.lower() == "no edits recommended.":
+        rows = []
+    else:
+        rows = parse_wr_table(result_text)
+
+    with storage_batch() as batch:
+        update_chunk_result(
+            job_id,
+            chunk_id,
             {
                 "status": "completed",
                 "completion_time": time.time(),
                 "result_text": result_text,
                 "final_result_text": result_text,
                 "rows": [row.__dict__ for row in rows],
-                "ai_progress": "Completed",
+                "ai_progress": "Completed (cached)" if cached else "Completed",
+                "cache_hit": cached,
+                "limiter_wait": limiter_wait,
                 "last_update": time.time(),
             },
+            batch=batch,
         )
+        incr_job_counter(job_id, "chunks_completed", batch=batch)
+    update_thinking_progress(job_id)
+
+    attempt_merge(job_id)
+
 
-        job = get_job(job_id) or {}
-        completed_count = job.get("chunks_completed", 0) + 1
-        update_job(
+def _fail_chunk(job_id: str, chunk_id: str, exc: Exception, limiter_wait: float) -> None:
+    # Closing the stream of a cancelled job surfaces as a read error
+    if isinstance(exc, JobCancelledError) or storage.cancellations.is_cancelled(job_id):
+        print(f"[INFO] Stopped WR chunk {chunk_id} of cancelled job {job_id}")
+        update_chunk_result(
             job_id,
-            {"chunks_completed": completed_count, "last_update": time.time()},
+            chunk_id,
+            {
+                "status": "cancelled",
+                "completion_time": time.time(),
+                "ai_progress": "Cancelled",
+                "limiter_wait": limiter_wait,
+                "last_update": time.time(),
+            },
         )
-        update_thinking_progress(job_id)
-
-        _attempt_merge(job_id)
-    except Exception as exc:
+        return
+    with storage_batch() as batch:
         update_chunk_result(
             job_id,
-            chunk["chunk_id"],
+            chunk_id,
             {
                 "status": "failed",
                 "completion_time": time.time(),
                 "error": str(exc),
                 "ai_progress": f"Failed: {exc}",
+                "limiter_wait": limiter_wait,
                 "last_update": time.time(),
             },
+            batch=batch,
         )
-        job = get_job(job_id) or {}
-        update_job(
-            job_id,
-            {"chunks_failed": job.get("chunks_failed", 0) + 1, "last_update": time.time()},
-        )
+        incr_job_counter(job_id, "chunks_failed", batch=batch)
+    update_thinking_progress(job_id)
+
+
+def requeue_expired_chunk(job_id: str, chunk_id: str) -> None:
+    """Re-enqueue a chunk whose worker stopped renewing its lease."""
+    job = get_job(job_id)
+    if not job or job.get("status") in {"MERGING", "DONE", "ERROR", "CANCELLED"}:
+        return
+
+    chunk_meta = next((chunk for chunk in job.get("chunks", []) if chunk["chunk_id"] == chunk_id), None)
+    chunk_state = get_chunk_results(job_id).get(chunk_id, {})
+    if not chunk_meta or chunk_state.get("status") in {"completed", "failed"}:
+        return
+
+    recoveries = chunk_state.get("lease_recoveries", 0) + 1
+    if recoveries > LEASE_MAX_RECOVERIES:
+        now = time.time()
+        with storage_batch() as batch:
+            update_chunk_result(
+                job_id,
+                chunk_id,
+                {
+                    "status": "failed",
+                    "completion_time": now,
+                    "error": f"Worker lost {LEASE_MAX_RECOVERIES} times while processing this chunk.",
+                    "ai_progress": "Failed: worker lost",
+                    "last_update": now,
+                },
+                batch=batch,
+            )
+            incr_job_counter(job_id, "chunks_failed", batch=batch)
         update_thinking_progress(job_id)
+        return
+
+    print(f"[INFO] Re-enqueueing WR chunk {chunk_id} of job {job_id} (recovery {recoveries}/{LEASE_MAX_RECOVERIES})")
+    chunk_payload = dict(chunk_meta)
+    chunk_payload["attempts"] = chunk_state.get("attempts", 0)
+    chunk_payload["lease_recoveries"] = recoveries
+    thread_pool.submit_chunk(
+        job_id, chunk_id, process_chunk, job_id, chunk_payload, job.get("model", DEFAULT_MODEL)
+    )
+
+
+# Chunks are consumed from the work queue by this process (and any worker.py)
+thread_pool.register("wr_chunk", process_chunk)
+thread_pool.start()
+
+# Re-enqueue chunks whose worker died. Every process runs a watcher, but
+# only the one holding the namespace's watcher lock scans at a time. The
+# durable work queue redelivers the tasks of dead workers by itself, once
+# their leases have expired (see CHUNK_QUEUE_CLAIM_IDLE).
+if not thread_pool.durable:
+    storage.leases.watch(requeue_expired_chunk)
 
 
-def _attempt_merge(job_id: str) -> None:
+def attempt_merge(job_id: str) -> None:
     job = get_job(job_id)
     if not job:
         return
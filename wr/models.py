@@ -49,6 +49,8 @@ class ChunkState:
     start_time: float
     completion_time: Optional[float] = None
     streaming_output: str = ""
+    streaming_length: int = 0
+    stream_start_time: Optional[float] = None
     ai_progress: str = ""
     result_text: str = ""
     rows: List[ChunkResultRow] = field(default_factory=list)
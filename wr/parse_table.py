@@ -3,20 +3,19 @@
 from __future__ import annotations
 
 import re
-from typing import List
+from typing import List, Optional
+
+from table_stream import IncrementalTableParser, parse_table
 
 from .models import ChunkResultRow
 
 HEADER_RE = re.compile(r"\bpage\b", re.IGNORECASE)
 TABLE_LINE_RE = re.compile(r"^\|.*\|")
 SEPARATOR_RE = re.compile(r"^\s*\|?\s*-{2,}")
-THINK_TAG_RE = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
 
 
-def _clean_text(text: str) -> str:
-    cleaned = THINK_TAG_RE.sub("", text)
-    cleaned = cleaned.replace("Answer:", "").replace("answer:", "")
-    return cleaned.strip()
+def _clean_line(line: str) -> str:
+    return line.replace("Answer:", "").replace("answer:", "").strip()
 
 
 def _normalize_original(text: str) -> str:
@@ -40,42 +39,38 @@ def _smart_split(line: str) -> List[str]:
     return [first, middle, last]
 
 
-def parse_wr_table(text: str) -> List[ChunkResultRow]:
-    cleaned_text = _clean_text(text)
-    if not cleaned_text:
-        return []
+def _is_header(line: str) -> bool:
+    line = _clean_line(line)
+    return bool(HEADER_RE.search(line)) and "original" in line.lower() and "revised" in line.lower()
 
-    lines = [line.strip() for line in cleaned_text.splitlines() if line.strip()]
-    if not lines:
-        return []
 
-    header_index = -1
-    for idx, line in enumerate(lines):
-        if HEADER_RE.search(line) and "original" in line.lower() and "revised" in line.lower():
-            header_index = idx
-            break
-    if header_index == -1:
-        return []
+def _parse_row(line: str) -> Optional[ChunkResultRow]:
+    line = _clean_line(line)
+    if SEPARATOR_RE.match(line):
+        return None
+    if not TABLE_LINE_RE.match(line):
+        return None
+    columns = _smart_split(line)
+    if len(columns) < 3:
+        return None
+    try:
+        page = int(columns[0].strip())
+    except ValueError:
+        return None
+    original = columns[1].strip()
+    revised = columns[2].strip()
+    if not original or not revised:
+        return None
+    return ChunkResultRow(page=page, original=original, revised=revised)
+
+
+def parse_wr_table(text: str) -> List[ChunkResultRow]:
+    return parse_table(text, _is_header, _parse_row)
+
 
-    rows: List[ChunkResultRow] = []
-    for line in lines[header_index + 1 :]:
-        if SEPARATOR_RE.match(line):
-            continue
-        if not TABLE_LINE_RE.match(line):
-            continue
-        columns = _smart_split(line)
-        if len(columns) < 3:
-            continue
-        try:
-            page = int(columns[0].strip())
-        except ValueError:
-            continue
-        original = columns[1].strip()
-        revised = columns[2].strip()
-        if not original or not revised:
-            continue
-        rows.append(ChunkResultRow(page=page, original=original, revised=revised))
-    return rows
+def wr_table_parser() -> IncrementalTableParser:
+    """Incremental parser for a streamed WR response (see table_stream)."""
+    return IncrementalTableParser(_is_header, _parse_row)
 
 
 def merge_rows(rows: List[ChunkResultRow]) -> List[ChunkResultRow]:
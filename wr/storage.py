@@ -2,70 +2,94 @@
 
 from __future__ import annotations
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
-from job_storage import PersistentJobStorage, ZDThreadPoolManager
+from job_storage import StorageBatch, create_chunk_queue, create_job_storage
+from memory_store import BoundedTTLStore
 
 from .config import MAX_WORKERS
 
-storage = PersistentJobStorage(prefix="wr")
-thread_pool = ZDThreadPoolManager(max_workers=MAX_WORKERS, thread_name_prefix="wr_worker")
+storage = create_job_storage(prefix="wr")
+thread_pool = create_chunk_queue(storage, max_workers=MAX_WORKERS, thread_name_prefix="wr_worker")
 
-wr_jobs: Dict[str, Dict[str, Any]] = {}
-wr_results: Dict[str, Dict[str, Any]] = {}
+# Chunk state last written by this process: the merge base for partial chunk
+# updates from the worker running the chunk (its only writer). Reads go
+# through ``storage.cache``, which stays current across workers.
+wr_results = BoundedTTLStore("wr_results_mirror", ttl=storage.JOB_TTL)
+
+
+def storage_batch(transaction: bool = False) -> StorageBatch:
+    """Group WR storage writes into a single round-trip.
+
+    Pass the batch to the write helpers below; see PersistentJobStorage.batch.
+    """
+    return storage.batch(transaction=transaction)
 
 
 def create_job(job_id: str, job_data: Dict[str, Any]) -> None:
     storage.create_job(job_id, job_data)
-    wr_jobs[job_id] = job_data.copy()
 
 
 def get_job(job_id: str) -> Optional[Dict[str, Any]]:
-    job = wr_jobs.get(job_id)
-    if job:
-        return job
-    job = storage.get_job(job_id)
-    if job:
-        wr_jobs[job_id] = job
-    return job
+    return storage.cache.get_job(job_id)
+
 
+def update_job(job_id: str, updates: Dict[str, Any], batch: Optional[StorageBatch] = None) -> None:
+    (batch or storage).update_job(job_id, updates)
 
-def update_job(job_id: str, updates: Dict[str, Any]) -> None:
-    storage.update_job(job_id, updates)
-    if job_id in wr_jobs:
-        wr_jobs[job_id].update(updates)
 
+def incr_job_counter(job_id: str, field: str, amount: int = 1, batch: Optional[StorageBatch] = None):
+    """Adjust a job counter; inside a batch, returns a BatchResult set on exit."""
+    return (batch or storage).incr_job_counter(job_id, field, amount)
 
-def set_chunk_result(job_id: str, chunk_id: str, chunk_data: Dict[str, Any]) -> None:
-    if job_id not in wr_results:
-        wr_results[job_id] = {}
-    wr_results[job_id][chunk_id] = chunk_data.copy()
-    storage.set_chunk_result(job_id, chunk_id, chunk_data)
 
+def set_chunk_result(job_id: str, chunk_id: str, chunk_data: Dict[str, Any],
+                     batch: Optional[StorageBatch] = None) -> None:
+    wr_results.update_fields(job_id, {chunk_id: chunk_data.copy()}, create=True)
+    (batch or storage).set_chunk_result(job_id, chunk_id, chunk_data)
 
-def update_chunk_result(job_id: str, chunk_id: str, updates: Dict[str, Any]) -> None:
-    chunk = wr_results.setdefault(job_id, {}).setdefault(chunk_id, {})
+
+def update_chunk_result(job_id: str, chunk_id: str, updates: Dict[str, Any],
+                        batch: Optional[StorageBatch] = None) -> None:
+    chunk = wr_results.get(job_id, {}).get(chunk_id)
+    if chunk is None:
+        chunk = get_chunk_result(job_id, chunk_id) or {}
+    chunk = dict(chunk)
     chunk.update(updates)
-    storage.set_chunk_result(job_id, chunk_id, chunk)
+    wr_results.update_fields(job_id, {chunk_id: chunk}, create=True)
+    (batch or storage).set_chunk_result(job_id, chunk_id, chunk)
 
 
 def get_chunk_result(job_id: str, chunk_id: str) -> Optional[Dict[str, Any]]:
-    chunk = wr_results.get(job_id, {}).get(chunk_id)
-    if chunk:
-        return chunk
-    chunk = storage.get_chunk_result(job_id, chunk_id)
-    if chunk:
-        wr_results.setdefault(job_id, {})[chunk_id] = chunk
-    return chunk
+    return storage.cache.get_chunk_result(job_id, chunk_id)
 
 
 def get_chunk_results(job_id: str) -> Dict[str, Dict[str, Any]]:
-    if job_id not in wr_results:
-        wr_results[job_id] = storage.get_chunk_results(job_id)
-    return wr_results[job_id]
+    return storage.cache.get_chunk_results(job_id)
+
+
+def append_stream_output(job_id: str, chunk_id: str, text: str, batch: Optional[StorageBatch] = None):
+    return (batch or storage).append_stream_output(job_id, chunk_id, text)
+
+
+def reset_stream_output(job_id: str, chunk_id: str, batch: Optional[StorageBatch] = None) -> None:
+    (batch or storage).reset_stream_output(job_id, chunk_id)
+
+
+def get_stream_output(job_id: str, chunk_id: str, offset: int = 0, tail: Optional[int] = None) -> Tuple[str, int]:
+    return storage.get_stream_output(job_id, chunk_id, offset=offset, tail=tail)
+
+
+def with_stream_output(job_id: str, chunks: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Return copies of ``chunks`` with their full ``streaming_output`` attached."""
+    outputs = storage.get_stream_outputs(job_id, list(chunks.keys()))
+    return {
+        chunk_id: {**chunk, "streaming_output": outputs.get(chunk_id, "")}
+        for chunk_id, chunk in chunks.items()
+    }
 
 
 def cleanup_job(job_id: str) -> None:
     storage.cleanup_job(job_id)
-    wr_jobs.pop(job_id, None)
+    storage.cache.invalidate(job_id)
     wr_results.pop(job_id, None)